@@ -0,0 +1,157 @@
+# accounts.py
+import collections
+import concurrent.futures
+import contextvars
+import logging
+import os
+import threading
+import time
+import config
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# config values an entry of config.ACCOUNTS may override for its account.
+ACCOUNT_SETTINGS = ('TRADABLE_BALANCE_RATIO', 'MAX_OPEN_TRADES', 'LEVERAGE', 'MARGIN_TYPE')
+LATENCY_SAMPLES = 500 # Recent samples kept per latency metric
+FANOUT_BARRIER_TIMEOUT_SECONDS = 1.0
+
+def account_configs():
+    # [(name, api_key, api_secret, settings)]: the entries of config.ACCOUNTS, or the single account of
+    # config.BINANCE_API_KEY when it is not set.
+    entries = getattr(config, 'ACCOUNTS', None)
+    if not entries:
+        return [("main", config.BINANCE_API_KEY, config.BINANCE_API_SECRET, {})]
+    result = []
+    for i, entry in enumerate(entries):
+        name = entry.get('name') or f"account{i + 1}"
+        settings = {key: entry[key] for key in ACCOUNT_SETTINGS if key in entry}
+        result.append((name, entry['api_key'], entry['api_secret'], settings))
+    names = [name for name, _, _, _ in result]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Account names in config.ACCOUNTS must be unique: {names}")
+    return result
+
+def journal_path_for(path, account_name, multi_account):
+    # trade_journal.jsonl -> trade_journal.<account>.jsonl when several accounts share one process.
+    if not path or not multi_account:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{account_name}{ext}"
+
+# Rolling latency samples in milliseconds, per metric.
+class LatencyStats:
+    def __init__(self, max_samples=LATENCY_SAMPLES):
+        self._samples = collections.defaultdict(lambda: collections.deque(maxlen=max_samples))
+        self._lock = threading.Lock()
+
+    def record(self, metric, milliseconds):
+        with self._lock:
+            self._samples[metric].append(milliseconds)
+
+    def summary(self):
+        with self._lock:
+            samples = {metric: sorted(values) for metric, values in self._samples.items() if values}
+        return {metric: {'count': len(values), 'p50': round(values[len(values) // 2], 2),
+                         'p99': round(values[min(len(values) - 1, int(len(values) * 0.99))], 2), 'max': round(values[-1], 2)}
+                for metric, values in samples.items()}
+
+# Everything the bot keeps for one Binance account: its client, the trades it manages (keyed by
+# symbol, so (account, symbol) identifies a trade across accounts) and the services attached to them.
+class TradingAccount:
+    def __init__(self, name, futures_client, telegram_notifier):
+        self.name = name
+        self.futures_client = futures_client
+        self.telegram_notifier = telegram_notifier
+        self.active_bot_trades = {}
+        self.active_trades_lock = threading.Lock() # Shared by the webhook path, TSL thread and user-data stream
+        self.pending_trade_symbols = set() # Symbols whose signal is being executed right now (guarded by active_trades_lock)
+        self.initialized_symbols_settings = set() # Symbols where leverage/margin have been set this session
+        self.symbol_settings = None # Summary of the startup pre-warm of leverage/margin (symbol_settings.prewarm)
+        self.trade_journal = None
+        self.order_tracker = None
+        self.user_data_stream = None
+        self.tsl_scheduler = None
+        self.latency = LatencyStats()
+
+    def begin_signal(self, symbol):
+        with self.active_trades_lock:
+            self.pending_trade_symbols.add(symbol)
+
+    def end_signal(self, symbol):
+        with self.active_trades_lock:
+            self.pending_trade_symbols.discard(symbol)
+
+    def stats(self):
+        return {
+            "active_trades": len(self.active_bot_trades),
+            "latency_ms": self.latency.summary(),
+            "trade_journal": self.trade_journal.stats if self.trade_journal else None,
+            "rate_limiter": self.futures_client.rate_limiter.stats() if self.futures_client.rate_limiter else None,
+            "tsl_scheduler": self.tsl_scheduler.stats() if self.tsl_scheduler else None,
+            "symbol_settings": self.symbol_settings,
+            "transport": self.futures_client.transport.stats(),
+        }
+
+# Runs one signal on every account concurrently. All accounts first do their checks and sizing in
+# parallel (prepare); the entry orders of the accounts that want to trade are then released together
+# from threads already waiting on a barrier (place). The signal-to-order skew between accounts is
+# therefore thread wake-up time, not the difference between their balance/position lookups.
+class AccountFanout:
+    def __init__(self, accounts, prepare, place, max_workers=None):
+        # prepare(account, data, received_at) -> plan or None; place(account, plan).
+        self.accounts = accounts
+        self.prepare = prepare
+        self.place = place
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or 4 * len(accounts),
+                                                              thread_name_prefix="account-fanout")
+        self.skew = LatencyStats()
+
+    def run(self, data, received_at=None):
+        received_at = received_at or time.monotonic()
+        symbol = data['ticker']
+        for account in self.accounts:
+            account.begin_signal(symbol)
+        try:
+            # Each task runs in its own copy of this thread's context, so its spans join the signal's trace.
+            futures = [self.executor.submit(contextvars.copy_context().run, self._prepare, account, data, received_at)
+                       for account in self.accounts]
+            plans = [f.result() for f in futures]
+            ready = [(account, plan) for account, plan in zip(self.accounts, plans) if plan]
+            if not ready:
+                return
+            barrier = threading.Barrier(len(ready))
+            futures = [self.executor.submit(contextvars.copy_context().run, self._place, account, plan, barrier)
+                       for account, plan in ready]
+            sent_times = [t for t in (f.result() for f in futures) if t is not None]
+        finally:
+            for account in self.accounts:
+                account.end_signal(symbol)
+        if len(sent_times) > 1:
+            skew_ms = (max(sent_times) - min(sent_times)) * 1000
+            self.skew.record('order_skew', skew_ms)
+            logger.info(f"{symbol} signal sent to {len(sent_times)} accounts with {skew_ms:.2f} ms skew.")
+
+    def _prepare(self, account, data, received_at):
+        try:
+            with tracing.span('prepare', account=account.name):
+                return self.prepare(account, data, received_at)
+        except Exception as e:
+            logger.error(f"[{account.name}] Error preparing {data.get('signal_type')} signal for {data.get('ticker')}: {e}", exc_info=True)
+            return None
+
+    def _place(self, account, plan, barrier):
+        try:
+            barrier.wait(timeout=FANOUT_BARRIER_TIMEOUT_SECONDS)
+        except threading.BrokenBarrierError:
+            logger.warning(f"[{account.name}] Fan-out barrier timed out (executor saturated?), placing without it.")
+        sent_at = time.monotonic()
+        try:
+            with tracing.span('place', account=account.name):
+                self.place(account, plan)
+        except Exception as e:
+            logger.error(f"[{account.name}] Error placing trade for {plan.get('symbol')}: {e}", exc_info=True)
+        return sent_at
+
+    def stats(self):
+        return self.skew.summary()
@@ -0,0 +1,349 @@
+# backtester.py
+# Replays the MTF.txt signals over stored klines and simulates each trade with the same sizing, initial
+# stop-loss and trailing-stop rules the live bot applies (binance_client.calculate_position_size,
+# _stop_loss_order_args and trailing_stop_manager.manage_trailing_stops). Base bars (e.g. 1m) drive
+# fills and stops; the chart timeframe bars the alerts fire on are aggregated from them.
+import argparse
+import heapq
+import logging
+import time
+import numpy as np
+from mtf_indicator import compute_signals, resample, MINUTE_MS
+from symbol_specs import FAST_ROUNDING_LIMIT
+
+logger = logging.getLogger(__name__)
+
+# Defaults mirror the config.py settings of the same (upper-case) names.
+DEFAULT_PARAMS = {
+    'chart_interval': "15", # EXPECTED_WEBHOOK_INTERVAL
+    'entry_type': "LIMIT", # ORDER_TYPES['entry']
+    'limit_timeout_bars': 1, # Chart bars a LIMIT entry may rest before it counts as unfilled
+    'stop_loss': 0.02,
+    'trailing_stop': True,
+    'trailing_only_offset_is_reached': True,
+    'trailing_stop_positive': 0.01,
+    'trailing_stop_positive_offset': 0.02,
+    'leverage': 10,
+    'maintenance_margin_rate': 0.004, # Used for the isolated-margin liquidation price
+    'tradable_balance_ratio': 1.0,
+    'max_open_trades': 1,
+    'initial_balance': 1000.0,
+    'fee_rate': 0.0004, # Charged on entry and exit notional
+    'mtf_params': None, # MTF_PARAMS, see mtf_indicator.DEFAULT_PARAMS
+    'realtime_signals': True, # Signals as they fired live; False uses TradingView's repainted history
+}
+
+FIRST_SCAN_BARS = 256 # Bars scanned per trade before the window doubles
+
+def params_from_config(config):
+    # Backtest parameters taken from the bot's config module.
+    return {
+        'chart_interval': str(getattr(config, 'EXPECTED_WEBHOOK_INTERVAL', DEFAULT_PARAMS['chart_interval'])),
+        'entry_type': getattr(config, 'ORDER_TYPES', {}).get('entry', 'LIMIT').upper(),
+        'stop_loss': config.STOP_LOSS,
+        'trailing_stop': config.TRAILING_STOP,
+        'trailing_only_offset_is_reached': config.TRAILING_ONLY_OFFSET_IS_REACHED,
+        'trailing_stop_positive': config.TRAILING_STOP_POSITIVE,
+        'trailing_stop_positive_offset': config.TRAILING_STOP_POSITIVE_OFFSET,
+        'leverage': config.LEVERAGE,
+        'tradable_balance_ratio': config.TRADABLE_BALANCE_RATIO,
+        'max_open_trades': config.MAX_OPEN_TRADES,
+        'mtf_params': getattr(config, 'MTF_PARAMS', None),
+    }
+
+def price_floor(spec):
+    # Vectorised SymbolSpec.floor_price (identity without a tick size).
+    if not spec or not spec.tick_size:
+        return lambda prices: prices
+    scale = 10 ** spec.price_decimals
+    tick_units = round(spec.tick_size * scale)
+    def floor(prices):
+        prices = np.asarray(prices, dtype=float)
+        with np.errstate(invalid='ignore'): # +-inf (no candidate) stays +-inf
+            scaled = prices * scale
+            units = np.floor(np.round(scaled, 6))
+            floored = np.where(np.isfinite(units), units - units % tick_units, units) / scale
+        exact = np.isfinite(scaled) & (np.abs(scaled) >= FAST_ROUNDING_LIMIT) # Too large for the float path
+        if exact.any():
+            floored[exact] = [spec.floor_price(price) for price in prices[exact]]
+        return floored
+    return floor
+
+def _as_arrays(bars):
+    return {name: np.asarray(column, dtype=np.int64 if name == 'open_time' else float) for name, column in bars.items()}
+
+def symbol_signals(bars, p):
+    # Alerts for one symbol as (base bar index the alert fires at, 'long'/'short', alert close price).
+    # An alert fires when its chart bar closes, i.e. at the open of the first base bar after it; the
+    # unfinished last chart bar never fires.
+    chart = resample(bars, p['chart_interval'])
+    signals = compute_signals(chart, params=p['mtf_params'], realtime=p['realtime_signals'])
+    close_times = chart['open_time'] + int(p['chart_interval']) * MINUTE_MS
+    fire_index = np.searchsorted(bars['open_time'], close_times, side='left')
+    fires = fire_index < len(bars['open_time'])
+    events = []
+    for side, fired in (('long', signals['final_long']), ('short', signals['final_short'])):
+        for i in np.flatnonzero(fired & fires):
+            events.append((int(fire_index[i]), side, float(chart['close'][i])))
+    events.sort()
+    return events
+
+def _fill_entry(bars, index, side, price, p):
+    # (fill bar index, fill price) of the entry order sent at base bar `index`, or None if a LIMIT entry
+    # is not reached before it times out. A LIMIT fills at its price, or at the open if the bar gaps
+    # through it; a MARKET entry fills at the open.
+    if p['entry_type'] == 'MARKET':
+        return index, float(bars['open'][index])
+    deadline = bars['open_time'][index] + p['limit_timeout_bars'] * int(p['chart_interval']) * MINUTE_MS
+    end = int(np.searchsorted(bars['open_time'], deadline, side='left'))
+    if side == 'long':
+        touched = np.flatnonzero(bars['low'][index:end] <= price)
+    else:
+        touched = np.flatnonzero(bars['high'][index:end] >= price)
+    if not len(touched):
+        return None
+    fill = index + int(touched[0])
+    gap_price = bars['open'][fill]
+    return fill, float(min(price, gap_price) if side == 'long' else max(price, gap_price))
+
+def _scan_exit(bars, start, side, entry_price, stop_price, p, floor):
+    # Walks the position forward from its fill bar until the stop (or liquidation) is hit, in windows
+    # that double in size. Per window everything is vectorised: the trailing stop is evaluated on every
+    # bar close like one TSL cycle, ratcheted with a running max/min, and is live from the next bar on.
+    # Returns (exit index, exit price, reason, trailing activated).
+    is_long = side == 'long'
+    leverage, mmr = p['leverage'], p['maintenance_margin_rate']
+    liquidation = entry_price * (1 - 1 / leverage + mmr) if is_long else entry_price * (1 + 1 / leverage - mmr)
+    # As in manage_trailing_stops, the stop only trails once activated by the offset.
+    trailing = p['trailing_stop'] and p['trailing_only_offset_is_reached']
+    sl = stop_price
+    active = False
+    extreme = np.nan # Highest (long) / lowest (short) close since activation
+    n = len(bars['close'])
+    i, size = start, FIRST_SCAN_BARS
+    while i < n:
+        j = min(n, i + size)
+        close = bars['close'][i:j]
+        if trailing:
+            if active:
+                first = 0
+            else:
+                pnl_ratio = (close - entry_price) / entry_price if is_long else (entry_price - close) / entry_price
+                hits = np.flatnonzero(pnl_ratio > p['trailing_stop_positive_offset'])
+                first = int(hits[0]) if len(hits) else len(close)
+            tracked = close.copy()
+            if is_long:
+                tracked[:first] = -np.inf
+                extremes = np.maximum.accumulate(np.fmax(tracked, extreme) if active else tracked)
+                calculated = extremes * (1 - p['trailing_stop_positive'])
+                adjusted = floor(calculated)
+                with np.errstate(invalid='ignore'):
+                    candidates = np.where((calculated > entry_price) & (adjusted < close), adjusted, -np.inf)
+                stops = np.maximum.accumulate(np.maximum(candidates, sl))
+            else:
+                tracked[:first] = np.inf
+                extremes = np.minimum.accumulate(np.fmin(tracked, extreme) if active else tracked)
+                calculated = extremes * (1 + p['trailing_stop_positive'])
+                adjusted = floor(calculated)
+                with np.errstate(invalid='ignore'):
+                    candidates = np.where((calculated < entry_price) & (adjusted > close), adjusted, np.inf)
+                stops = np.minimum.accumulate(np.minimum(candidates, sl))
+        else:
+            first, extremes, stops = len(close), None, np.full(len(close), sl)
+
+        live_stops = np.concatenate(([sl], stops[:-1])) # The stop set on a bar's close is live from the next bar
+        if is_long:
+            levels = np.maximum(live_stops, liquidation)
+            hit = np.flatnonzero(bars['low'][i:j] <= levels)
+        else:
+            levels = np.minimum(live_stops, liquidation)
+            hit = np.flatnonzero(bars['high'][i:j] >= levels)
+        if len(hit):
+            k = int(hit[0])
+            level = levels[k]
+            bar_open = bars['open'][i + k]
+            exit_price = float(min(bar_open, level) if is_long else max(bar_open, level))
+            if level != live_stops[k]:
+                reason = 'liquidation'
+            elif live_stops[k] != stop_price:
+                reason = 'trailing_stop'
+            else:
+                reason = 'stop_loss'
+            return i + k, exit_price, reason, active or first <= k
+
+        sl = float(stops[-1])
+        if first < len(close):
+            active = True
+            extreme = float(extremes[-1])
+        i, size = j, size * 2
+    return n - 1, float(bars['close'][-1]), 'end_of_data', active
+
+def _open_trade(symbol, bars, signal_index, side, price, balance, p, spec):
+    # Sizes, fills and runs one trade to its exit. Returns (trade dict, None) or (None, skip reason).
+    amount_per_trade_usdt = balance * p['tradable_balance_ratio'] / p['max_open_trades']
+    if p['entry_type'] == 'MARKET':
+        price = float(bars['open'][signal_index]) # Live sizing uses the mark price
+    quantity = amount_per_trade_usdt / price
+    if spec and spec.step_size:
+        quantity = spec.floor_quantity(quantity)
+    if quantity <= 0 or (spec and spec.min_notional and quantity * price < spec.min_notional):
+        return None, 'min_notional'
+
+    fill = _fill_entry(bars, signal_index, side, price, p)
+    if not fill:
+        return None, 'not_filled'
+    fill_index, entry_price = fill
+    floor = price_floor(spec)
+    # The initial stop is computed from the order's target price, like create_stop_loss_order.
+    sl_price = price * (1 - p['stop_loss']) if side == 'long' else price * (1 + p['stop_loss'])
+    sl_price = float(floor(np.array([sl_price]))[0])
+
+    exit_index, exit_price, reason, trailing_activated = _scan_exit(bars, fill_index, side, entry_price, sl_price, p, floor)
+    direction = 1 if side == 'long' else -1
+    fees = p['fee_rate'] * quantity * (entry_price + exit_price)
+    if reason == 'liquidation':
+        pnl = -quantity * entry_price / p['leverage'] - p['fee_rate'] * quantity * entry_price # The whole margin is lost
+    else:
+        pnl = direction * quantity * (exit_price - entry_price) - fees
+    return {
+        'symbol': symbol,
+        'side': side,
+        'signal_time': int(bars['open_time'][signal_index]),
+        'entry_time': int(bars['open_time'][fill_index]),
+        'entry_price': entry_price,
+        'quantity': quantity,
+        'initial_sl_price': sl_price,
+        'exit_time': int(bars['open_time'][exit_index]),
+        'exit_price': exit_price,
+        'exit_reason': reason,
+        'trailing_activated': bool(trailing_activated),
+        'pnl': pnl,
+        'return_pct': pnl / (quantity * entry_price) * 100,
+    }, None
+
+def run_backtest(data, params=None, specs=None, signals=None):
+    # data: {symbol: base bars} (dict of 'open_time', 'open', 'high', 'low', 'close', 'volume' arrays, e.g.
+    # from KlineStore.read). specs: optional {symbol: SymbolSpec} for tick/step rounding and min notional.
+    # signals: optional {symbol: symbol_signals(...)} computed earlier with the same chart and MTF params.
+    # Signals of all symbols are replayed in time order against one balance: a signal is ignored while
+    # its symbol has an open trade or MAX_OPEN_TRADES trades are open, and trades are sized from the
+    # balance realised so far, as the live bot does.
+    p = dict(DEFAULT_PARAMS, **(params or {}))
+    p['entry_type'] = p['entry_type'].upper()
+    specs = specs or {}
+    started_at = time.monotonic()
+
+    data = {symbol: _as_arrays(bars) for symbol, bars in data.items() if len(bars['open_time'])}
+    events = []
+    for symbol, bars in data.items():
+        symbol_events = signals[symbol] if signals is not None else symbol_signals(bars, p)
+        events.extend((int(bars['open_time'][index]), symbol, index, side, price) for index, side, price in symbol_events)
+    events.sort(key=lambda e: (e[0], e[1]))
+
+    balance = p['initial_balance']
+    curve_times, curve_balances = [], [balance]
+    trades = []
+    open_trades = [] # Heap of (exit_time, sequence, trade)
+    busy_until = {} # symbol -> exit_time of its open trade
+    skipped = {'symbol_busy': 0, 'max_open_trades': 0, 'min_notional': 0, 'not_filled': 0}
+
+    def settle(until):
+        nonlocal balance
+        while open_trades and open_trades[0][0] < until:
+            exit_time, _, trade = heapq.heappop(open_trades)
+            balance += trade['pnl']
+            curve_times.append(exit_time)
+            curve_balances.append(balance)
+
+    for signal_time, symbol, index, side, price in events:
+        settle(signal_time)
+        if busy_until.get(symbol, -1) >= signal_time:
+            skipped['symbol_busy'] += 1
+            continue
+        if len(open_trades) >= p['max_open_trades']:
+            skipped['max_open_trades'] += 1
+            continue
+        trade, skip_reason = _open_trade(symbol, data[symbol], index, side, price, balance, p, specs.get(symbol))
+        if not trade:
+            skipped[skip_reason] += 1
+            continue
+        trades.append(trade)
+        busy_until[symbol] = trade['exit_time']
+        heapq.heappush(open_trades, (trade['exit_time'], len(trades), trade))
+    settle(float('inf'))
+
+    result = summarize(trades, p['initial_balance'], curve_times, curve_balances)
+    result['skipped_signals'] = skipped
+    result['signals'] = len(events)
+    result['elapsed_seconds'] = time.monotonic() - started_at
+    return result
+
+def summarize(trades, initial_balance, curve_times, curve_balances):
+    balances = np.asarray(curve_balances, dtype=float)
+    peaks = np.maximum.accumulate(balances)
+    drawdowns = peaks - balances
+    worst = int(np.argmax(drawdowns))
+    pnls = np.array([t['pnl'] for t in trades], dtype=float)
+    gross_profit = float(pnls[pnls > 0].sum())
+    gross_loss = float(-pnls[pnls < 0].sum())
+    exit_reasons = {}
+    for t in trades:
+        exit_reasons[t['exit_reason']] = exit_reasons.get(t['exit_reason'], 0) + 1
+    return {
+        'trades': trades,
+        'num_trades': len(trades),
+        'initial_balance': initial_balance,
+        'final_balance': float(balances[-1]),
+        'total_pnl': float(balances[-1] - initial_balance),
+        'return_pct': float((balances[-1] / initial_balance - 1) * 100),
+        'max_drawdown': float(drawdowns[worst]),
+        'max_drawdown_pct': float(drawdowns[worst] / peaks[worst] * 100) if peaks[worst] > 0 else 0.0,
+        'win_rate': float((pnls > 0).mean()) if len(pnls) else 0.0,
+        'profit_factor': gross_profit / gross_loss if gross_loss else None,
+        'exit_reasons': exit_reasons,
+        'equity_curve': {'time': np.asarray(curve_times, dtype=np.int64), 'balance': balances[1:]},
+    }
+
+def fetch_specs(base_url, symbols):
+    # {symbol: SymbolSpec} from the public exchangeInfo endpoint; empty (no rounding) if it is unreachable.
+    import httpx
+    from symbol_specs import SymbolSpecIndex
+    try:
+        index = SymbolSpecIndex(httpx.get(f"{base_url.rstrip('/')}/fapi/v1/exchangeInfo", timeout=30.0).json())
+    except Exception as e:
+        logger.warning(f"Could not load exchange filters, prices and quantities are not rounded: {e}")
+        return {}
+    return {symbol: index.get(symbol) for symbol in symbols if index.get(symbol)}
+
+def format_report(result):
+    profit_factor = f"{result['profit_factor']:.2f}" if result['profit_factor'] is not None else "n/a"
+    return (f"Trades: {result['num_trades']} (signals: {result.get('signals', 'n/a')}, skipped: {result.get('skipped_signals', {})})\n"
+            f"P&L: {result['total_pnl']:.2f} USDT ({result['return_pct']:.2f}%), final balance {result['final_balance']:.2f}\n"
+            f"Max drawdown: {result['max_drawdown']:.2f} USDT ({result['max_drawdown_pct']:.2f}%)\n"
+            f"Win rate: {result['win_rate'] * 100:.1f}%, profit factor: {profit_factor}\n"
+            f"Exits: {result['exit_reasons']}")
+
+if __name__ == "__main__":
+    import config
+    from kline_store import KlineStore
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Backtest the MTF signals with the bot's stop-loss and trailing-stop rules.")
+    parser.add_argument('--interval', default='1m', help="Base kline interval in the store")
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--symbols', nargs='*', default=None, help="Defaults to config.TRADING_PAIRS")
+    parser.add_argument('--balance', type=float, default=DEFAULT_PARAMS['initial_balance'])
+    parser.add_argument('--trades', action='store_true', help="Print every trade")
+    args = parser.parse_args()
+
+    store = KlineStore(getattr(config, 'KLINE_STORE_DIR', 'klines'))
+    start = int(time.time() * 1000) - args.days * 86_400_000
+    symbols = args.symbols or config.TRADING_PAIRS
+    data = {symbol: store.read(symbol, args.interval, start=start) for symbol in symbols}
+    specs = fetch_specs(getattr(config, 'KLINE_BASE_URL', 'https://fapi.binance.com'), symbols)
+
+    result = run_backtest(data, dict(params_from_config(config), initial_balance=args.balance), specs)
+    if args.trades:
+        for t in result['trades']:
+            print(t)
+    print(format_report(result))
+    print(f"Backtest of {sum(len(b['open_time']) for b in data.values())} bars took {result['elapsed_seconds']:.2f}s.")
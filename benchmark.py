@@ -0,0 +1,270 @@
+# benchmark.py
+# Offline latency benchmarks of the order path: main.py's webhook handling and TSL cycle run against
+# fake_exchange.FakeExchange with an injected per-request latency. Results are compared with a stored
+# baseline (benchmark_baseline.json) and the run exits with status 1 when a metric regressed by more
+# than the tolerance.
+#
+#   python benchmark.py                    # run and compare
+#   python benchmark.py --update-baseline  # run and store the results as the new baseline
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import threading
+import time
+import config
+
+logger = logging.getLogger(__name__)
+
+BASELINE_PATH = 'benchmark_baseline.json'
+SYMBOLS = [f"BENCH{i:02d}USDT" for i in range(1, 21)]
+MIN_REGRESSION_MS = 1.0 # Millisecond metrics must also be worse by at least this much to count as a regression
+WAIT_TIMEOUT_SECONDS = 10.0
+
+# config values set for the benchmark whatever config.py says: one account, no journal, no Telegram and
+# no websocket streams, so every measured call is a REST call to the fake exchange.
+BENCH_CONFIG = {
+    'ACCOUNTS': None,
+    'TELEGRAM_BOT_TOKEN': '',
+    'TRADE_JOURNAL_PATH': '',
+    'USE_USER_DATA_STREAM': False,
+    'USE_MARK_PRICE_STREAM': False,
+    'EXCHANGE_INFO_REFRESH_SECONDS': 0,
+    'TRADING_PAIRS': SYMBOLS,
+    'EXPECTED_WEBHOOK_INTERVAL': '15',
+    'MAX_OPEN_TRADES': 50,
+    'TRADABLE_BALANCE_RATIO': 0.9,
+    'LEVERAGE': 10,
+    'MARGIN_TYPE': 'ISOLATED',
+    'ORDER_TYPES': {'entry': 'LIMIT', 'stoploss': 'MARKET'},
+    'STOP_LOSS': 0.02,
+    'TRAILING_STOP': True,
+    'TRAILING_STOP_POSITIVE_OFFSET': 0.01,
+    'TRAILING_STOP_POSITIVE': 0.005,
+    'TRAILING_ONLY_OFFSET_IS_REACHED': True,
+    'WEBHOOK_WORKERS': 4,
+    'WEBHOOK_DEDUP_TTL_SECONDS': 0, # Every run re-sends the same alert for the same bar
+    'DEFER_SL_UNTIL_FILL': False,
+    'BATCH_ENTRY_ORDERS': False,
+    'TRACE_LOG_PATH': '',
+    'SYMBOL_SETTINGS_PATH': '',
+}
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+def _percentile(samples, share):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+def _wait(predicate, timeout=WAIT_TIMEOUT_SECONDS):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError("Benchmark step did not complete in time.")
+        time.sleep(0.0005)
+
+class Bench:
+    def __init__(self, exchange, main):
+        self.exchange = exchange
+        self.main = main
+        self.account = main.accounts[0]
+        self.http = main.app.test_client()
+
+    def alert(self, symbol, signal_type='long'):
+        return {'signal_type': signal_type, 'ticker': symbol, 'close_price': str(self.exchange.prices[symbol]),
+                'exchange': 'BINANCE', 'interval': config.EXPECTED_WEBHOOK_INTERVAL}
+
+    def post(self, alert, http=None):
+        response = (http or self.http).post('/webhook', data=json.dumps(alert), content_type='application/json')
+        if response.status_code not in (200, 202):
+            raise RuntimeError(f"Webhook rejected: {response.status_code} {response.get_json()}")
+
+    def flatten(self):
+        # Waits for in-flight signals, then leaves no positions, orders or managed trades.
+        if self.main.signal_dispatcher:
+            _wait(lambda: not any(self.main.signal_dispatcher.queue_depths()))
+        _wait(lambda: not self.account.pending_trade_symbols)
+        self.exchange.reset()
+        with self.account.active_trades_lock:
+            self.account.active_bot_trades.clear()
+        self.account.futures_client.position_book.invalidate()
+
+    def is_protected(self, symbol):
+        trade = self.account.active_bot_trades.get(symbol)
+        return bool(trade and trade.get('sl_order_id'))
+
+    def stop_events(self, symbol=None):
+        return lambda e: e['type'] == 'STOP_MARKET' and (symbol is None or e['symbol'] == symbol)
+
+    def webhook_latency(self, runs, batch=False):
+        # Time from the webhook POST to the entry order, and to its stop-loss, arriving at the exchange.
+        config.BATCH_ENTRY_ORDERS = batch
+        to_entry, to_protected = [], []
+        for i in range(runs):
+            symbol = SYMBOLS[i % len(SYMBOLS)]
+            self.flatten()
+            started_at = time.monotonic()
+            self.post(self.alert(symbol))
+            entry = self.exchange.wait_for_orders(lambda e: e['symbol'] == symbol and e['type'] == 'LIMIT', timeout=WAIT_TIMEOUT_SECONDS)
+            stop = self.exchange.wait_for_orders(self.stop_events(symbol), timeout=WAIT_TIMEOUT_SECONDS)
+            if not entry or not stop:
+                raise TimeoutError(f"No entry/stop-loss order arrived for {symbol}.")
+            _wait(lambda: self.is_protected(symbol))
+            to_entry.append(entry[0]['received_at'] - started_at)
+            to_protected.append(stop[0]['received_at'] - started_at)
+        config.BATCH_ENTRY_ORDERS = False
+        return to_entry, to_protected
+
+    def open_all(self, symbols):
+        # Sends one alert per symbol from concurrent threads; returns seconds until every trade is protected.
+        barrier = threading.Barrier(len(symbols) + 1)
+        def send(symbol):
+            http = self.main.app.test_client()
+            barrier.wait()
+            self.post(self.alert(symbol), http)
+        threads = [threading.Thread(target=send, args=(symbol,)) for symbol in symbols]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        started_at = time.monotonic()
+        stops = self.exchange.wait_for_orders(self.stop_events(), count=len(symbols), timeout=WAIT_TIMEOUT_SECONDS)
+        for thread in threads:
+            thread.join()
+        if len(stops) < len(symbols):
+            raise TimeoutError(f"Only {len(stops)} of {len(symbols)} burst trades got a stop-loss.")
+        _wait(lambda: all(self.is_protected(symbol) for symbol in symbols))
+        return max(e['received_at'] for e in stops) - started_at
+
+    def burst(self, size, repeats):
+        durations = []
+        for _ in range(repeats):
+            self.flatten()
+            durations.append(self.open_all(SYMBOLS[:size]))
+        return durations
+
+    def tsl_cycle(self, size, cycles):
+        # One manage_trailing_stops cycle over `size` open trades: with no stop to move, and with every
+        # stop moving (prices rise 0.4% between cycles).
+        from trailing_stop_manager import manage_trailing_stops
+        symbols = SYMBOLS[:size]
+        self.flatten()
+        self.open_all(symbols)
+        account = self.account
+        def cycle():
+            account.futures_client.position_book.invalidate() # The live loop's interval is longer than the book's TTL
+            started_at = time.monotonic()
+            manage_trailing_stops(account.futures_client, account.telegram_notifier, account.active_bot_trades,
+                                  account.active_trades_lock)
+            return time.monotonic() - started_at
+        idle = [cycle() for _ in range(cycles)]
+        for symbol in symbols:
+            self.exchange.set_price(symbol, self.exchange.prices[symbol] * 1.015) # Past the activation offset
+        cycle()
+        updating = []
+        for _ in range(cycles):
+            for symbol in symbols:
+                self.exchange.set_price(symbol, self.exchange.prices[symbol] * 1.004)
+            stops_before = len(self.exchange.orders_matching(self.stop_events()))
+            updating.append(cycle())
+            moved = len(self.exchange.orders_matching(self.stop_events())) - stops_before
+            if moved < size:
+                logger.warning(f"Only {moved} of {size} stops moved in a TSL update cycle.")
+        return idle, updating
+
+def run(runs=50, latency_ms=5.0, jitter_ms=0.0, burst_size=20, tsl_cycles=10):
+    from fake_exchange import FakeExchange
+    # Limits high enough that the bot's rate governor never holds a call back: throttling is not what is measured here.
+    exchange = FakeExchange(symbols=SYMBOLS, balance=100000.0, latency_ms=latency_ms, jitter_ms=jitter_ms, seed=1,
+                            weight_per_minute=1_000_000, orders_per_10s=100_000, orders_per_minute=1_000_000)
+    url = exchange.start()
+    for name, value in dict(BENCH_CONFIG, BINANCE_FUTURES_URL=url).items():
+        setattr(config, name, value)
+    import main
+    main.initialize_services()
+    bench = Bench(exchange, main)
+    try:
+        bench.webhook_latency(len(SYMBOLS)) # Warm-up: the first signal per symbol also sets leverage and margin type
+        to_entry, to_protected = bench.webhook_latency(runs)
+        _, batch_to_protected = bench.webhook_latency(runs, batch=True)
+        burst = bench.burst(burst_size, repeats=5)
+        tsl_idle, tsl_updating = bench.tsl_cycle(burst_size, tsl_cycles)
+        bench.flatten()
+    finally:
+        exchange.stop()
+    burst_median = statistics.median(burst)
+    return {
+        'webhook_to_entry_ms_p50': _ms(_percentile(to_entry, 0.5)),
+        'webhook_to_entry_ms_p95': _ms(_percentile(to_entry, 0.95)),
+        'webhook_to_protected_ms_p50': _ms(_percentile(to_protected, 0.5)),
+        'webhook_to_protected_ms_p95': _ms(_percentile(to_protected, 0.95)),
+        'batch_webhook_to_protected_ms_p50': _ms(_percentile(batch_to_protected, 0.5)),
+        'batch_webhook_to_protected_ms_p95': _ms(_percentile(batch_to_protected, 0.95)),
+        'burst_all_protected_ms': _ms(burst_median),
+        'burst_signals_per_second': round(burst_size / burst_median, 2),
+        'tsl_cycle_idle_ms_p50': _ms(_percentile(tsl_idle, 0.5)),
+        'tsl_cycle_update_ms_p50': _ms(_percentile(tsl_updating, 0.5)),
+    }
+
+def compare(results, baseline, tolerance):
+    # [(metric, baseline value, value, relative change, regressed)]; throughput metrics are better when higher.
+    rows = []
+    for metric, value in results.items():
+        base = baseline.get(metric)
+        if base is None:
+            rows.append((metric, None, value, None, False))
+            continue
+        change = (value - base) / base if base else 0.0
+        if metric.endswith('per_second'):
+            regressed = value < base / (1 + tolerance)
+        else:
+            regressed = change > tolerance and value - base > MIN_REGRESSION_MS
+        rows.append((metric, base, value, change, regressed))
+    return rows
+
+def format_comparison(rows):
+    lines = [f"{'metric':<36} {'baseline':>10} {'current':>10} {'change':>8}"]
+    for metric, base, value, change, regressed in rows:
+        base_str = f"{base:>10.2f}" if base is not None else f"{'-':>10}"
+        change_str = f"{change * 100:>+7.1f}%" if change is not None else f"{'new':>8}"
+        lines.append(f"{metric:<36} {base_str} {value:>10.2f} {change_str}{'  REGRESSION' if regressed else ''}")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline order-path latency benchmarks against the fake exchange.")
+    parser.add_argument('--runs', type=int, default=50, help="Signals per webhook latency scenario")
+    parser.add_argument('--latency-ms', type=float, default=5.0, help="Injected latency of every fake exchange request")
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--burst', type=int, default=20, help=f"Concurrent alerts per burst (max {len(SYMBOLS)})")
+    parser.add_argument('--tsl-cycles', type=int, default=10)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=0.3, help="Allowed relative slowdown before a metric counts as a regression")
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s') # Before main.py configures INFO
+
+    settings = {'runs': args.runs, 'latency_ms': args.latency_ms, 'jitter_ms': args.jitter_ms, 'burst': args.burst,
+                'tsl_cycles': args.tsl_cycles}
+    results = run(args.runs, args.latency_ms, args.jitter_ms, min(args.burst, len(SYMBOLS)), args.tsl_cycles)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'settings': settings, 'python': platform.python_version(), 'machine': platform.machine(),
+                       'metrics': results}, f, indent=2)
+            f.write("\n")
+        print(format_comparison(compare(results, {}, args.tolerance)))
+        print(f"Baseline written to {args.baseline}.")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('settings') != settings:
+            print(f"Warning: baseline was recorded with {baseline.get('settings')}, this run used {settings}.")
+        rows = compare(results, baseline.get('metrics', {}), args.tolerance)
+        print(format_comparison(rows))
+        if any(regressed for *_, regressed in rows):
+            raise SystemExit(1)
+    else:
+        print(format_comparison(compare(results, {}, args.tolerance)))
+        print(f"No baseline at {args.baseline}; run with --update-baseline to store one.")
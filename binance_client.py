@@ -1,28 +1,130 @@
 # binance_client.py
+import concurrent.futures
 import config
+import contextvars
 import logging
 from binance.client import Client
 from binance.exceptions import BinanceAPIException, BinanceOrderException
 from binance.enums import *
 import time
+import threading
 from decimal import Decimal, ROUND_DOWN, ROUND_UP
+from symbol_specs import SymbolSpecIndex
+from rate_limiter import RateLimiter
+from binance_transport import BinanceTransport
+import metrics
+import tracing
 
 logger = logging.getLogger(__name__)
 
+REST_LATENCY = metrics.histogram('binance_rest_request_duration_seconds', "Futures REST round trip by endpoint (excluding rate limiter waits).", ('method', 'endpoint'))
+REST_ERRORS = metrics.counter('binance_rest_errors_total', "Futures REST calls that failed, by endpoint and Binance error code.", ('endpoint', 'code'))
+
+# Conditional orders (STOP_MARKET, ...) are algo orders on Binance: python-binance sends them to
+# POST /algoOrder, and they are listed by GET /openAlgoOrders and cancelled by DELETE /algoOrder, all by
+# algoId. The bot keeps one order shape: an algo order is returned with its algoId as orderId and the
+# classic field names, and stops are always cancelled through BinanceFuturesClient.cancel_stop_order.
+def _order_from_algo(algo_order):
+    return dict(algo_order, orderId=algo_order['algoId'], type=algo_order.get('orderType'), origType=algo_order.get('orderType'),
+                stopPrice=algo_order.get('triggerPrice'), status=algo_order.get('algoStatus'), origQty=algo_order.get('quantity'))
+
+# Single-flight TTL cache around one bulk REST call. Concurrent callers that find the value stale
+# wait for the one refresh in progress instead of issuing their own request.
+class _BulkSnapshot:
+    def __init__(self, fetch, ttl_seconds):
+        self.fetch = fetch
+        self.ttl_seconds = ttl_seconds
+        self._refresh_lock = threading.Lock()
+        self._value = None
+        self._fetched_at = 0.0
+        self._fetched_generation = -1
+        self._generation = 0 # Bumped by invalidate(); a snapshot fetched before that is stale
+
+    def _is_fresh(self):
+        return (self._value is not None and self._fetched_generation == self._generation
+                and time.monotonic() - self._fetched_at < self.ttl_seconds)
+
+    def get(self):
+        if self._is_fresh():
+            return self._value
+        with self._refresh_lock:
+            if self._is_fresh(): # Another thread refreshed while we waited
+                return self._value
+            generation = self._generation
+            value = self.fetch()
+            self._value, self._fetched_at, self._fetched_generation = value, time.monotonic(), generation
+            return value
+
+    def invalidate(self):
+        self._generation += 1
+
+# Shared view of all positions and open orders, each refreshed with one bulk request and reused by
+# the webhook path and the TSL thread for config.POSITION_BOOK_TTL_SECONDS.
+class PositionBook:
+    def __init__(self, client, timestamp_fn, ttl_seconds=2.0):
+        self.client = client
+        self.timestamp_fn = timestamp_fn
+        self._positions = _BulkSnapshot(self._fetch_positions, ttl_seconds)
+        self._open_orders = _BulkSnapshot(self._fetch_open_orders, ttl_seconds)
+
+    def _fetch_positions(self):
+        positions = self.client.futures_position_information(timestamp=self.timestamp_fn())
+        return {p['symbol']: p for p in positions if float(p['positionAmt']) != 0}
+
+    def _fetch_open_orders(self):
+        orders_by_symbol = {}
+        orders = self.client.futures_get_open_orders(timestamp=self.timestamp_fn())
+        algo_orders = self.client.futures_get_open_orders(conditional=True, timestamp=self.timestamp_fn()) # Stops
+        for order in orders + [_order_from_algo(o) for o in algo_orders]:
+            orders_by_symbol.setdefault(order['symbol'], []).append(order)
+        return orders_by_symbol
+
+    def open_positions(self):
+        # {symbol: position} for every non-zero position. Raises on API errors.
+        return self._positions.get()
+
+    def open_orders(self):
+        # {symbol: [order, ...]} for every open order. Raises on API errors.
+        return self._open_orders.get()
+
+    def invalidate(self, positions=True, orders=True):
+        # Called after anything that changes positions or orders, so the next read refetches.
+        if positions:
+            self._positions.invalidate()
+        if orders:
+            self._open_orders.invalidate()
+
 # Forward declaration for type hinting if Python < 3.9
 # from typing import TYPE_CHECKING
 # if TYPE_CHECKING:
 #     from telegram_bot import TelegramNotifier
 
 class BinanceFuturesClient:
-    def __init__(self, api_key, api_secret, telegram_notifier_instance): # Added telegram_notifier_instance
-        self.client = Client(api_key, api_secret)
+    def __init__(self, api_key, api_secret, telegram_notifier_instance, settings=None): # Added telegram_notifier_instance
+        self.client = Client(api_key, api_secret, ping=False) # The spot ping is not needed: futures_time below checks connectivity
         self.telegram_notifier = telegram_notifier_instance # Store it
-        self.client.FUTURES_URL = 'https://fapi.binance.com' # Ensure we are using futures
+        self.settings = settings or {} # Per-account overrides of config values (multi-account mode)
+        self.client.FUTURES_URL = getattr(config, 'BINANCE_FUTURES_URL', 'https://fapi.binance.com') + '/fapi' # python-binance appends /v1/<path>
+        self.client.REQUEST_RECVWINDOW = getattr(config, 'RECV_WINDOW_MS', 5000) # Sent with every signed request
+        self.transport = BinanceTransport(self.client, pool_size=getattr(config, 'HTTP_POOL_SIZE', 20),
+                                          warm_connections=getattr(config, 'KEEPALIVE_CONNECTIONS', 2),
+                                          interval_seconds=getattr(config, 'KEEPALIVE_INTERVAL_SECONDS', 15))
+        self.transport.install()
+        self._instrument_requests() # Before the rate limiter wraps the same method, so its waits are not timed
+        self.rate_limiter = None
+        if getattr(config, 'RATE_LIMIT_GOVERNOR', True):
+            self.rate_limiter = RateLimiter(reserve_ratio=getattr(config, 'RATE_LIMIT_RESERVE', 0.2))
+            self.rate_limiter.install(self.client)
         logger.info("Binance Futures Client initialized.")
-        self.server_time_offset = self._get_server_time_offset()
+        self.transport.sync() # Sets client.timestamp_offset, which python-binance adds to signed timestamps
         self.exchange_info = self.client.futures_exchange_info()
+        if self.rate_limiter:
+            self.rate_limiter.configure(self.exchange_info)
+        self.symbol_specs = SymbolSpecIndex(self.exchange_info)
+        self.position_book = PositionBook(self.client, self._get_timestamp, ttl_seconds=getattr(config, 'POSITION_BOOK_TTL_SECONDS', 2.0))
+        self._leg_executor = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="order-legs")
 
+    @tracing.traced()
     def set_leverage(self, symbol, leverage):
         try:
             logger.info(f"Setting leverage for {symbol} to {leverage}x")
@@ -45,6 +147,7 @@ class BinanceFuturesClient:
             self.telegram_notifier.notify_error(f"Leverage Error: {symbol}", f"Generic error setting leverage to {leverage}x.")
             return False
 
+    @tracing.traced()
     def set_margin_type(self, symbol, margin_type):
         # margin_type should be "ISOLATED" or "CROSSED"
         try:
@@ -72,26 +175,67 @@ class BinanceFuturesClient:
             self.telegram_notifier.notify_error(f"Margin Type Error: {symbol}", f"Generic error setting margin type to {margin_type}.")
             return False
 
-    def _get_server_time_offset(self):
-        try:
-            server_time = self.client.futures_time()['serverTime']
-            local_time = int(time.time() * 1000)
-            offset = server_time - local_time
-            logger.info(f"Server time offset: {offset} ms")
-            return offset
-        except Exception as e:
-            logger.error(f"Error getting server time: {e}")
-            return 0
+    def get_symbol_configs(self):
+        # {symbol: (leverage, margin type)} for every symbol, from one symbolConfig request. Raises on API errors.
+        configs = self.client.futures_symbol_config(timestamp=self._get_timestamp())
+        return {c['symbol']: (int(c['leverage']), c['marginType'].upper()) for c in configs}
+
+    def _instrument_requests(self):
+        # Times every futures REST call (metrics and a span in the current trace) and counts failures by
+        # error code ("network" for transport errors).
+        request_futures_api = self.client._request_futures_api
+        def timed(method, path, signed=False, version=1, **kwargs):
+            started_at = time.perf_counter()
+            try:
+                return request_futures_api(method, path, signed, version, **kwargs)
+            except BinanceAPIException as e:
+                REST_ERRORS.inc(path, str(e.code))
+                if e.code == -1021: # Timestamp outside recvWindow: the clock offset is stale
+                    self.transport.resync()
+                raise
+            except Exception:
+                REST_ERRORS.inc(path, "network")
+                raise
+            finally:
+                elapsed = time.perf_counter() - started_at
+                REST_LATENCY.observe(elapsed, method.upper(), path)
+                tracing.record_span(f"{method.upper()} {path}", elapsed)
+        self.client._request_futures_api = timed
+
+    def setting(self, name):
+        # config.<name>, unless this account overrides it.
+        return self.settings[name] if name in self.settings else getattr(config, name)
+
+    @property
+    def server_time_offset(self):
+        # Milliseconds added to local time for signed requests, kept current by self.transport.
+        return self.client.timestamp_offset
 
     def _get_timestamp(self):
-        return int(time.time() * 1000 + self.server_time_offset)
+        return int(time.time() * 1000 + self.client.timestamp_offset)
 
     def get_symbol_info(self, symbol):
-        for s_info in self.exchange_info['symbols']:
-            if s_info['symbol'] == symbol:
-                return s_info
-        logger.warning(f"Symbol info not found for {symbol}")
-        return None
+        s_info = self.symbol_specs.get_symbol_info(symbol)
+        if not s_info:
+            logger.warning(f"Symbol info not found for {symbol}")
+        return s_info
+
+    def get_symbol_spec(self, symbol):
+        spec = self.symbol_specs.get(symbol)
+        if not spec:
+            logger.warning(f"Symbol spec not found for {symbol}")
+        return spec
+
+    def start_keepalive(self):
+        # Keeps pooled connections to fapi warm and the clock offset current in the background.
+        self.transport.start()
+
+    def start_exchange_info_refresh(self, interval_seconds):
+        def fetch_exchange_info():
+            exchange_info = self.client.futures_exchange_info()
+            self.exchange_info = exchange_info
+            return exchange_info
+        self.symbol_specs.start_background_refresh(fetch_exchange_info, interval_seconds)
 
     def _adjust_quantity_to_step(self, quantity, step_size):
         return (Decimal(str(quantity)).quantize(Decimal(str(step_size)), rounding=ROUND_DOWN))
@@ -99,6 +243,7 @@ class BinanceFuturesClient:
     def _adjust_price_to_tick(self, price, tick_size):
         return (Decimal(str(price)).quantize(Decimal(str(tick_size)), rounding=ROUND_DOWN)) # Or ROUND_NEAREST
 
+    @tracing.traced()
     def get_usdt_balance(self):
         try:
             balances = self.client.futures_account_balance(timestamp=self._get_timestamp())
@@ -113,10 +258,10 @@ class BinanceFuturesClient:
             logger.error(f"Error getting USDT balance: {e}")
         return 0.0
 
+    @tracing.traced()
     def get_open_positions_count(self):
         try:
-            positions = self.client.futures_position_information(timestamp=self._get_timestamp())
-            open_positions = [p for p in positions if float(p['positionAmt']) != 0]
+            open_positions = self.position_book.open_positions()
             logger.info(f"Found {len(open_positions)} open positions.")
             return len(open_positions)
         except BinanceAPIException as e:
@@ -125,59 +270,70 @@ class BinanceFuturesClient:
             logger.error(f"Error getting open positions: {e}")
         return 0 # Or raise exception
 
+    @tracing.traced()
+    def get_open_position_symbols(self):
+        # Symbols with a non-zero position, from the shared position book. Empty on errors, like the count above.
+        try:
+            return set(self.position_book.open_positions())
+        except BinanceAPIException as e:
+            logger.error(f"Binance API Exception getting positions: {e}")
+        except Exception as e:
+            logger.error(f"Error getting open positions: {e}")
+        return set()
+
+    def get_mark_prices(self):
+        # One request for every symbol's mark price (premiumIndex without a symbol), as {symbol: float}.
+        try:
+            mark_prices = self.client.futures_mark_price()
+            return {p['symbol']: float(p['markPrice']) for p in mark_prices}
+        except BinanceAPIException as e:
+            logger.error(f"Binance API Exception getting mark prices: {e}")
+        except Exception as e:
+            logger.error(f"Error getting mark prices: {e}")
+        return None
+
+    @tracing.traced()
     def calculate_position_size(self, symbol, usdt_balance, entry_price):
         if entry_price <= 0:
             logger.error("Entry price must be positive to calculate position size.")
             return None
 
-        tradable_balance = usdt_balance * config.TRADABLE_BALANCE_RATIO
-        amount_per_trade_usdt = tradable_balance / config.MAX_OPEN_TRADES
+        tradable_balance = usdt_balance * self.setting('TRADABLE_BALANCE_RATIO')
+        amount_per_trade_usdt = tradable_balance / self.setting('MAX_OPEN_TRADES')
 
         quantity = amount_per_trade_usdt / entry_price
 
-        symbol_info = self.get_symbol_info(symbol)
-        if not symbol_info:
+        spec = self.get_symbol_spec(symbol)
+        if not spec:
             logger.error(f"Cannot calculate position size, symbol info not found for {symbol}")
             return None
 
-        quantity_precision = None
-        lot_size_filter = next((f for f in symbol_info['filters'] if f['filterType'] == 'LOT_SIZE'), None)
-        if lot_size_filter:
-            quantity_precision = lot_size_filter['stepSize']
-
-        if quantity_precision:
-            adjusted_quantity = self._adjust_quantity_to_step(quantity, quantity_precision)
-            logger.info(f"Calculated position size for {symbol}: {quantity}, adjusted to: {adjusted_quantity} (step: {quantity_precision})")
+        if spec.step_size:
+            adjusted_quantity = spec.floor_quantity(quantity)
+            logger.info(f"Calculated position size for {symbol}: {quantity}, adjusted to: {adjusted_quantity} (step: {spec.step_size})")
 
             # Check minNotional
-            min_notional_filter = next((f for f in symbol_info['filters'] if f['filterType'] == 'MIN_NOTIONAL'), None)
-            if min_notional_filter:
-                min_notional = float(min_notional_filter['notional'])
-                if float(adjusted_quantity) * entry_price < min_notional:
-                    logger.warning(f"Calculated notional ({float(adjusted_quantity) * entry_price}) for {symbol} is less than minNotional ({min_notional}). Cannot place order.")
+            if spec.min_notional:
+                if adjusted_quantity * entry_price < spec.min_notional:
+                    logger.warning(f"Calculated notional ({adjusted_quantity * entry_price}) for {symbol} is less than minNotional ({spec.min_notional}). Cannot place order.")
                     return None # Or adjust to meet minNotional if desired and possible
-            return float(adjusted_quantity)
+            return adjusted_quantity
         else:
             logger.warning(f"Could not determine quantity precision for {symbol}. Using unadjusted quantity: {quantity}")
             return quantity
 
 
-    def place_futures_order(self, symbol, side, quantity, price=None, stop_price=None, order_type=None):
-        symbol_info = self.get_symbol_info(symbol)
-        if not symbol_info:
+    def build_order_params(self, symbol, side, quantity, price=None, stop_price=None, order_type=None, reduce_only=False):
+        # Order parameters rounded to the symbol's filters, without timestamp. None if invalid.
+        spec = self.get_symbol_spec(symbol)
+        if not spec:
             logger.error(f"Cannot place order, symbol info not found for {symbol}")
             return None
 
-        price_precision = None
-        tick_size_filter = next((f for f in symbol_info['filters'] if f['filterType'] == 'PRICE_FILTER'), None)
-        if tick_size_filter:
-            price_precision = tick_size_filter['tickSize']
-
         params = {
             'symbol': symbol,
             'side': side, # 'BUY' or 'SELL'
-            'quantity': quantity,
-            'timestamp': self._get_timestamp()
+            'quantity': spec.format_quantity(quantity),
         }
 
         if order_type:
@@ -189,25 +345,29 @@ class BinanceFuturesClient:
             if not price:
                 logger.error("Price is required for LIMIT order.")
                 return None
-            if price_precision:
-                params['price'] = self._adjust_price_to_tick(price, price_precision)
-            else:
-                params['price'] = price
+            params['price'] = spec.format_price(price)
             params['timeInForce'] = TIME_IN_FORCE_GTC # Good Till Cancelled
 
         if params['type'] in [FUTURE_ORDER_TYPE_STOP_MARKET, FUTURE_ORDER_TYPE_TAKE_PROFIT_MARKET]:
             if not stop_price:
                 logger.error("Stop price is required for STOP_MARKET or TAKE_PROFIT_MARKET orders.")
                 return None
-            if price_precision:
-                 params['stopPrice'] = self._adjust_price_to_tick(stop_price, price_precision)
-            else:
-                params['stopPrice'] = stop_price
-            params['reduceOnly'] = False # For initial SL it's not reduceOnly. For TP it might be.
+            params['stopPrice'] = spec.format_price(stop_price)
+            params['reduceOnly'] = reduce_only # Initial SL is not reduceOnly (the entry may not be filled yet). TSL replacements are.
 
         # For STOP or TAKE_PROFIT orders (non-market), price is also needed.
         # FUTURE_ORDER_TYPE_STOP, FUTURE_ORDER_TYPE_TAKE_PROFIT
+        return params
+
+    def place_futures_order(self, symbol, side, quantity, price=None, stop_price=None, order_type=None, reduce_only=False):
+        params = self.build_order_params(symbol, side, quantity, price=price, stop_price=stop_price, order_type=order_type, reduce_only=reduce_only)
+        if not params:
+            return None
+        params['timestamp'] = self._get_timestamp()
+        return self._submit_order(params)
 
+    def _submit_order(self, params):
+        # Sends built order parameters (timestamp included). Returns the order, or None on failure.
         logger.info(f"Placing order with params: {params}")
         try:
             # Ensure leverage is set if needed (usually per symbol, once)
@@ -216,6 +376,10 @@ class BinanceFuturesClient:
             # self.client.futures_change_margin_type(symbol=symbol, marginType='ISOLATED', timestamp=self._get_timestamp())
 
             order = self.client.futures_create_order(**params)
+            # Resting stop orders change the order list only; anything that can fill right away may move positions.
+            self.position_book.invalidate(positions=params['type'] in (FUTURE_ORDER_TYPE_LIMIT, FUTURE_ORDER_TYPE_MARKET))
+            if 'algoId' in order:
+                order = _order_from_algo(order)
             logger.info(f"Order placed successfully: {order}")
             return order
         except BinanceAPIException as e:
@@ -227,20 +391,30 @@ class BinanceFuturesClient:
             logger.error(f"Generic error placing order: {e} - Params: {params}")
         return None
 
-    def create_entry_order(self, symbol, signal_type, entry_price, quantity):
+    @tracing.traced()
+    def cancel_stop_order(self, symbol, order_id):
+        # Cancels a stop placed by this client (order_id is its algoId). Raises BinanceAPIException like
+        # futures_cancel_order; -2011 means the stop is already gone.
+        response = self.client.futures_cancel_order(symbol=symbol, algoId=order_id, timestamp=self._get_timestamp())
+        self.position_book.invalidate(positions=False)
+        return response
+
+    def _entry_order_args(self, signal_type, entry_price):
+        # (side, place_futures_order kwargs) for the configured entry order type, or (None, None).
         side = SIDE_BUY if signal_type == 'long' else SIDE_SELL
         order_type = config.ORDER_TYPES.get('entry', 'LIMIT').upper() # Default to LIMIT
 
         if order_type == 'LIMIT':
-            return self.place_futures_order(symbol, side, quantity, price=entry_price, order_type=FUTURE_ORDER_TYPE_LIMIT)
+            return side, {'price': entry_price, 'order_type': FUTURE_ORDER_TYPE_LIMIT}
         elif order_type == 'MARKET':
             # Market order doesn't use entry_price directly for placement, but useful for SL calc
-            return self.place_futures_order(symbol, side, quantity, order_type=FUTURE_ORDER_TYPE_MARKET)
+            return side, {'order_type': FUTURE_ORDER_TYPE_MARKET}
         else:
             logger.error(f"Unsupported entry order type: {order_type}")
-            return None
+            return None, None
 
-    def create_stop_loss_order(self, symbol, signal_type, entry_price, quantity_for_sl):
+    def _stop_loss_order_args(self, signal_type, entry_price):
+        # (side, place_futures_order kwargs) for the initial stop-loss, or (None, None).
         sl_pct = config.STOP_LOSS
 
         if signal_type == 'long':
@@ -266,20 +440,68 @@ class BinanceFuturesClient:
 
         if not binance_stop_order_type:
             logger.error(f"Unsupported stoploss order type: {stop_order_type_str}")
+            return None, None
+
+        # For STOP_MARKET, the 'price' param is not used. 'stopPrice' is the trigger.
+        return side, {'stop_price': stop_price, 'order_type': binance_stop_order_type}
+
+    @tracing.traced()
+    def create_entry_order(self, symbol, signal_type, entry_price, quantity):
+        side, order_args = self._entry_order_args(signal_type, entry_price)
+        if not side:
+            return None
+        return self.place_futures_order(symbol, side, quantity, **order_args)
+
+    @tracing.traced()
+    def create_stop_loss_order(self, symbol, signal_type, entry_price, quantity_for_sl):
+        side, order_args = self._stop_loss_order_args(signal_type, entry_price)
+        if not side:
             return None
 
-        logger.info(f"Creating SL for {symbol}: side={side}, stop_price={stop_price}, entry_price={entry_price}, quantity={quantity_for_sl}")
+        logger.info(f"Creating SL for {symbol}: side={side}, stop_price={order_args['stop_price']}, entry_price={entry_price}, quantity={quantity_for_sl}")
 
-        # For STOP_MARKET, the 'price' param is not used. 'stopPrice' is the trigger.
-        sl_order = self.place_futures_order(symbol, side, quantity_for_sl,
-                                            stop_price=stop_price,
-                                            order_type=binance_stop_order_type)
+        sl_order = self.place_futures_order(symbol, side, quantity_for_sl, **order_args)
         if sl_order:
             logger.info(f"Stop loss order for {symbol} placed: {sl_order}")
         else:
             logger.error(f"Failed to place stop loss order for {symbol}")
         return sl_order
 
+    @tracing.traced()
+    def create_entry_with_stop_loss(self, symbol, signal_type, entry_price, quantity):
+        # Submits the entry and its protective stop at the same time, so the position is never waiting on a
+        # second round trip for its SL. The stop is a conditional order, which Binance only takes on the algo
+        # order endpoint (batchOrders rejects it), so the legs go out as two parallel requests: the stop from
+        # a worker thread, the entry from this one. Returns (entry_order, sl_order); a leg that failed is None.
+        entry_side, entry_args = self._entry_order_args(signal_type, entry_price)
+        sl_side, sl_args = self._stop_loss_order_args(signal_type, entry_price)
+        if not entry_side or not sl_side:
+            return None, None
+        entry_params = self.build_order_params(symbol, entry_side, quantity, **entry_args)
+        sl_params = self.build_order_params(symbol, sl_side, quantity, **sl_args)
+        if not entry_params or not sl_params:
+            return None, None
+
+        logger.info(f"Placing entry + SL for {symbol} in parallel: {entry_params} / {sl_params}")
+        context = contextvars.copy_context() # The stop's request stays in this signal's trace
+        sl_future = self._leg_executor.submit(context.run, self._submit_order, dict(sl_params, timestamp=self._get_timestamp()))
+        entry_order = self._submit_order(dict(entry_params, timestamp=self._get_timestamp()))
+        sl_order = sl_future.result()
+        if (entry_order is None) != (sl_order is None):
+            self.telegram_notifier.notify_error(f"Entry + SL Partial Failure: {symbol}",
+                                                f"Entry: {'OK' if entry_order else 'FAILED'}, SL: {'OK' if sl_order else 'FAILED'}. See the log for the error.")
+
+        if entry_order is None and sl_order is not None:
+            # A stop without its entry must not stay on the book (it is not reduce-only).
+            logger.warning(f"Entry failed but SL {sl_order['orderId']} for {symbol} was placed. Cancelling orphan SL.")
+            try:
+                self.cancel_stop_order(symbol, sl_order['orderId'])
+                sl_order = None
+            except Exception as e:
+                logger.error(f"Failed to cancel orphan SL {sl_order['orderId']} for {symbol}: {e}")
+                self.telegram_notifier.notify_error(f"Orphan SL: {symbol}", f"Entry failed but SL {sl_order['orderId']} could not be cancelled. Manual check needed.")
+        return entry_order, sl_order
+
     def close_position_market(self, symbol, position_amt_str):
         position_amt = float(position_amt_str)
         if position_amt == 0:
@@ -292,13 +514,13 @@ class BinanceFuturesClient:
         logger.info(f"Attempting to close {quantity} of {symbol} with a MARKET order (side: {side})")
         return self.place_futures_order(symbol, side, quantity, order_type=FUTURE_ORDER_TYPE_MARKET)
 
+    @tracing.traced()
     def get_open_position_for_symbol(self, symbol):
         try:
-            positions = self.client.futures_position_information(symbol=symbol, timestamp=self._get_timestamp())
-            for p in positions:
-                if p['symbol'] == symbol and float(p['positionAmt']) != 0:
-                    logger.info(f"Found open position for {symbol}: {p}")
-                    return p
+            p = self.position_book.open_positions().get(symbol)
+            if p:
+                logger.info(f"Found open position for {symbol}: {p}")
+                return p
             logger.info(f"No open position found for {symbol}")
             return None
         except BinanceAPIException as e:
@@ -307,6 +529,15 @@ class BinanceFuturesClient:
             logger.error(f"Error getting position for {symbol}: {e}")
         return None
 
+    def get_open_orders_for_symbol(self, symbol):
+        try:
+            return self.position_book.open_orders().get(symbol, [])
+        except BinanceAPIException as e:
+            logger.error(f"Binance API Exception getting open orders for {symbol}: {e}")
+        except Exception as e:
+            logger.error(f"Error getting open orders for {symbol}: {e}")
+        return None
+
 # Example usage (for testing this module directly)
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
@@ -0,0 +1,149 @@
+# binance_transport.py
+import concurrent.futures
+import logging
+import socket
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOCK_OFFSET = metrics.gauge('binance_clock_offset_ms', "Binance server time minus local time, from the lowest-RTT recent sample.")
+KEEPALIVE_PINGS = metrics.counter('binance_keepalive_pings_total', "Background time requests that keep connections warm and sample the clock offset, by result.", ('result',))
+
+# Kernel keep-alive probes on pooled sockets, so a connection dropped by a middlebox while idle is noticed
+# (and replaced by urllib3) instead of hanging the next order. Options missing on this platform are skipped.
+KEEPALIVE_SOCKET_OPTIONS = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)] + [
+    (socket.IPPROTO_TCP, getattr(socket, name), value)
+    for name, value in (('TCP_KEEPIDLE', 30), ('TCP_KEEPINTVL', 10), ('TCP_KEEPCNT', 3)) if hasattr(socket, name)
+]
+
+class _KeepAliveAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = HTTPConnection.default_socket_options + KEEPALIVE_SOCKET_OPTIONS # Defaults include TCP_NODELAY
+        super().init_poolmanager(*args, **kwargs)
+
+# Connection and clock upkeep for one python-binance Client:
+# - its requests session gets a connection pool as large as the bot's concurrency (the default of 10
+#   discards connections, and later pays a TCP+TLS handshake, once more threads call at the same time)
+#   with TCP keep-alive probes;
+# - a background thread sends `warm_connections` concurrent GET /fapi/v1/time requests every
+#   `interval_seconds`, which keeps that many pooled connections open through quiet periods and checks
+#   that fapi answers;
+# - every answer is also a clock sample. The offset is taken NTP-style from the lowest-RTT sample of the
+#   last `window` (offset = server time - local midpoint of the request, uncertainty RTT/2) and written to
+#   client.timestamp_offset, which python-binance adds to every signed request's timestamp.
+# resync() takes a fresh burst of samples right away, e.g. after a -1021 (timestamp outside recvWindow).
+class BinanceTransport:
+    def __init__(self, client, pool_size=20, warm_connections=2, interval_seconds=15.0, window=8, burst=5):
+        self.client = client
+        self.pool_size = pool_size
+        self.warm_connections = max(1, warm_connections)
+        self.interval_seconds = interval_seconds
+        self.burst = burst
+        self._samples = [] # (rtt_ms, offset_ms), most recent last
+        self._window = window
+        self._lock = threading.Lock()
+        self._resync = threading.Event()
+        self._thread = None
+        self._executor = None
+        self._stats = {'pings': 0, 'failures': 0, 'consecutive_failures': 0, 'resyncs': 0, 'last_ok_at': None}
+
+    def install(self):
+        adapter = _KeepAliveAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+        self.client.session.mount('https://', adapter)
+        self.client.session.mount('http://', adapter)
+
+    def _sample(self):
+        started_at = time.time()
+        try:
+            server_time = self.client.futures_time()['serverTime']
+        except Exception as e:
+            KEEPALIVE_PINGS.inc('error')
+            with self._lock:
+                self._stats['pings'] += 1
+                self._stats['failures'] += 1
+                self._stats['consecutive_failures'] += 1
+                failures = self._stats['consecutive_failures']
+            if failures in (1, 5) or failures % 20 == 0:
+                logger.warning(f"Binance keep-alive ping failed ({failures} in a row): {e}")
+            return None
+        finished_at = time.time()
+        sample = ((finished_at - started_at) * 1000, server_time - (started_at + finished_at) * 500)
+        KEEPALIVE_PINGS.inc('ok')
+        with self._lock:
+            self._stats['pings'] += 1
+            self._stats['consecutive_failures'] = 0
+            self._stats['last_ok_at'] = finished_at
+            self._samples = (self._samples + [sample])[-self._window:]
+        return sample
+
+    def _apply(self):
+        with self._lock:
+            if not self._samples:
+                return None
+            rtt_ms, offset_ms = min(self._samples)
+        self.client.timestamp_offset = round(offset_ms)
+        CLOCK_OFFSET.set(round(offset_ms, 1))
+        return offset_ms, rtt_ms
+
+    def sync(self):
+        # Replaces the sample window with a burst of sequential samples. Returns the offset in ms (0 if no
+        # sample succeeded).
+        with self._lock:
+            self._samples = []
+        for _ in range(self.burst):
+            self._sample()
+        result = self._apply()
+        if result is None:
+            logger.error("Could not sample Binance server time; timestamps use the local clock.")
+            return 0
+        offset_ms, rtt_ms = result
+        logger.info(f"Server time offset: {offset_ms:.1f} ms (±{rtt_ms / 2:.1f} ms)")
+        return round(offset_ms)
+
+    def resync(self):
+        # Immediate fresh sync on the background thread, or on a one-off thread if start() was not called.
+        if self._thread:
+            self._resync.set()
+        elif not self._resync.is_set():
+            self._resync.set()
+            threading.Thread(target=self._one_off_sync, name="binance-clock-resync", daemon=True).start()
+
+    def _one_off_sync(self):
+        try:
+            self.sync()
+        finally:
+            self._resync.clear()
+
+    def start(self):
+        if self._thread:
+            return
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.warm_connections, thread_name_prefix="binance-keepalive")
+        self._thread = threading.Thread(target=self._run, name="binance-transport", daemon=True)
+        self._thread.start()
+        logger.info(f"Binance keep-alive started: {self.warm_connections} connection(s) pinged every {self.interval_seconds}s.")
+
+    def _run(self):
+        while True:
+            if self._resync.wait(self.interval_seconds):
+                self._resync.clear()
+                with self._lock:
+                    self._stats['resyncs'] += 1
+                self.sync()
+                continue
+            for future in [self._executor.submit(self._sample) for _ in range(self.warm_connections)]:
+                future.result()
+            self._apply()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            best = min(self._samples) if self._samples else None
+        stats['clock_offset_ms'] = round(best[1], 1) if best else None
+        stats['clock_uncertainty_ms'] = round(best[0] / 2, 1) if best else None
+        last_ok_at = stats.pop('last_ok_at')
+        stats['last_ok_age_seconds'] = round(time.time() - last_ok_at, 1) if last_ok_at else None
+        return stats
@@ -0,0 +1,537 @@
+# fake_exchange.py
+# In-process stand-in for the USD-M futures REST API: the endpoints BinanceFuturesClient, PositionBook
+# and kline_loader call, backed by a small in-memory matching model (one account, one mark price per
+# symbol). Latency and API errors can be injected, so the order path can be measured and exercised
+# offline. Signatures and API keys are not checked.
+import http.server
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+import urllib.parse
+from rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# symbol -> (mark price, tickSize, stepSize); other symbols get DEFAULT_SYMBOL.
+SYMBOLS = {
+    'BTCUSDT': (65000.0, '0.10', '0.001'),
+    'ETHUSDT': (3500.0, '0.01', '0.001'),
+    'SOLUSDT': (150.0, '0.0100', '1'),
+    'BNBUSDT': (600.0, '0.010', '0.01'),
+    'XRPUSDT': (0.6, '0.0001', '0.1'),
+}
+DEFAULT_SYMBOL = (100.0, '0.0100', '0.01')
+MIN_NOTIONAL = '5'
+# Conditional order types. Binance only accepts them on POST /algoOrder (the order endpoints answer -4120);
+# they get an algoId from their own ID sequence and are listed by GET /openAlgoOrders, not /openOrders.
+CONDITIONAL_ORDER_TYPES = ('STOP', 'STOP_MARKET', 'TAKE_PROFIT', 'TAKE_PROFIT_MARKET', 'TRAILING_STOP_MARKET')
+
+INTERVAL_MS = {'1m': 60_000, '3m': 180_000, '5m': 300_000, '15m': 900_000, '30m': 1_800_000, '1h': 3_600_000,
+               '2h': 7_200_000, '4h': 14_400_000, '6h': 21_600_000, '8h': 28_800_000, '12h': 43_200_000, '1d': 86_400_000}
+
+class FakeExchangeError(Exception):
+    def __init__(self, code, msg, status=400):
+        super().__init__(msg)
+        self.code = code
+        self.msg = msg
+        self.status = status
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep-alive, like the real API
+    disable_nagle_algorithm = True # Headers and body are separate writes; avoids the 40ms delayed-ACK stall per response
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self, method):
+        received_at = time.monotonic()
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            params.update(urllib.parse.parse_qsl(self.rfile.read(length).decode()))
+        status, body, headers = self.server.exchange.handle(method, url.path, params, received_at)
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+# The exchange. Resting LIMIT orders fill, and STOP_MARKET / TAKE_PROFIT_MARKET algo orders trigger (as a
+# MARKET order), when set_price() moves the mark price through them; marketable LIMIT and MARKET orders
+# fill at once at the mark price.
+class FakeExchange:
+    def __init__(self, symbols=None, prices=None, balance=10000.0, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0,
+                 seed=None, weight_per_minute=2400, orders_per_10s=300, orders_per_minute=1200, host='127.0.0.1', port=0):
+        self.balance = balance
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate # Share of requests answered with -1001, on any endpoint
+        self._random = random.Random(seed)
+        self.specs = {symbol: SYMBOLS.get(symbol, DEFAULT_SYMBOL) for symbol in (symbols or SYMBOLS)}
+        self.prices = {symbol: spec[0] for symbol, spec in self.specs.items()}
+        self.prices.update(prices or {})
+        self.positions = {} # symbol -> [signed amount, entry price]
+        self.orders = {} # orderId -> order dict (open orders only)
+        self.algo_orders = {} # algoId -> algo order dict (untriggered conditional orders only)
+        self.leverage = {}
+        self.margin_type = {}
+        self.kline_halts = [] # (first, last) open times (ms) with no klines, like a trading halt
+        self.order_events = [] # One dict per accepted order: received_at (time.monotonic()), symbol, type, side, orderId or algoId
+        self.user_events = [] # ORDER_TRADE_UPDATE / ACCOUNT_UPDATE / ALGO_UPDATE messages the user-data stream would push, in order
+        self.request_counts = {}
+        self._failures = [] # [path, code, msg, status, remaining]
+        self._order_ids = itertools.count(1)
+        self._algo_ids = itertools.count(2_000_001) # A separate range, so an algoId sent as an orderId is unknown
+        self._lock = threading.RLock()
+        self._weight = RateLimiter(weight_per_minute, orders_per_10s, orders_per_minute) # Only its windows are used, to fill the usage headers
+        self._server = http.server.ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.exchange = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name="fake-exchange")
+        self._thread.start()
+        logger.info(f"Fake futures exchange listening on {self.url}")
+        return self.url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    # --- Test controls ---
+
+    def fail_next(self, path, code=-1001, msg="Internal error; unable to process your request. Please try again.", status=400, count=1):
+        # The next `count` requests to `path` (e.g. "order", "batchOrders") are answered with this error.
+        with self._lock:
+            self._failures.append([path, code, msg, status, count])
+
+    def set_price(self, symbol, price):
+        with self._lock:
+            self.prices[symbol] = price
+            for order in list(self.orders.values()):
+                if order['symbol'] == symbol:
+                    self._try_fill(order)
+            for algo_order in list(self.algo_orders.values()):
+                if algo_order['symbol'] == symbol:
+                    self._try_trigger(algo_order)
+
+    def reset(self):
+        # Flat book: no positions and no open orders. Leverage/margin settings are kept.
+        with self._lock:
+            self.positions.clear()
+            self.orders.clear()
+            self.algo_orders.clear()
+            self.order_events.clear()
+            self.user_events.clear()
+
+    def orders_matching(self, predicate):
+        with self._lock:
+            return [event for event in self.order_events if predicate(event)]
+
+    def wait_for_orders(self, predicate, count=1, timeout=10.0):
+        # Waits until `count` order events match `predicate` and returns them (fewer on timeout).
+        deadline = time.monotonic() + timeout
+        while True:
+            matches = self.orders_matching(predicate)
+            if len(matches) >= count or time.monotonic() > deadline:
+                return matches
+            time.sleep(0.0005)
+
+    # --- Request handling ---
+
+    def handle(self, method, path, params, received_at):
+        # (HTTP status, JSON body, extra headers) for one request.
+        endpoint = path.rsplit('/', 1)[-1]
+        delay = self.latency_ms + (self._random.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0)
+        if delay:
+            time.sleep(delay / 1000)
+        now = time.time()
+        weight, orders_10s, orders_1m, _ = RateLimiter.classify(method, endpoint, params)
+        with self._lock:
+            self.request_counts[(method, endpoint)] = self.request_counts.get((method, endpoint), 0) + 1
+            for window, cost in ((self._weight.weight, weight), (self._weight.orders_10s, orders_10s), (self._weight.orders_1m, orders_1m)):
+                window.take(now, cost)
+            headers = {'X-MBX-USED-WEIGHT-1M': str(self._weight.weight.used),
+                       'X-MBX-ORDER-COUNT-10S': str(self._weight.orders_10s.used),
+                       'X-MBX-ORDER-COUNT-1M': str(self._weight.orders_1m.used)}
+            try:
+                self._injected_failure(endpoint)
+                handler = getattr(self, f"_{method.lower()}_{endpoint}", None)
+                if handler is None:
+                    raise FakeExchangeError(-1000, f"Endpoint {method} {path} is not implemented by the fake exchange.", status=404)
+                return 200, handler(params, received_at), headers
+            except FakeExchangeError as e:
+                return e.status, {'code': e.code, 'msg': e.msg}, headers
+
+    def _injected_failure(self, endpoint):
+        for failure in self._failures:
+            if failure[0] == endpoint:
+                failure[4] -= 1
+                if failure[4] <= 0:
+                    self._failures.remove(failure)
+                raise FakeExchangeError(failure[1], failure[2], failure[3])
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise FakeExchangeError(-1001, "Internal error; unable to process your request. Please try again.")
+
+    def _symbol(self, params):
+        symbol = params.get('symbol')
+        if symbol not in self.specs:
+            raise FakeExchangeError(-1121, "Invalid symbol.")
+        return symbol
+
+    # --- Market data ---
+
+    def _get_time(self, params, received_at):
+        return {'serverTime': int(time.time() * 1000)}
+
+    def _get_exchangeInfo(self, params, received_at):
+        return {
+            'timezone': 'UTC',
+            'serverTime': int(time.time() * 1000),
+            'rateLimits': [
+                {'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE', 'intervalNum': 1, 'limit': self._weight.weight.limit},
+                {'rateLimitType': 'ORDERS', 'interval': 'MINUTE', 'intervalNum': 1, 'limit': self._weight.orders_1m.limit},
+                {'rateLimitType': 'ORDERS', 'interval': 'SECOND', 'intervalNum': 10, 'limit': self._weight.orders_10s.limit},
+            ],
+            'symbols': [{
+                'symbol': symbol, 'status': 'TRADING', 'contractType': 'PERPETUAL', 'quoteAsset': 'USDT',
+                'filters': [
+                    {'filterType': 'PRICE_FILTER', 'tickSize': tick_size, 'minPrice': tick_size, 'maxPrice': '10000000'},
+                    {'filterType': 'LOT_SIZE', 'stepSize': step_size, 'minQty': step_size, 'maxQty': '1000000'},
+                    {'filterType': 'MIN_NOTIONAL', 'notional': MIN_NOTIONAL},
+                ],
+            } for symbol, (_, tick_size, step_size) in self.specs.items()],
+        }
+
+    def _premium_index(self, symbol):
+        price = f"{self.prices[symbol]:.8f}"
+        return {'symbol': symbol, 'markPrice': price, 'indexPrice': price, 'lastFundingRate': '0.00010000',
+                'time': int(time.time() * 1000)}
+
+    def _get_premiumIndex(self, params, received_at):
+        if params.get('symbol'):
+            return self._premium_index(self._symbol(params))
+        return [self._premium_index(symbol) for symbol in self.specs]
+
+    def _get_klines(self, params, received_at):
+        # Deterministic random walk per (symbol, interval): the same bar always has the same values.
+        symbol = self._symbol(params)
+        step = INTERVAL_MS.get(params.get('interval'))
+        if not step:
+            raise FakeExchangeError(-1120, "Invalid interval.")
+        limit = min(int(params.get('limit', 500)), 1500)
+        now = int(time.time() * 1000)
+        end = min(int(params.get('endTime', now)), now)
+        start = int(params['startTime']) if 'startTime' in params else end - (limit - 1) * step
+        open_time = -(-start // step) * step
+        rows = []
+        while open_time <= end and len(rows) < limit:
+            if any(first <= open_time <= last for first, last in self.kline_halts):
+                open_time += step
+                continue
+            bar = random.Random(f"{symbol}:{step}:{open_time}")
+            open_price = self.specs[symbol][0] * (1 + bar.uniform(-0.05, 0.05))
+            close_price = open_price * (1 + bar.gauss(0, 0.002))
+            high, low = max(open_price, close_price) * (1 + bar.uniform(0, 0.001)), min(open_price, close_price) * (1 - bar.uniform(0, 0.001))
+            volume = bar.uniform(10, 1000)
+            rows.append([open_time, f"{open_price:.8f}", f"{high:.8f}", f"{low:.8f}", f"{close_price:.8f}", f"{volume:.3f}",
+                         open_time + step - 1, f"{volume * close_price:.8f}", bar.randint(10, 500), f"{volume / 2:.3f}",
+                         f"{volume * close_price / 2:.8f}", "0"])
+            open_time += step
+        return rows
+
+    # --- Account ---
+
+    def _post_listenKey(self, params, received_at):
+        return {'listenKey': 'fake-listen-key'}
+
+    def _put_listenKey(self, params, received_at):
+        return {}
+
+    def _delete_listenKey(self, params, received_at):
+        return {}
+
+    def _get_balance(self, params, received_at):
+        balance = f"{self.balance:.8f}"
+        return [{'accountAlias': 'fake', 'asset': 'USDT', 'balance': balance, 'crossWalletBalance': balance,
+                 'crossUnPnl': '0.00000000', 'availableBalance': balance, 'maxWithdrawAmount': balance,
+                 'marginAvailable': True, 'updateTime': int(time.time() * 1000)}]
+
+    def _get_positionRisk(self, params, received_at):
+        symbols = [self._symbol(params)] if params.get('symbol') else list(self.specs)
+        positions = []
+        for symbol in symbols:
+            amount, entry_price = self.positions.get(symbol, (0.0, 0.0))
+            mark = self.prices[symbol]
+            positions.append({'symbol': symbol, 'positionSide': 'BOTH', 'positionAmt': f"{amount:g}",
+                              'entryPrice': f"{entry_price:.8f}", 'markPrice': f"{mark:.8f}",
+                              'unRealizedProfit': f"{(mark - entry_price) * amount:.8f}",
+                              'notional': f"{mark * amount:.8f}", 'updateTime': int(time.time() * 1000)})
+        return positions
+
+    def _get_symbolConfig(self, params, received_at):
+        symbols = [self._symbol(params)] if params.get('symbol') else list(self.specs)
+        return [{'symbol': symbol, 'marginType': self.margin_type.get(symbol, 'CROSSED'), 'isAutoAddMargin': 'false',
+                 'leverage': self.leverage.get(symbol, 20), 'maxNotionalValue': '1000000'} for symbol in symbols]
+
+    def _post_leverage(self, params, received_at):
+        symbol = self._symbol(params)
+        leverage = int(params['leverage'])
+        if not 1 <= leverage <= 125:
+            raise FakeExchangeError(-4028, f"Leverage {leverage} is not valid")
+        self.leverage[symbol] = leverage
+        return {'symbol': symbol, 'leverage': leverage, 'maxNotionalValue': '1000000'}
+
+    def _post_marginType(self, params, received_at):
+        symbol = self._symbol(params)
+        margin_type = params['marginType'].upper()
+        if self.margin_type.get(symbol, 'CROSSED') == margin_type:
+            raise FakeExchangeError(-4046, "No need to change margin type.")
+        if self.positions.get(symbol, (0.0,))[0] or any(o['symbol'] == symbol for o in (*self.orders.values(), *self.algo_orders.values())):
+            raise FakeExchangeError(-4059, "Margin type cannot be changed if there exists position or open orders.")
+        self.margin_type[symbol] = margin_type
+        return {'code': 200, 'msg': 'success'}
+
+    # --- Orders ---
+
+    def _get_openOrders(self, params, received_at):
+        symbol = params.get('symbol')
+        return [dict(order) for order in self.orders.values() if not symbol or order['symbol'] == symbol]
+
+    def _get_order(self, params, received_at):
+        order = self.orders.get(int(params.get('orderId', 0)))
+        if order is None:
+            raise FakeExchangeError(-2013, "Order does not exist.")
+        return dict(order)
+
+    def _delete_order(self, params, received_at):
+        order = self.orders.pop(int(params.get('orderId', 0)), None)
+        if order is None or order['symbol'] != params.get('symbol'):
+            raise FakeExchangeError(-2011, "Unknown order sent.")
+        order['status'] = 'CANCELED'
+        self._push_order_update(order, 'CANCELED')
+        return order
+
+    def _post_order(self, params, received_at):
+        return self._new_order(params, received_at)
+
+    def _post_algoOrder(self, params, received_at):
+        symbol = self._symbol(params)
+        order_type = params.get('type')
+        side = params.get('side')
+        if params.get('algoType') != 'CONDITIONAL':
+            raise FakeExchangeError(-1130, "Data sent for parameter 'algoType' is not valid.")
+        if side not in ('BUY', 'SELL') or order_type not in ('STOP_MARKET', 'TAKE_PROFIT_MARKET'):
+            raise FakeExchangeError(-1116, "Invalid orderType.")
+        if float(params.get('quantity', 0)) <= 0:
+            raise FakeExchangeError(-4003, "Quantity less than or equal to zero.")
+        if float(params.get('triggerPrice', 0)) <= 0:
+            raise FakeExchangeError(-1102, "Mandatory parameter 'triggerPrice' was not sent, was empty/null, or malformed.")
+        now = int(time.time() * 1000)
+        algo_order = {
+            'algoId': next(self._algo_ids), 'clientAlgoId': params.get('clientAlgoId', ''), 'algoType': 'CONDITIONAL',
+            'orderType': order_type, 'symbol': symbol, 'side': side, 'positionSide': 'BOTH',
+            'timeInForce': params.get('timeInForce', 'GTC'), 'quantity': params.get('quantity'), 'algoStatus': 'NEW',
+            'triggerPrice': params.get('triggerPrice'), 'price': '0', 'workingType': 'CONTRACT_PRICE', 'priceProtect': False,
+            'reduceOnly': str(params.get('reduceOnly', 'false')).lower() == 'true', 'closePosition': False,
+            'createTime': now, 'updateTime': now, 'triggerTime': 0,
+        }
+        self.order_events.append({'received_at': received_at, 'symbol': symbol, 'type': order_type, 'side': side,
+                                  'algoId': algo_order['algoId']})
+        self.algo_orders[algo_order['algoId']] = algo_order
+        self._push_algo_update(algo_order)
+        self._try_trigger(algo_order)
+        return dict(algo_order)
+
+    def _algo_order(self, params):
+        # The open algo order named by algoId or clientAlgoId, or None.
+        if params.get('algoId'):
+            return self.algo_orders.get(int(params['algoId']))
+        return next((o for o in self.algo_orders.values() if o['clientAlgoId'] == params.get('clientAlgoId')), None)
+
+    def _get_openAlgoOrders(self, params, received_at):
+        symbol = params.get('symbol')
+        return [dict(order) for order in self.algo_orders.values() if not symbol or order['symbol'] == symbol]
+
+    def _get_algoOrder(self, params, received_at):
+        algo_order = self._algo_order(params)
+        if algo_order is None:
+            raise FakeExchangeError(-2013, "Order does not exist.")
+        return dict(algo_order)
+
+    def _delete_algoOrder(self, params, received_at):
+        algo_order = self._algo_order(params)
+        if algo_order is None or algo_order['symbol'] != params.get('symbol'):
+            raise FakeExchangeError(-2011, "Unknown order sent.")
+        del self.algo_orders[algo_order['algoId']]
+        algo_order.update(algoStatus='CANCELED', updateTime=int(time.time() * 1000))
+        self._push_algo_update(algo_order)
+        return {'algoId': algo_order['algoId'], 'clientAlgoId': algo_order['clientAlgoId'], 'code': '200', 'msg': 'success'}
+
+    def _post_batchOrders(self, params, received_at):
+        results = []
+        for order_params in json.loads(params['batchOrders']):
+            try:
+                results.append(self._new_order(order_params, received_at))
+            except FakeExchangeError as e:
+                results.append({'code': e.code, 'msg': e.msg})
+        return results
+
+    def _new_order(self, params, received_at):
+        symbol = self._symbol(params)
+        order_type = params.get('type')
+        side = params.get('side')
+        quantity = float(params.get('quantity', 0))
+        if order_type in CONDITIONAL_ORDER_TYPES:
+            raise FakeExchangeError(-4120, "Order type not supported for this endpoint. Please use the Algo Order API endpoints instead.")
+        if side not in ('BUY', 'SELL') or order_type not in ('LIMIT', 'MARKET'):
+            raise FakeExchangeError(-1116, "Invalid orderType.")
+        if quantity <= 0:
+            raise FakeExchangeError(-4003, "Quantity less than or equal to zero.")
+        price = float(params.get('price', 0))
+        if order_type == 'LIMIT' and price <= 0:
+            raise FakeExchangeError(-1102, "Mandatory parameter 'price' was not sent, was empty/null, or malformed.")
+        if order_type in ('LIMIT', 'MARKET') and (price or self.prices[symbol]) * quantity < float(MIN_NOTIONAL):
+            raise FakeExchangeError(-4164, f"Order's notional must be no smaller than {MIN_NOTIONAL}.")
+        order = self._book_order(symbol, side, order_type, params.get('quantity'), price=params.get('price', '0'),
+                                 reduce_only=str(params.get('reduceOnly', 'false')).lower() == 'true',
+                                 client_order_id=params.get('newClientOrderId', ''), time_in_force=params.get('timeInForce', 'GTC'))
+        self.order_events.append({'received_at': received_at, 'symbol': symbol, 'type': order_type, 'side': side,
+                                  'orderId': order['orderId']})
+        return dict(order)
+
+    def _book_order(self, symbol, side, order_type, quantity, price='0', reduce_only=False, client_order_id='', time_in_force='GTC',
+                    order_id=None):
+        order = {
+            'orderId': order_id or next(self._order_ids), 'symbol': symbol, 'status': 'NEW',
+            'clientOrderId': client_order_id, 'price': price, 'avgPrice': '0.00',
+            'origQty': quantity, 'executedQty': '0', 'cumQuote': '0', 'timeInForce': time_in_force,
+            'type': order_type, 'origType': order_type, 'side': side, 'positionSide': 'BOTH',
+            'stopPrice': '0', 'reduceOnly': reduce_only, 'closePosition': False, 'workingType': 'CONTRACT_PRICE',
+            'updateTime': int(time.time() * 1000),
+        }
+        self.orders[order['orderId']] = order
+        self._push_order_update(order, 'NEW')
+        self._try_fill(order)
+        return order
+
+    def _try_trigger(self, algo_order):
+        # A conditional order whose trigger price the mark crossed leaves the algo book and is sent on as a
+        # MARKET order with a new orderId.
+        stop = float(algo_order['triggerPrice'])
+        buy = algo_order['side'] == 'BUY'
+        rising = (algo_order['orderType'] == 'STOP_MARKET') == buy # Triggers on the price rising through the stop
+        mark = self.prices[algo_order['symbol']]
+        if (rising and mark < stop) or (not rising and mark > stop):
+            return
+        del self.algo_orders[algo_order['algoId']]
+        order_id = next(self._order_ids)
+        algo_order.update(algoStatus='TRIGGERED', actualOrderId=order_id, triggerTime=int(time.time() * 1000),
+                          updateTime=int(time.time() * 1000))
+        self._push_algo_update(algo_order)
+        order = self._book_order(algo_order['symbol'], algo_order['side'], 'MARKET', algo_order['quantity'], reduce_only=algo_order['reduceOnly'],
+                                 client_order_id=algo_order['clientAlgoId'], order_id=order_id)
+        algo_order.update(algoStatus='FINISHED', executedQty=order['executedQty'], avgPrice=order['avgPrice'],
+                          updateTime=int(time.time() * 1000))
+        self._push_algo_update(algo_order)
+
+    def _try_fill(self, order):
+        mark = self.prices[order['symbol']]
+        buy = order['side'] == 'BUY'
+        if order['type'] == 'MARKET':
+            fill_price = mark
+        else: # LIMIT
+            limit = float(order['price'])
+            if (buy and mark > limit) or (not buy and mark < limit):
+                return
+            fill_price = mark
+        quantity = float(order['origQty'])
+        amount, entry_price = self.positions.get(order['symbol'], (0.0, 0.0))
+        if order['reduceOnly']:
+            quantity = min(quantity, abs(amount)) if (amount > 0) != buy else 0.0
+        del self.orders[order['orderId']]
+        if quantity <= 0:
+            order['status'] = 'EXPIRED'
+            self._push_order_update(order, 'EXPIRED')
+            return
+        closed = min(quantity, abs(amount)) if amount and (amount > 0) != buy else 0.0
+        realized_pnl = (fill_price - entry_price) * closed * (1 if amount > 0 else -1)
+        signed = quantity if buy else -quantity
+        new_amount = amount + signed
+        if amount == 0 or (amount > 0) == (signed > 0):
+            entry_price = (entry_price * abs(amount) + fill_price * quantity) / abs(new_amount)
+        elif (new_amount > 0) != (amount > 0) and new_amount != 0:
+            entry_price = fill_price # Flipped through zero
+        if abs(new_amount) < 1e-12:
+            self.positions.pop(order['symbol'], None)
+        else:
+            self.positions[order['symbol']] = [new_amount, entry_price]
+        order.update(status='FILLED', executedQty=order['origQty'] if not order['reduceOnly'] else f"{quantity:g}",
+                     avgPrice=f"{fill_price:.8f}", cumQuote=f"{fill_price * quantity:.8f}", updateTime=int(time.time() * 1000))
+        position_amount, position_entry = self.positions.get(order['symbol'], (0.0, 0.0))
+        self.user_events.append({'e': 'ACCOUNT_UPDATE', 'E': order['updateTime'], 'T': order['updateTime'], 'a': {
+            'm': 'ORDER', 'B': [], 'P': [{'s': order['symbol'], 'pa': f"{position_amount:g}", 'ep': f"{position_entry:.8f}", 'ps': 'BOTH'}]}})
+        self._push_order_update(order, 'TRADE', last_qty=quantity, last_price=fill_price, realized_pnl=realized_pnl)
+
+    # --- User-data stream events ---
+
+    def _push_order_update(self, order, execution_type, last_qty=0.0, last_price=0.0, realized_pnl=0.0):
+        self.user_events.append({'e': 'ORDER_TRADE_UPDATE', 'E': order['updateTime'], 'T': order['updateTime'], 'o': {
+            's': order['symbol'], 'c': order['clientOrderId'], 'S': order['side'], 'o': order['type'], 'f': order['timeInForce'],
+            'q': order['origQty'], 'p': order['price'], 'ap': order['avgPrice'], 'sp': order['stopPrice'], 'x': execution_type,
+            'X': order['status'], 'i': order['orderId'], 'l': f"{last_qty:g}", 'z': order['executedQty'], 'L': f"{last_price:.8f}",
+            'T': order['updateTime'], 'R': order['reduceOnly'], 'ot': order['origType'], 'ps': 'BOTH', 'rp': f"{realized_pnl:.8f}"}})
+
+    def _push_algo_update(self, algo_order):
+        # 'ai' is the orderId of the order a triggered algo order was sent on as (empty before that).
+        self.user_events.append({'e': 'ALGO_UPDATE', 'E': algo_order['updateTime'], 'T': algo_order['updateTime'], 'o': {
+            'caid': algo_order['clientAlgoId'], 'aid': algo_order['algoId'], 'at': 'CONDITIONAL', 'o': algo_order['orderType'],
+            's': algo_order['symbol'], 'S': algo_order['side'], 'ps': 'BOTH', 'f': algo_order['timeInForce'], 'q': algo_order['quantity'],
+            'X': algo_order['algoStatus'], 'ai': str(algo_order.get('actualOrderId', '')), 'ap': algo_order.get('avgPrice', '0.00000'),
+            'aq': algo_order.get('executedQty', '0.00000'), 'tp': algo_order['triggerPrice'], 'p': algo_order['price'],
+            'wt': algo_order['workingType'], 'cp': algo_order['closePosition'], 'pP': algo_order['priceProtect'],
+            'R': algo_order['reduceOnly'], 'tt': algo_order['triggerTime']}})
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Run the fake futures exchange, e.g. for BINANCE_FUTURES_URL / KLINE_BASE_URL.")
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--symbols', nargs='*', default=None)
+    args = parser.parse_args()
+    exchange = FakeExchange(symbols=args.symbols, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                            error_rate=args.error_rate, port=args.port)
+    exchange.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        exchange.stop()
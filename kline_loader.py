@@ -0,0 +1,259 @@
+# kline_loader.py
+import argparse
+import concurrent.futures
+import logging
+import threading
+import time
+import httpx
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BINANCE_FUTURES_URL = 'https://fapi.binance.com'
+MAX_PAGE_LIMIT = 1500 # Max klines per futures_klines request
+
+INTERVAL_MS = {
+    '1m': 60_000, '3m': 180_000, '5m': 300_000, '15m': 900_000, '30m': 1_800_000,
+    '1h': 3_600_000, '2h': 7_200_000, '4h': 14_400_000, '6h': 21_600_000, '8h': 28_800_000,
+    '12h': 43_200_000, '1d': 86_400_000,
+}
+
+def klines_request_weight(limit):
+    # Request weight of GET /fapi/v1/klines by limit.
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+def _empty_bars():
+    return {'open_time': np.empty(0, dtype=np.int64), 'open': np.empty(0), 'high': np.empty(0),
+            'low': np.empty(0), 'close': np.empty(0), 'volume': np.empty(0)}
+
+def _rows_to_bars(rows):
+    if not rows:
+        return _empty_bars()
+    table = np.array([row[:6] for row in rows], dtype=object)
+    return {
+        'open_time': table[:, 0].astype(np.int64),
+        'open': table[:, 1].astype(float),
+        'high': table[:, 2].astype(float),
+        'low': table[:, 3].astype(float),
+        'close': table[:, 4].astype(float),
+        'volume': table[:, 5].astype(float),
+    }
+
+def _concat(parts):
+    parts = [p for p in parts if len(p['open_time'])]
+    if not parts:
+        return _empty_bars()
+    return {name: np.concatenate([p[name] for p in parts]) for name in parts[0]}
+
+# Token bucket over request weight per minute. Also backs off when the exchange reports (via
+# X-MBX-USED-WEIGHT-1M) that the IP is close to its limit, e.g. because the bot itself is trading.
+class WeightBudget:
+    def __init__(self, weight_per_minute, exchange_limit=2400):
+        self.capacity = weight_per_minute
+        self.tokens = weight_per_minute
+        self.rate = weight_per_minute / 60.0
+        self.exchange_limit = exchange_limit
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, weight):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                wait = max(self.paused_until - now, 0.0)
+                if not wait:
+                    if self.tokens >= weight:
+                        self.tokens -= weight
+                        return
+                    wait = (weight - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def observe(self, used_weight_1m):
+        # Pause until the next minute window when the IP-wide usage is above 90% of the exchange limit.
+        if used_weight_1m >= 0.9 * self.exchange_limit:
+            with self._lock:
+                self.paused_until = max(self.paused_until, time.monotonic() + 60 - time.time() % 60)
+
+    def pause(self, seconds):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+# Fills a KlineStore from GET /fapi/v1/klines. Page windows are known in advance (bars have a fixed
+# interval), so they are fetched concurrently within the weight budget and written to the store strictly
+# in order as they complete. The store's last bar is the checkpoint: an interrupted load resumes from it.
+class KlineLoader:
+    def __init__(self, store, base_url=BINANCE_FUTURES_URL, weight_per_minute=1200, max_workers=8,
+                 page_limit=MAX_PAGE_LIMIT, max_retries=5, http_client=None):
+        self.store = store
+        self.base_url = base_url.rstrip('/')
+        self.budget = WeightBudget(weight_per_minute)
+        self.page_limit = page_limit
+        self.page_weight = klines_request_weight(page_limit)
+        self.max_retries = max_retries
+        self.http_client = http_client or httpx.Client(timeout=30.0, limits=httpx.Limits(max_connections=max_workers))
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kline-loader")
+        self.stats = {'requests': 0, 'retries': 0, 'bars': 0, 'gap_refetches': 0}
+        self._stats_lock = threading.Lock()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.http_client.close()
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def fetch_page(self, symbol, interval, start_time, end_time):
+        # One klines request for start_time <= open_time <= end_time, with retries.
+        params = {'symbol': symbol, 'interval': interval, 'startTime': start_time, 'endTime': end_time, 'limit': self.page_limit}
+        for attempt in range(self.max_retries + 1):
+            self.budget.acquire(self.page_weight)
+            try:
+                response = self.http_client.get(f"{self.base_url}/fapi/v1/klines", params=params)
+                self._count('requests')
+                used = response.headers.get('X-MBX-USED-WEIGHT-1M')
+                if used:
+                    self.budget.observe(int(used))
+                if response.status_code in (418, 429):
+                    retry_after = float(response.headers.get('Retry-After', 60))
+                    logger.warning(f"Klines for {symbol} rate limited ({response.status_code}), pausing {retry_after}s.")
+                    self.budget.pause(retry_after)
+                elif response.status_code >= 500:
+                    logger.warning(f"Klines for {symbol} failed with HTTP {response.status_code}, retrying.")
+                else:
+                    response.raise_for_status()
+                    return _rows_to_bars(response.json())
+            except httpx.TransportError as e:
+                logger.warning(f"Klines request for {symbol} failed: {e}")
+            if attempt < self.max_retries:
+                self._count('retries')
+                time.sleep(min(2 ** attempt, 30))
+        raise RuntimeError(f"Giving up on klines for {symbol} {interval} {start_time}-{end_time} after {self.max_retries + 1} attempts.")
+
+    def _page_windows(self, interval, start_time, end_time):
+        step = INTERVAL_MS[interval]
+        span = step * self.page_limit
+        first = -(-start_time // step) * step # First bar open time at or after start_time
+        return [(t, min(t + span - 1, end_time)) for t in range(first, end_time + 1, span)]
+
+    def _fetch_range(self, symbol, interval, start_time, end_time, on_page=None):
+        # Fetches all pages concurrently; on_page(bars) is called for every page in chronological order.
+        windows = self._page_windows(interval, start_time, end_time)
+        pages = self.executor.map(lambda w: self.fetch_page(symbol, interval, *w), windows)
+        collected = []
+        for bars in pages:
+            if on_page:
+                on_page(bars)
+            else:
+                collected.append(bars)
+        return _concat(collected)
+
+    def last_closed_open_time(self, interval, now_ms=None):
+        step = INTERVAL_MS[interval]
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        return now_ms // step * step - step
+
+    def load(self, symbol, interval, start_time, end_time=None):
+        # Loads closed bars with open_time in [start_time, end_time] into the store: the head before the
+        # stored history (merged), then everything after the stored tail (appended page by page), then gaps.
+        step = INTERVAL_MS[interval]
+        end_time = min(end_time if end_time is not None else self.last_closed_open_time(interval), self.last_closed_open_time(interval))
+        started_at = time.monotonic()
+        written = 0
+
+        stored = self.store.read(symbol, interval)
+        if len(stored['open_time']) and start_time < stored['open_time'][0]:
+            head = self._fetch_range(symbol, interval, start_time, int(stored['open_time'][0]) - 1)
+            written += self._merge(symbol, interval, head)
+
+        tail = self.store.last_open_time(symbol, interval)
+        resume_from = tail + step if tail is not None else start_time
+        if resume_from <= end_time:
+            if tail is not None:
+                logger.info(f"Resuming {symbol} {interval} after {tail}.")
+            def append_page(bars):
+                nonlocal written
+                written += self.store.append(symbol, interval, bars)
+            self._fetch_range(symbol, interval, resume_from, end_time, on_page=append_page)
+
+        written += self.fill_gaps(symbol, interval)
+        self._count('bars', written)
+        logger.info(f"Loaded {written} {interval} bars for {symbol} in {time.monotonic() - started_at:.1f}s.")
+        return written
+
+    def load_all(self, symbols, interval, start_time, end_time=None):
+        results = {}
+        for symbol in symbols:
+            try:
+                results[symbol] = self.load(symbol, interval, start_time, end_time)
+            except Exception as e:
+                logger.error(f"Loading {interval} klines for {symbol} failed: {e}")
+                results[symbol] = None
+        return results
+
+    def find_gaps(self, symbol, interval):
+        # [(first missing open_time, last missing open_time)] inside the stored series.
+        open_times = self.store.read(symbol, interval)['open_time']
+        step = INTERVAL_MS[interval]
+        breaks = np.flatnonzero(np.diff(open_times) != step)
+        return [(int(open_times[i]) + step, int(open_times[i + 1]) - step) for i in breaks]
+
+    def fill_gaps(self, symbol, interval):
+        # Refetches missing ranges and merges whatever the exchange has for them. What is still missing
+        # afterwards (e.g. trading halts) is recorded with the store and not refetched by later loads.
+        # Returns the number of bars added.
+        known = set(self.store.empty_ranges(symbol, interval))
+        gaps = [gap for gap in self.find_gaps(symbol, interval) if gap not in known]
+        if not gaps:
+            return 0
+        logger.info(f"{symbol} {interval}: {len(gaps)} gap(s) in stored history, refetching.")
+        found = _concat([self._fetch_range(symbol, interval, start, end) for start, end in gaps])
+        added = self._merge(symbol, interval, found)
+        self._count('gap_refetches', len(gaps))
+        empty = [gap for gap in self.find_gaps(symbol, interval)
+                 if gap not in known and any(start <= gap[0] and gap[1] <= end for start, end in gaps)]
+        if empty:
+            logger.info(f"{symbol} {interval}: {len(empty)} gap(s) have no bars on the exchange either, skipping them from now on.")
+            self.store.add_empty_ranges(symbol, interval, empty)
+        return added
+
+    def _merge(self, symbol, interval, bars):
+        # Merges bars into the stored series with one rewrite; fetched bars win over stored duplicates.
+        if not len(bars['open_time']):
+            return 0
+        stored = self.store.read(symbol, interval)
+        before = len(stored['open_time'])
+        combined = _concat([bars, {name: np.asarray(column) for name, column in stored.items()}])
+        _, first_index = np.unique(combined['open_time'], return_index=True) # Sorted, first occurrence wins
+        self.store.rewrite(symbol, interval, {name: column[first_index] for name, column in combined.items()})
+        return len(first_index) - before
+
+if __name__ == "__main__":
+    import config
+    from kline_store import KlineStore
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Bulk-load historical futures klines into the local kline store.")
+    parser.add_argument('--interval', default='1m', choices=sorted(INTERVAL_MS))
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--symbols', nargs='*', default=None, help="Defaults to config.TRADING_PAIRS")
+    parser.add_argument('--base-url', default=getattr(config, 'KLINE_BASE_URL', BINANCE_FUTURES_URL))
+    args = parser.parse_args()
+
+    loader = KlineLoader(KlineStore(getattr(config, 'KLINE_STORE_DIR', 'klines')), base_url=args.base_url,
+                         weight_per_minute=getattr(config, 'KLINE_LOADER_WEIGHT_PER_MINUTE', 1200),
+                         max_workers=getattr(config, 'KLINE_LOADER_WORKERS', 8))
+    start = int(time.time() * 1000) - args.days * 86_400_000
+    try:
+        print(loader.load_all(args.symbols or config.TRADING_PAIRS, args.interval, start))
+        print(loader.stats)
+    finally:
+        loader.close()
@@ -0,0 +1,154 @@
+# kline_store.py
+import json
+import logging
+import os
+import threading
+import numpy as np
+from mtf_indicator import resample, TIMEFRAMES
+
+logger = logging.getLogger(__name__)
+
+# One raw little-endian file per column; open_time (ms) is the index and is strictly increasing.
+COLUMNS = (('open_time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'), ('volume', '<f8'))
+
+# Binance kline interval for each Pine timeframe used in MTF.txt.
+PINE_TO_BINANCE_INTERVAL = {'60': '1h', '120': '2h', '240': '4h', 'D': '1d', 'W': '1w'}
+
+# On-disk columnar OHLCV store: <root>/<SYMBOL>/<interval>/<column>.bin. Reads return memory-mapped
+# views, so years of 1m bars can be sliced by open time without loading them into RAM. New closed bars
+# are appended to the tail; history repairs go through rewrite().
+class KlineStore:
+    def __init__(self, root):
+        self.root = root
+        self._maps = {} # (symbol, interval) -> (row count, {column: np.memmap})
+        self._lock = threading.Lock() # Serialises writers; readers only take it to refresh their maps
+
+    def _dir(self, symbol, interval):
+        return os.path.join(self.root, symbol.upper(), interval)
+
+    def _path(self, symbol, interval, column):
+        return os.path.join(self._dir(symbol, interval), f"{column}.bin")
+
+    def _row_count(self, symbol, interval):
+        path = self._path(symbol, interval, 'open_time')
+        return os.path.getsize(path) // 8 if os.path.exists(path) else 0
+
+    def _columns(self, symbol, interval):
+        # Memmaps covering every complete row, re-created only when the file grew.
+        key = (symbol.upper(), interval)
+        rows = self._row_count(symbol, interval)
+        with self._lock:
+            cached = self._maps.get(key)
+            if cached and cached[0] == rows:
+                return cached[1]
+            if rows == 0:
+                columns = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS}
+            else:
+                columns = {name: np.memmap(self._path(symbol, interval, name), dtype=dtype, mode='r', shape=(rows,))
+                           for name, dtype in COLUMNS}
+            self._maps[key] = (rows, columns)
+            return columns
+
+    # --- Reading ---
+
+    def count(self, symbol, interval):
+        return self._row_count(symbol, interval)
+
+    def last_open_time(self, symbol, interval):
+        open_times = self._columns(symbol, interval)['open_time']
+        return int(open_times[-1]) if len(open_times) else None
+
+    def read(self, symbol, interval, start=None, end=None):
+        # Bars with start <= open_time < end (ms, either bound optional) as zero-copy memmap slices.
+        columns = self._columns(symbol, interval)
+        open_times = columns['open_time']
+        lo = int(np.searchsorted(open_times, start, side='left')) if start is not None else 0
+        hi = int(np.searchsorted(open_times, end, side='left')) if end is not None else len(open_times)
+        return {name: column[lo:hi] for name, column in columns.items()}
+
+    def read_timeframe(self, symbol, base_interval, timeframe, start=None, end=None):
+        # `timeframe` ('60', '120', '240', 'D', 'W') bars aggregated from the stored base bars. Pass a start
+        # on a timeframe boundary, otherwise the first aggregated bar is partial.
+        return resample(self.read(symbol, base_interval, start, end), timeframe)
+
+    def read_mtf(self, symbol, base_interval, start=None, end=None):
+        # {timeframe: bars} for every timeframe MTF.txt requests, ready for mtf_indicator.compute_signals().
+        bars = self.read(symbol, base_interval, start, end)
+        return {tf: resample(bars, tf) for tf in TIMEFRAMES}
+
+    def empty_ranges(self, symbol, interval):
+        # [(first, last)] open-time ranges the exchange returned no bars for (see add_empty_ranges).
+        path = os.path.join(self._dir(symbol, interval), 'empty_ranges.json')
+        if not os.path.exists(path):
+            return []
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return [tuple(r) for r in json.load(f)]
+        except (OSError, ValueError) as e:
+            logger.warning(f"Kline store: ignoring unreadable {path}: {e}")
+            return []
+
+    # --- Writing ---
+
+    def add_empty_ranges(self, symbol, interval, ranges):
+        # Records gaps that are permanent on the exchange (e.g. trading halts), in a small JSON sidecar next
+        # to the columns, so loaders stop refetching them.
+        with self._lock:
+            known = set(self.empty_ranges(symbol, interval)) | {tuple(int(t) for t in r) for r in ranges}
+            os.makedirs(self._dir(symbol, interval), exist_ok=True)
+            path = os.path.join(self._dir(symbol, interval), 'empty_ranges.json')
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(sorted(known), f)
+            os.replace(path + '.tmp', path)
+
+    def append(self, symbol, interval, bars):
+        # Appends closed bars (dict of column arrays sorted by open time). Bars at or before the stored tail
+        # are skipped. Returns the number of rows written.
+        with self._lock:
+            open_times = np.asarray(bars['open_time'], dtype=np.int64)
+            last = self._tail_open_time(symbol, interval)
+            keep = open_times > last if last is not None else np.ones(len(open_times), dtype=bool)
+            if not keep.any():
+                return 0
+            if np.any(np.diff(open_times[keep]) <= 0):
+                raise ValueError(f"Bars for {symbol} {interval} are not strictly increasing by open_time.")
+            os.makedirs(self._dir(symbol, interval), exist_ok=True)
+            rows = self._row_count(symbol, interval)
+            # open_time goes last: it defines the row count, so a crash mid-append never exposes a partial row.
+            for name, dtype in COLUMNS[1:] + COLUMNS[:1]:
+                path = self._path(symbol, interval, name)
+                with open(path, 'ab') as f:
+                    if f.tell() != rows * 8:
+                        f.truncate(rows * 8) # Drop what a crash mid-append left behind
+                    f.write(np.ascontiguousarray(np.asarray(bars[name])[keep], dtype=dtype).tobytes())
+            return int(keep.sum())
+
+    def rewrite(self, symbol, interval, bars):
+        # Replaces the whole series (e.g. after merging in a filled gap). Each column is written to a
+        # temporary file and swapped in with os.replace.
+        with self._lock:
+            open_times = np.asarray(bars['open_time'], dtype=np.int64)
+            if np.any(np.diff(open_times) <= 0):
+                raise ValueError(f"Bars for {symbol} {interval} are not strictly increasing by open_time.")
+            os.makedirs(self._dir(symbol, interval), exist_ok=True)
+            self._maps.pop((symbol.upper(), interval), None)
+            # open_time defines the row count readers map, so it is swapped in last when the series grows
+            # and first when it shrinks; every column file is then always at least that long.
+            order = COLUMNS[1:] + COLUMNS[:1] if len(open_times) >= self._row_count(symbol, interval) else COLUMNS
+            for name, dtype in order:
+                path = self._path(symbol, interval, name)
+                with open(path + '.tmp', 'wb') as f:
+                    f.write(np.ascontiguousarray(bars[name], dtype=dtype).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(path + '.tmp', path)
+            logger.info(f"Kline store: rewrote {symbol} {interval} with {len(open_times)} bars.")
+
+    def _tail_open_time(self, symbol, interval):
+        # Called with the lock held, so it reads the file directly instead of going through the map cache.
+        rows = self._row_count(symbol, interval)
+        if rows == 0:
+            return None
+        with open(self._path(symbol, interval, 'open_time'), 'rb') as f:
+            f.seek((rows - 1) * 8)
+            return int(np.frombuffer(f.read(8), dtype='<i8')[0])
@@ -1,13 +1,24 @@
 import config # Ensure config is imported first
 import logging
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 import json
 import time
 import threading # Added for TSL
 # import copy # Not strictly needed if manage_trailing_stops iterates over list(keys)
-from trailing_stop_manager import manage_trailing_stops # Added for TSL
+from trailing_stop_manager import manage_trailing_stops, cancel_stale_stops # Added for TSL
 from binance_client import BinanceFuturesClient
-from telegram_bot import TelegramNotifier
+from telegram_bot import TelegramNotifier, LabelledNotifier
+from user_data_stream import UserDataStream
+from price_feed import MarkPriceFeed
+from signal_dispatcher import SignalDispatcher
+from trade_journal import TradeJournal, reconcile_trades
+from order_tracker import OrderTracker
+from tsl_scheduler import TSLScheduler
+from accounts import TradingAccount, AccountFanout, account_configs, journal_path_for
+from webhook_dedup import WebhookDedup
+import symbol_settings
+import metrics
+import tracing
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -15,22 +26,64 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+WEBHOOK_VALIDATE = metrics.histogram('webhook_validate_seconds', "Parsing and validation of a /webhook request.")
+SIGNAL_HANDLE = metrics.histogram('signal_handle_seconds', "Execution of one signal on all accounts, from handle_trade_signal until its orders were placed or it was rejected.")
+TSL_CYCLE = metrics.histogram('tsl_cycle_seconds', "Duration of one trailing stop cycle.")
+TSL_CYCLE_TRADES = metrics.histogram('tsl_cycle_trades', "Trades checked per trailing stop cycle.", buckets=metrics.COUNT_BUCKETS)
+ACTIVE_TRADES = metrics.gauge('active_trades', "Trades managed by the bot, by account.", ('account',))
+ACTIVE_TRADES.set_function(lambda: {(account.name,): len(account.active_bot_trades) for account in accounts})
+SIGNAL_QUEUE_DEPTH = metrics.gauge('signal_queue_depth', "Webhook signals waiting for a worker, by worker.", ('worker',))
+SIGNAL_QUEUE_DEPTH.set_function(lambda: {(str(i),): depth for i, depth in enumerate(signal_dispatcher.queue_depths())} if signal_dispatcher else {})
+
 # Global variables
-futures_client = None
+futures_client = None # Client of the first account
 telegram_notifier = None
-active_bot_trades = {} # Stores active trades managed by this bot instance
-initialized_symbols_settings = set() # Tracks symbols where leverage/margin have been set this session
-# active_trades_lock = threading.Lock() # Optional: for more complex dict manipulations if needed
+accounts = [] # TradingAccount per Binance account: its client, active trades, journal, order tracker, streams
+account_fanout = None # Sends each signal to all accounts at once when config.ACCOUNTS lists more than one
+price_feed = None # Set when config.USE_MARK_PRICE_STREAM is enabled
+signal_dispatcher = None # Worker pool for webhook signals, unless config.WEBHOOK_WORKERS is 0
+webhook_dedup = None # Answers repeated alerts without executing them, unless config.WEBHOOK_DEDUP_TTL_SECONDS is 0
 
 def initialize_services():
-    global futures_client, telegram_notifier
+    global futures_client, telegram_notifier, signal_dispatcher, account_fanout, webhook_dedup
     logger.info("Initializing services...")
+    tracing.configure(buffer_size=getattr(config, 'TRACE_BUFFER_SIZE', 200), slow_ms=getattr(config, 'TRACE_SLOW_MS', 500),
+                      log_path=getattr(config, 'TRACE_LOG_PATH', 'slow_traces.jsonl'))
     telegram_notifier = TelegramNotifier(config.TELEGRAM_BOT_TOKEN, config.TELEGRAM_CHAT_ID) # Init this first for error reporting
-    futures_client = BinanceFuturesClient(config.BINANCE_API_KEY, config.BINANCE_API_SECRET, telegram_notifier)
+    configs = account_configs()
+    multi_account = len(configs) > 1
+    for name, api_key, api_secret, settings in configs:
+        notifier = LabelledNotifier(telegram_notifier, name) if multi_account else telegram_notifier
+        account = TradingAccount(name, BinanceFuturesClient(api_key, api_secret, notifier, settings=settings), notifier)
+        accounts.append(account)
+        initialize_account(account, api_key, journal_path_for(getattr(config, 'TRADE_JOURNAL_PATH', 'trade_journal.jsonl'), name, multi_account))
+    futures_client = accounts[0].futures_client
+
+    dedup_ttl = getattr(config, 'WEBHOOK_DEDUP_TTL_SECONDS', 600)
+    if dedup_ttl:
+        webhook_dedup = WebhookDedup(ttl_seconds=dedup_ttl, max_entries=getattr(config, 'WEBHOOK_DEDUP_MAX_ENTRIES', 10000))
+    webhook_workers = getattr(config, 'WEBHOOK_WORKERS', 4)
+    if multi_account:
+        account_fanout = AccountFanout(accounts, _prepare_trade_signal, _place_trade, max_workers=2 * len(accounts) * max(webhook_workers, 1))
+        logger.info(f"Multi-account mode: every signal goes to {', '.join(a.name for a in accounts)}.")
+    if webhook_workers > 0:
+        signal_dispatcher = SignalDispatcher(handle_trade_signal, num_workers=webhook_workers,
+                                             queue_size=getattr(config, 'WEBHOOK_QUEUE_SIZE', 50),
+                                             error_callback=_on_signal_error)
+        signal_dispatcher.start()
+    logger.info("Services initialized.")
 
-    logger.info("Checking Binance connection...")
+def initialize_account(account, api_key, journal_path):
+    futures_client, telegram_notifier = account.futures_client, account.telegram_notifier
+    if getattr(config, 'KEEPALIVE_INTERVAL_SECONDS', 15):
+        futures_client.start_keepalive()
+    exchange_info_refresh = getattr(config, 'EXCHANGE_INFO_REFRESH_SECONDS', 3600)
+    if exchange_info_refresh:
+        futures_client.start_exchange_info_refresh(exchange_info_refresh)
+
+    logger.info(f"Checking Binance connection for account {account.name}...")
     balance = futures_client.get_usdt_balance()
-    if balance is None or (balance == 0.0 and config.BINANCE_API_KEY != "YOUR_BINANCE_API_KEY"):
+    if balance is None or (balance == 0.0 and api_key != "YOUR_BINANCE_API_KEY"):
         logger.error("Failed to connect to Binance or retrieve balance. Check API keys, permissions, or network.")
         if telegram_notifier.enabled:
              telegram_notifier.notify_error("Bot Service FATAL Error", "Failed to connect to Binance or retrieve balance. Bot cannot start trading.")
@@ -38,13 +91,80 @@ def initialize_services():
         logger.info(f"Binance connection successful. USDT Balance: {balance}")
         if telegram_notifier.enabled:
             telegram_notifier.send_message("🤖 Trading Bot Server Started Successfully\n🟢 Listening for webhook signals.")
-    logger.info("Services initialized.")
 
-def handle_trade_signal(data):
-    global futures_client, telegram_notifier, active_bot_trades, initialized_symbols_settings
-    if not futures_client or not telegram_notifier:
-        logger.error("Services not initialized. Cannot handle trade signal.")
+    if getattr(config, 'PREWARM_SYMBOL_SETTINGS', True):
+        account.symbol_settings = symbol_settings.prewarm(account, config.TRADING_PAIRS,
+                                                          path=getattr(config, 'SYMBOL_SETTINGS_PATH', 'symbol_settings.json'),
+                                                          max_workers=getattr(config, 'SYMBOL_SETTINGS_WORKERS', 8))
+
+    if journal_path:
+        account.trade_journal = TradeJournal(journal_path)
+        restore_active_trades(account, account.trade_journal.load())
+        account.trade_journal.start(account.active_bot_trades)
+
+def restore_active_trades(account, journaled_trades):
+    # Checks trades replayed from the journal against one bulk positions/open-orders snapshot and
+    # resumes managing the ones that are still open.
+    if not journaled_trades:
         return
+    futures_client, telegram_notifier = account.futures_client, account.telegram_notifier
+    try:
+        futures_client.position_book.invalidate()
+        kept, closed, warnings = reconcile_trades(journaled_trades, futures_client.position_book.open_positions(),
+                                                  futures_client.position_book.open_orders())
+    except Exception as e:
+        logger.error(f"Could not reconcile journaled trades with Binance, restoring them unchecked: {e}")
+        kept, closed, warnings = journaled_trades, [], []
+
+    for symbol in closed:
+        if journaled_trades[symbol].get('stale_sl_order_ids'): # Replaced stops whose cancel never went through
+            remaining = cancel_stale_stops(futures_client, symbol, journaled_trades[symbol])
+            if remaining:
+                warnings.append(f"{symbol}: stale SL order(s) {remaining} of the closed trade could not be cancelled. Cancel them manually.")
+    for warning in warnings:
+        logger.warning(f"Trade journal reconcile: {warning}")
+    with account.active_trades_lock:
+        account.active_bot_trades.update(kept)
+    message = f"Restored {len(kept)} trade(s) from the journal: {', '.join(kept) or '-'}."
+    if closed:
+        message += f" Closed while the bot was down: {', '.join(closed)}."
+    logger.info(message)
+    if telegram_notifier.enabled:
+        telegram_notifier.send_message(f"♻️ {message}" + "".join(f"\n⚠️ {w}" for w in warnings))
+
+def _on_signal_error(data, e):
+    if telegram_notifier and telegram_notifier.enabled:
+        telegram_notifier.notify_error(f"Signal Processing Error: {data.get('ticker')}", str(e))
+
+def handle_trade_signal(data):
+    # Signals for different symbols may run in parallel worker threads. Symbols being opened right now
+    # are tracked so they count against MAX_OPEN_TRADES before their positions show up on Binance.
+    received_at = time.monotonic()
+    try:
+        if account_fanout:
+            account_fanout.run(data, received_at)
+            return
+        account = accounts[0] if accounts else None
+        if account is None:
+            logger.error("Services not initialized. Cannot handle trade signal.")
+            return
+        symbol = data['ticker']
+        account.begin_signal(symbol)
+        try:
+            with tracing.span('prepare', account=account.name):
+                plan = _prepare_trade_signal(account, data, received_at)
+            if plan:
+                with tracing.span('place', account=account.name):
+                    _place_trade(account, plan)
+        finally:
+            account.end_signal(symbol)
+    finally:
+        SIGNAL_HANDLE.observe(time.monotonic() - received_at)
+
+def _prepare_trade_signal(account, data, received_at):
+    # Checks and sizing of one account for a signal. Returns the order plan, or None to skip the signal.
+    futures_client, telegram_notifier = account.futures_client, account.telegram_notifier
+    active_bot_trades = account.active_bot_trades
 
     signal_type = data['signal_type']
     symbol = data['ticker']
@@ -52,9 +172,21 @@ def handle_trade_signal(data):
 
     logger.info(f"Processing {signal_type} signal for {symbol} at {entry_price}")
 
-    open_positions_count = futures_client.get_open_positions_count()
-    if open_positions_count is not None and open_positions_count >= config.MAX_OPEN_TRADES:
-        message = f"Max open trades ({config.MAX_OPEN_TRADES}) reached. Ignoring {signal_type} signal for {symbol}."
+    live_price = price_feed.get(symbol) if price_feed else None
+    if live_price:
+        logger.info(f"Live mark price for {symbol}: {live_price} (drift from webhook close: {(live_price - entry_price) / entry_price * 100:.3f}%)")
+        if config.ORDER_TYPES.get('entry', 'LIMIT').upper() == 'MARKET':
+            entry_price = live_price # A MARKET entry fills near the live price, not the alert bar's close
+
+    open_symbols = futures_client.get_open_position_symbols()
+    logger.info(f"Found {len(open_symbols)} open positions.")
+    with account.active_trades_lock:
+        in_flight = account.pending_trade_symbols - {symbol} # Other symbols being opened by parallel workers
+    in_flight |= {s for s, t in list(active_bot_trades.items()) if t.get('status') == "pending_entry"} # Resting entries
+    in_flight_count = len(in_flight - open_symbols) # An entry that has already filled is counted as a position
+    max_open_trades = futures_client.setting('MAX_OPEN_TRADES')
+    if len(open_symbols) + in_flight_count >= max_open_trades:
+        message = f"Max open trades ({max_open_trades}) reached. Ignoring {signal_type} signal for {symbol}."
         logger.warning(message)
         if telegram_notifier.enabled: telegram_notifier.send_message(f"⚠️ {message}")
         return
@@ -71,20 +203,21 @@ def handle_trade_signal(data):
         if telegram_notifier.enabled: telegram_notifier.notify_error(f"Conflict Warning: {symbol}", message)
         return
 
-    if symbol not in initialized_symbols_settings:
-        logger.info(f"Configuring {symbol} for leverage {config.LEVERAGE}x and margin type {config.MARGIN_TYPE}...")
-        leverage_ok = futures_client.set_leverage(symbol, config.LEVERAGE)
+    if symbol not in account.initialized_symbols_settings:
+        leverage, margin_type = futures_client.setting('LEVERAGE'), futures_client.setting('MARGIN_TYPE')
+        logger.info(f"Configuring {symbol} for leverage {leverage}x and margin type {margin_type}...")
+        leverage_ok = futures_client.set_leverage(symbol, leverage)
         if not leverage_ok:
             message = f"Failed to set leverage for {symbol}. Cannot proceed with trade."
             logger.error(message)
             return
-        margin_type_ok = futures_client.set_margin_type(symbol, config.MARGIN_TYPE)
+        margin_type_ok = futures_client.set_margin_type(symbol, margin_type)
         if not margin_type_ok:
             message = f"Failed to set margin type for {symbol}. Cannot proceed with trade."
             logger.error(message)
             return
         logger.info(f"Successfully set leverage and margin type for {symbol}.")
-        initialized_symbols_settings.add(symbol)
+        account.initialized_symbols_settings.add(symbol)
     else:
         logger.info(f"Leverage and margin type already configured for {symbol} in this session.")
 
@@ -101,9 +234,27 @@ def handle_trade_signal(data):
         logger.error(message)
         if telegram_notifier.enabled: telegram_notifier.notify_error("Sizing Error", message)
         return
-
+    return {'symbol': symbol, 'signal_type': signal_type, 'entry_price': entry_price, 'quantity': quantity, 'received_at': received_at}
+
+def _place_trade(account, plan):
+    # Entry and stop-loss orders for a prepared signal, then the trade record.
+    futures_client, telegram_notifier, order_tracker = account.futures_client, account.telegram_notifier, account.order_tracker
+    symbol, signal_type, entry_price, quantity = plan['symbol'], plan['signal_type'], plan['entry_price'], plan['quantity']
+    order_sent_at = time.monotonic()
+    account.latency.record('signal_to_order', (order_sent_at - plan['received_at']) * 1000)
     logger.info(f"Attempting to place {signal_type} order for {quantity} of {symbol} at {entry_price}")
-    entry_order = futures_client.create_entry_order(symbol, signal_type, entry_price, quantity)
+    # With DEFER_SL_UNTIL_FILL a LIMIT entry gets its stop only once fills arrive, sized to the filled quantity.
+    defer_sl = (getattr(config, 'DEFER_SL_UNTIL_FILL', False) and order_tracker is not None
+                and config.ORDER_TYPES.get('entry', 'LIMIT').upper() == 'LIMIT')
+    sl_order = None
+    if defer_sl:
+        entry_order = futures_client.create_entry_order(symbol, signal_type, entry_price, quantity)
+    elif getattr(config, 'BATCH_ENTRY_ORDERS', False):
+        # Entry and SL (computed from the target entry price, as below) sent in parallel, in one round trip.
+        entry_order, sl_order = futures_client.create_entry_with_stop_loss(symbol, signal_type, entry_price, quantity)
+    else:
+        entry_order = futures_client.create_entry_order(symbol, signal_type, entry_price, quantity)
+    account.latency.record('entry_order', (time.monotonic() - order_sent_at) * 1000)
 
     if not entry_order or 'orderId' not in entry_order:
         message = f"Failed to place entry order for {symbol} ({signal_type})."
@@ -113,11 +264,32 @@ def handle_trade_signal(data):
 
     logger.info(f"Entry order for {symbol} placed successfully: {entry_order}")
 
-    # TODO: Query actual fill price of entry_order for more precise P&L and TSL calculations.
-    # This is a CRITICAL TODO for accuracy. For now, using entry_price from webhook.
+    # The order tracker replaces this with the average fill price (and resizes the SL) as fills arrive.
     actual_filled_entry_price = entry_price
 
-    sl_order = futures_client.create_stop_loss_order(symbol, signal_type, actual_filled_entry_price, quantity)
+    if defer_sl:
+        trade_record = {
+            'entry_order_id': entry_order['orderId'],
+            'sl_order_id': None,
+            'current_sl_price': 0.0,
+            'entry_price': actual_filled_entry_price,
+            'quantity': 0.0, # Filled quantity; the stop always covers exactly this much
+            'ordered_quantity': quantity,
+            'signal_type': signal_type,
+            'status': "pending_entry",
+            'trailing_active': False,
+            'highest_price_since_trailing_activation': actual_filled_entry_price if signal_type == 'long' else 0.0,
+            'lowest_price_since_trailing_activation': actual_filled_entry_price if signal_type == 'short' else float('inf'),
+            'timestamp': time.time()
+        }
+        _add_trade(account, symbol, trade_record, entry_order)
+        if telegram_notifier.enabled:
+            telegram_notifier.notify_trade_entry(symbol, signal_type, entry_price, quantity, 0.0,
+                                                 notes=f"Entry Order ID: {entry_order['orderId']}\nStop-loss will be placed as the order fills.")
+        return
+
+    if not sl_order: # Sequential mode, or the parallel SL leg failed: place it on its own
+        sl_order = futures_client.create_stop_loss_order(symbol, signal_type, actual_filled_entry_price, quantity)
     if not sl_order or 'orderId' not in sl_order:
         sl_failure_message = f"Entry order for {symbol} placed (ID: {entry_order['orderId']}), but FAILED to place stop-loss. MANUAL INTERVENTION REQUIRED."
         logger.error(sl_failure_message)
@@ -134,7 +306,7 @@ def handle_trade_signal(data):
         telegram_notifier.notify_trade_entry(symbol, signal_type, actual_filled_entry_price, quantity, initial_sl_price,
                                              notes=f"Entry Order ID: {entry_order['orderId']}\nSL Order ID: {sl_order['orderId']}")
 
-    active_bot_trades[symbol] = {
+    trade_record = {
         'entry_order_id': entry_order['orderId'],
         'sl_order_id': sl_order['orderId'],
         'current_sl_price': initial_sl_price,
@@ -147,12 +319,28 @@ def handle_trade_signal(data):
         'lowest_price_since_trailing_activation': actual_filled_entry_price if signal_type == 'short' else float('inf'),
         'timestamp': time.time()
     }
-    logger.info(f"Trade {symbol} added to active_bot_trades. Details: {active_bot_trades[symbol]}")
+    _add_trade(account, symbol, trade_record, entry_order)
+
+def _add_trade(account, symbol, trade_record, entry_order):
+    with account.active_trades_lock:
+        account.active_bot_trades[symbol] = trade_record
+    if account.trade_journal:
+        account.trade_journal.record_open(symbol, trade_record)
+    logger.info(f"[{account.name}] Trade {symbol} added to active_bot_trades. Details: {trade_record}")
+    if account.order_tracker:
+        account.order_tracker.track_entry(symbol, entry_order) # Must follow the insert: fills are applied to the stored trade
 
 
 @app.route('/webhook', methods=['POST'])
 def webhook():
     logger.info("Webhook received!")
+    with tracing.new_trace('webhook') as trace:
+        response, status = _process_webhook(time.monotonic())
+    response.headers['X-Trace-Id'] = trace.trace_id
+    return response, status
+
+def _process_webhook(received_at):
+    dedup_key = None
     try:
         data_str = request.get_data(as_text=True)
         logger.debug(f"Raw webhook data: {data_str}")
@@ -182,6 +370,22 @@ def webhook():
             return jsonify({"status": "error", "message": f"Ticker {data['ticker']} not configured."}), 400
 
         logger.info(f"Webhook validated for ticker: {data['ticker']}, signal: {data['signal_type']}")
+        WEBHOOK_VALIDATE.observe(time.monotonic() - received_at)
+        tracing.record_span('validate', time.monotonic() - received_at)
+        tracing.annotate(ticker=data['ticker'], signal_type=data['signal_type'])
+        if webhook_dedup:
+            dedup_key = webhook_dedup.key(data)
+            first_trace_id = webhook_dedup.claim(dedup_key, tracing.current_trace().trace_id)
+            if first_trace_id is not None:
+                logger.info(f"Duplicate {data['signal_type']} alert for {data['ticker']} ignored (first seen in trace {first_trace_id}).")
+                tracing.annotate(duplicate_of=first_trace_id)
+                return jsonify({"status": "duplicate", "message": "Signal already received", "trace_id": first_trace_id}), 200
+        if signal_dispatcher:
+            if not signal_dispatcher.submit(data):
+                if dedup_key:
+                    webhook_dedup.forget(dedup_key) # Let the sender's retry through
+                return jsonify({"status": "error", "message": "Signal queue full"}), 503
+            return jsonify({"status": "accepted", "message": "Webhook queued"}), 202
         handle_trade_signal(data)
         return jsonify({"status": "success", "message": "Webhook received"}), 200
 
@@ -190,38 +394,149 @@ def webhook():
         return jsonify({"status": "error", "message": "Invalid JSON payload"}), 400
     except Exception as e:
         logger.error(f"Error processing webhook: {e}", exc_info=True)
+        if dedup_key:
+            webhook_dedup.forget(dedup_key)
         if telegram_notifier and telegram_notifier.enabled:
              telegram_notifier.notify_error("Webhook Processing Error", str(e))
         return jsonify({"status": "error", "message": "Internal server error"}), 500
 
-def trailing_stop_loop():
-    global futures_client, telegram_notifier, active_bot_trades #, active_trades_lock
-    logger.info("Trailing stop manager thread started.")
+def dispatch_internal_signal(data):
+    # Entry point for signals generated in-process (mtf_indicator.evaluate_and_dispatch), skipping the
+    # HTTP hop. Same routing as /webhook; returns False if the signal was rejected.
+    if data["ticker"] not in config.TRADING_PAIRS:
+        logger.warning(f"Internal signal for {data['ticker']} ignored: not in TRADING_PAIRS.")
+        return False
+    with tracing.new_trace('internal_signal', ticker=data['ticker'], signal_type=data['signal_type']):
+        if signal_dispatcher:
+            return signal_dispatcher.submit(data)
+        handle_trade_signal(data)
+    return True
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/debug/traces', methods=['GET'])
+def debug_traces():
+    # Most recent signal traces first. ?limit=N (default 50), ?min_ms=X to show only traces at least that slow.
+    limit = request.args.get('limit', 50, type=int)
+    min_ms = request.args.get('min_ms', 0.0, type=float)
+    return jsonify({"traces": tracing.recent(limit, min_ms)}), 200
+
+@app.route('/debug/traces/<trace_id>', methods=['GET'])
+def debug_trace(trace_id):
+    trace = tracing.get(trace_id)
+    if trace is None:
+        return jsonify({"status": "error", "message": f"Trace {trace_id} not found (finished traces only)."}), 404
+    return jsonify(trace), 200
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    account_stats = {account.name: account.stats() for account in accounts}
+    primary = account_stats.get(accounts[0].name, {}) if accounts else {}
+    return jsonify({
+        "active_trades": sum(a["active_trades"] for a in account_stats.values()),
+        "signal_queue": signal_dispatcher.stats() if signal_dispatcher else None,
+        "webhook_dedup": webhook_dedup.stats() if webhook_dedup else None,
+        "trade_journal": primary.get("trade_journal"),
+        "rate_limiter": primary.get("rate_limiter"),
+        "tsl_scheduler": primary.get("tsl_scheduler"),
+        "symbol_settings": primary.get("symbol_settings"),
+        "transport": primary.get("transport"),
+        "latency_ms": primary.get("latency_ms"),
+        "accounts": account_stats if len(accounts) > 1 else None,
+        "account_fanout": account_fanout.stats() if account_fanout else None
+    }), 200
+
+def trailing_stop_loop(account):
+    # One thread per account; trades are keyed by symbol within each account.
+    futures_client, telegram_notifier = account.futures_client, account.telegram_notifier
+    active_bot_trades, active_trades_lock = account.active_bot_trades, account.active_trades_lock
+    user_data_stream, trade_journal, tsl_scheduler = account.user_data_stream, account.trade_journal, account.tsl_scheduler
+    logger.info(f"Trailing stop manager thread started for account {account.name}.")
     while True:
+        due_symbols = None # None: check every trade
+        checked_prices = {}
         try:
-            # Pass arguments to manage_trailing_stops
-            manage_trailing_stops(futures_client, telegram_notifier, active_bot_trades) # Pass active_trades_lock if using
+            if tsl_scheduler:
+                tsl_scheduler.sync(active_bot_trades)
+                due_symbols = tsl_scheduler.pop_due()
+            mark_prices = None
+            if user_data_stream:
+                # Closes and SL fills arrive from the stream; only prices are needed, in one bulk request.
+                user_data_stream.reconcile_if_needed()
+                if price_feed:
+                    mark_prices = price_feed # Stale or missing prices read as 0 and that symbol is skipped this cycle
+                elif active_bot_trades and (due_symbols is None or due_symbols):
+                    mark_prices = futures_client.get_mark_prices() or {} # On failure skip this cycle, never fall back to per-symbol polling
+            if due_symbols is None or due_symbols:
+                cycle_started_at = time.monotonic()
+                manage_trailing_stops(futures_client, telegram_notifier, active_bot_trades, active_trades_lock, mark_prices=mark_prices,
+                                      journal=trade_journal, symbols=due_symbols, checked_prices=checked_prices)
+                TSL_CYCLE.observe(time.monotonic() - cycle_started_at)
+                TSL_CYCLE_TRADES.observe(len(due_symbols) if due_symbols is not None else len(active_bot_trades))
         except Exception as e:
             logger.error(f"Exception in trailing_stop_loop: {e}", exc_info=True)
             if telegram_notifier and telegram_notifier.enabled:
                  telegram_notifier.notify_error("TSL Loop Exception", str(e))
 
+        if tsl_scheduler:
+            for symbol in due_symbols or []:
+                trade_details = active_bot_trades.get(symbol)
+                if trade_details:
+                    tsl_scheduler.reschedule(symbol, trade_details, checked_prices.get(symbol))
+            # Wake at least every min interval so newly opened trades get their first check promptly.
+            next_due = tsl_scheduler.seconds_until_next()
+            time.sleep(min(next_due, tsl_scheduler.min_interval) if next_due is not None else tsl_scheduler.min_interval)
+            continue
+
         sleep_duration = config.TRAILING_STOP_CHECK_INTERVAL_SECONDS
-        if sleep_duration < 10:
-            logger.warning(f"TRAILING_STOP_CHECK_INTERVAL_SECONDS ({sleep_duration}s) is very low. Setting to 10s minimum for safety.")
-            sleep_duration = 10
+        # With both streams running a TSL cycle makes no REST calls, so 1s granularity is safe. So it is with the
+        # rate limiter: it holds back the TSL's position polls before they could exhaust the weight limit.
+        min_sleep_duration = 1 if (user_data_stream and price_feed) or futures_client.rate_limiter else 10
+        if sleep_duration < min_sleep_duration:
+            logger.warning(f"TRAILING_STOP_CHECK_INTERVAL_SECONDS ({sleep_duration}s) is very low. Setting to {min_sleep_duration}s minimum for safety.")
+            sleep_duration = min_sleep_duration
         time.sleep(sleep_duration)
 
 if __name__ == "__main__":
     initialize_services() # Initialize global clients
 
-    if config.TRAILING_STOP:
-        if futures_client and telegram_notifier: # Ensure clients are initialized before starting TSL
-            ts_thread = threading.Thread(target=trailing_stop_loop, daemon=True)
-            ts_thread.start()
-            logger.info(f"Trailing stop manager thread initiated (check interval: {config.TRAILING_STOP_CHECK_INTERVAL_SECONDS}s).")
-        else:
-            logger.error("Cannot start Trailing Stop Manager: Binance client or Telegram notifier not initialized.")
+    if getattr(config, 'USE_MARK_PRICE_STREAM', False):
+        price_feed = MarkPriceFeed(config.TRADING_PAIRS, max_age_seconds=getattr(config, 'MARK_PRICE_MAX_AGE_SECONDS', 5))
+        price_feed.start()
+
+    for account in accounts:
+        client, notifier = account.futures_client, account.telegram_notifier
+        if getattr(config, 'USE_USER_DATA_STREAM', False):
+            if client and notifier:
+                account.order_tracker = OrderTracker(client, notifier, account.active_bot_trades, account.active_trades_lock, journal=account.trade_journal)
+                account.order_tracker.start()
+                for symbol, trade_details in list(account.active_bot_trades.items()):
+                    if trade_details.get('status') == "pending_entry": # Restored from the journal, entry still resting
+                        account.order_tracker.track_entry(symbol, {'orderId': trade_details['entry_order_id']})
+                account.user_data_stream = UserDataStream(client, notifier, account.active_bot_trades, account.active_trades_lock,
+                                                          journal=account.trade_journal, order_tracker=account.order_tracker)
+                account.user_data_stream.start()
+            else:
+                logger.error("Cannot start user-data stream: Binance client or Telegram notifier not initialized.")
+
+        if config.TRAILING_STOP and getattr(config, 'TSL_ADAPTIVE_SCHEDULING', False):
+            # Per account, so each gets the full check budget (the rate limiter still governs the shared IP weight).
+            account.tsl_scheduler = TSLScheduler(min_interval=getattr(config, 'TSL_MIN_CHECK_INTERVAL_SECONDS', 1.0),
+                                                 max_interval=getattr(config, 'TSL_MAX_CHECK_INTERVAL_SECONDS', config.TRAILING_STOP_CHECK_INTERVAL_SECONDS),
+                                                 checks_per_minute=getattr(config, 'TSL_CHECK_BUDGET_PER_MINUTE', 60),
+                                                 trailing_stop_positive=config.TRAILING_STOP_POSITIVE,
+                                                 trailing_stop_positive_offset=config.TRAILING_STOP_POSITIVE_OFFSET,
+                                                 activation=config.TRAILING_ONLY_OFFSET_IS_REACHED)
+
+        if config.TRAILING_STOP:
+            if client and notifier: # Ensure clients are initialized before starting TSL
+                ts_thread = threading.Thread(target=trailing_stop_loop, args=(account,), daemon=True, name=f"tsl-{account.name}")
+                ts_thread.start()
+                logger.info(f"Trailing stop manager thread initiated for {account.name} (check interval: {config.TRAILING_STOP_CHECK_INTERVAL_SECONDS}s).")
+            else:
+                logger.error("Cannot start Trailing Stop Manager: Binance client or Telegram notifier not initialized.")
 
     # Use Gunicorn or Waitress for production
     app.run(host='0.0.0.0', port=5000, debug=False) # debug=False for production
@@ -0,0 +1,158 @@
+# metrics.py
+# Process-wide counters, gauges and histograms, rendered in the Prometheus text format at GET /metrics.
+# A series (one set of label values) is allocated on first use; after that an observation is a bisect
+# over fixed bucket bounds and a few additions under the metric's own lock, which is never held across
+# I/O. Modules declare their metrics at import time with counter()/gauge()/histogram().
+import bisect
+import math
+import threading
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # seconds
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {} # label values tuple -> value (or bucket list for histograms)
+        self._lock = threading.Lock()
+
+    def _labels(self, labelvalues, extra=()):
+        pairs = list(zip(self.labelnames, labelvalues)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def _check(self, labelvalues):
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {labelvalues}")
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labelvalues, amount=1):
+        self._check(labelvalues)
+        with self._lock:
+            self._series[labelvalues] = self._series.get(labelvalues, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            series = sorted(self._series.items())
+        return [f"{self.name}{self._labels(labels)} {_format_value(value)}" for labels, value in series]
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+
+    def set(self, value, *labelvalues):
+        self._check(labelvalues)
+        with self._lock:
+            self._series[labelvalues] = value
+
+    def set_function(self, function):
+        # Value computed at scrape time: function() returns a number, or {label values tuple: number}.
+        self._function = function
+
+    def _samples(self):
+        with self._lock:
+            series = dict(self._series)
+        if self._function:
+            try:
+                value = self._function()
+            except Exception:
+                value = None
+            if isinstance(value, dict):
+                series.update(value)
+            elif value is not None:
+                series[()] = value
+        return [f"{self.name}{self._labels(labels)} {_format_value(value)}" for labels, value in sorted(series.items())]
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value) # Bucket bounds are inclusive (le)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                self._check(labelvalues)
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0] # Per-bucket counts, +Inf, sum
+            series[index] += 1
+            series[-1] += value
+
+    def _samples(self):
+        with self._lock:
+            series = sorted((labels, list(counts)) for labels, counts in self._series.items())
+        lines = []
+        for labels, counts in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{self._labels(labels, [('le', _format_value(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(labels)} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{self._labels(labels)} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered as a different {metric.kind}.")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = []
+        for _, metric in metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+render = REGISTRY.render
@@ -0,0 +1,313 @@
+# mtf_indicator.py
+# NumPy implementation of the MTF.txt Pine indicator ("TC Ind"), so signals can be computed in-process
+# from Binance klines instead of waiting for a TradingView alert and webhook.
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MINUTE_MS = 60 * 1000
+DAY_MS = 24 * 60 * MINUTE_MS
+WEEK_MS = 7 * DAY_MS
+WEEK_OFFSET_MS = 4 * DAY_MS # 1970-01-01 was a Thursday; Binance/TradingView weeks start Monday 00:00 UTC
+
+# Timeframes requested with request.security() in MTF.txt, keyed by their Pine names.
+TIMEFRAMES = ('60', '120', '240', 'D', 'W')
+
+# The script's input.*() defaults. Override any of them with config.MTF_PARAMS.
+DEFAULT_PARAMS = {
+    'min_confirmations': 2,
+    'use_rsi': False,
+    'use_macd': False,
+    'rsi_length': 14,
+    'fast_length': 12,
+    'slow_length': 26,
+    'signal_length': 9,
+    'ma_type': "EMA",
+    'ma_length': 200,
+    'volume_lookback': 10,
+    'momentum_lookback': 10,
+    'smooth_len': 1,
+    'atr_len': 11,
+    'delta_mode': True,
+}
+
+# ───────── Pine ta.* equivalents (same na handling and seeding as Pine v5) ─────────
+
+def _shift(src, n=1):
+    # src[n] in Pine: the value n bars ago, na for the first n bars.
+    out = np.full(len(src), np.nan)
+    if n < len(src):
+        out[n:] = src[:len(src) - n]
+    return out
+
+def sma(src, length):
+    # na until `length` values are available, and for every window that contains an na.
+    src = np.asarray(src, dtype=float)
+    out = np.full(len(src), np.nan)
+    if length > len(src):
+        return out
+    valid = ~np.isnan(src)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(valid, src, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    window_sum = sums[length:] - sums[:-length]
+    window_count = counts[length:] - counts[:-length]
+    out[length - 1:] = np.where(window_count == length, window_sum / length, np.nan)
+    return out
+
+def _seeded_recursion(src, length, alpha):
+    # out = alpha * src + (1 - alpha) * out[1], restarting from sma(src, length) whenever out[1] is na.
+    # The recursion is inherently sequential, so it runs on plain floats.
+    seeds = sma(src, length).tolist()
+    values = np.asarray(src, dtype=float).tolist()
+    out = [float('nan')] * len(values)
+    prev = float('nan')
+    for i, x in enumerate(values):
+        prev = seeds[i] if prev != prev else alpha * x + (1 - alpha) * prev
+        out[i] = prev
+    return np.array(out)
+
+def ema(src, length):
+    return _seeded_recursion(src, length, 2.0 / (length + 1))
+
+def rma(src, length):
+    return _seeded_recursion(src, length, 1.0 / length)
+
+def wma(src, length):
+    src = np.asarray(src, dtype=float)
+    out = np.full(len(src), np.nan)
+    if length > len(src):
+        return out
+    weights = np.arange(1, length + 1, dtype=float)
+    windows = np.lib.stride_tricks.sliding_window_view(src, length)
+    out[length - 1:] = windows @ weights / weights.sum() # Windows containing na stay na
+    return out
+
+def moving_average(src, length, ma_type):
+    # f_ma() in MTF.txt.
+    return {"SMA": sma, "EMA": ema, "RMA": rma, "WMA": wma}[ma_type](src, length)
+
+def rsi(src, length):
+    src = np.asarray(src, dtype=float)
+    prev = _shift(src)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        up = rma(np.where(np.isnan(prev), np.nan, np.maximum(src - prev, 0)), length)
+        down = rma(np.where(np.isnan(prev), np.nan, np.maximum(prev - src, 0)), length)
+        out = 100 - 100 / (1 + up / down)
+    out[(down == 0) & ~np.isnan(up)] = 100.0
+    out[(up == 0) & (down != 0) & ~np.isnan(down)] = 0.0
+    return out
+
+def macd(src, fast_length, slow_length, signal_length):
+    macd_line = ema(src, fast_length) - ema(src, slow_length)
+    signal_line = ema(macd_line, signal_length)
+    return macd_line, signal_line, macd_line - signal_line
+
+def atr(high, low, close, length):
+    high, low, close = (np.asarray(a, dtype=float) for a in (high, low, close))
+    prev_close = _shift(close)
+    true_range = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close))) # fmax: first bar is high - low
+    return rma(true_range, length)
+
+def crossover(a, b):
+    with np.errstate(invalid='ignore'):
+        return (a > b) & (_shift(a) <= _shift(b))
+
+def crossunder(a, b):
+    with np.errstate(invalid='ignore'):
+        return (a < b) & (_shift(a) >= _shift(b))
+
+# ───────── Higher-timeframe bars and request.security(..., lookahead_on) ─────────
+
+def timeframe_open_times(open_times, timeframe):
+    # Open time (ms) of the `timeframe` bar that contains each timestamp.
+    t = np.asarray(open_times, dtype=np.int64)
+    if timeframe == 'W':
+        return (t - WEEK_OFFSET_MS) // WEEK_MS * WEEK_MS + WEEK_OFFSET_MS
+    period = DAY_MS if timeframe == 'D' else int(timeframe) * MINUTE_MS
+    return t // period * period
+
+def resample(bars, timeframe):
+    # Aggregates bars (dict of 'open_time', 'open', 'high', 'low', 'close', 'volume' arrays, sorted by
+    # open time) into `timeframe` bars. The last bar is partial if the period has not finished yet,
+    # which is exactly what request.security shows on the realtime bar.
+    keys = timeframe_open_times(bars['open_time'], timeframe)
+    if len(keys) == 0: # Empty range or unknown symbol: reduceat cannot take empty input
+        return {'open_time': keys, **{name: np.empty(0) for name in ('open', 'high', 'low', 'close', 'volume')}}
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    ends = np.concatenate((starts[1:], [len(keys)])) - 1
+    return {
+        'open_time': keys[starts],
+        'open': np.asarray(bars['open'], dtype=float)[starts],
+        'high': np.maximum.reduceat(np.asarray(bars['high'], dtype=float), starts),
+        'low': np.minimum.reduceat(np.asarray(bars['low'], dtype=float), starts),
+        'close': np.asarray(bars['close'], dtype=float)[ends],
+        'volume': np.add.reduceat(np.asarray(bars['volume'], dtype=float), starts),
+    }
+
+def security_index(chart_open_times, htf_open_times):
+    # Index of the higher-timeframe bar that contains each chart bar (-1 before the first one).
+    # With lookahead_on, Pine shows that bar's values on every chart bar inside it.
+    return np.searchsorted(htf_open_times, chart_open_times, side='right') - 1
+
+def security(values, index):
+    out = np.asarray(values, dtype=float)[np.maximum(index, 0)]
+    out[index < 0] = np.nan
+    return out
+
+def _developing_sum(values, open_times, timeframe):
+    # Running sum of chart-bar values since the start of the containing `timeframe` bar.
+    keys = timeframe_open_times(open_times, timeframe)
+    new_bucket = np.concatenate(([True], keys[1:] != keys[:-1]))
+    totals = np.cumsum(values)
+    bucket_base = (totals - values)[new_bucket][np.cumsum(new_bucket) - 1]
+    return totals - bucket_base
+
+def _realtime_security(bars, htf, timeframe, index, volume_lookback):
+    # What request.security(..., lookahead_on) returns when each chart bar closes in realtime: the still
+    # developing higher-timeframe bar. Its close is the chart close, its volume the volume so far, and
+    # ta.sma(volume) averages the previous completed bars with that partial volume. Using these instead of
+    # the final values keeps backtests free of lookahead bias.
+    chart_open_times = np.asarray(bars['open_time'], dtype=np.int64)
+    volume = np.asarray(bars['volume'], dtype=float)
+    cls = np.asarray(bars['close'], dtype=float)
+    opn = security(htf['open'], index)
+    vol = _developing_sum(volume, chart_open_times, timeframe)
+    previous = volume_lookback - 1
+    completed = np.concatenate(([0.0], np.cumsum(np.asarray(htf['volume'], dtype=float))))
+    has_history = index - previous >= 0
+    prior_sum = completed[np.maximum(index, 0)] - completed[np.maximum(index - previous, 0)]
+    vol_ma = np.where(has_history, (prior_sum + vol) / volume_lookback, np.nan)
+    return cls, opn, vol, vol_ma
+
+# ───────── Indicator ─────────
+
+def _volume_signal(vol, vol_ma, cls, opn, delta_mode):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratio = vol / vol_ma
+        high_volume, low_volume = ratio > 1.2, ratio < 0.8 # Both False while the average is na
+    bullish, bearish = cls > opn, cls < opn
+    if delta_mode:
+        magnitude = np.where(high_volume, 1.0, np.where(low_volume, 0.5, 0.3))
+        return np.where(bullish, magnitude, -magnitude)
+    direction = np.where(bullish, 1.0, np.where(bearish, -1.0, 0.0))
+    return np.where(high_volume, direction, np.where(low_volume, 0.5 * direction, 0.0))
+
+def _momentum_signal(cls, lookback, delta_mode):
+    # cls[lb] looks back `lookback` chart bars of the security series, not higher-timeframe bars.
+    with np.errstate(invalid='ignore'):
+        delta = cls - _shift(cls, lookback)
+        strong_up, strong_down = delta > cls * 0.01, delta < -cls * 0.01
+        up = delta > 0
+        down = delta < 0
+    if delta_mode:
+        return np.where(up, np.where(strong_up, 1.0, 0.5), np.where(strong_down, -1.0, -0.5))
+    return np.where(up, np.where(strong_up, 1.0, 0.5), np.where(down, np.where(strong_down, -1.0, -0.5), 0.0))
+
+def _security_signals(bars, htf, timeframe, p, realtime):
+    # securitySignals(tf, ...) without the plotting outputs: returns (vSig, mSig) on chart bars.
+    index = security_index(np.asarray(bars['open_time'], dtype=np.int64), htf['open_time'])
+    if realtime:
+        cls, opn, vol, vol_ma = _realtime_security(bars, htf, timeframe, index, p['volume_lookback'])
+    else:
+        cls = security(htf['close'], index)
+        opn = security(htf['open'], index)
+        vol = security(htf['volume'], index)
+        vol_ma = security(sma(htf['volume'], p['volume_lookback']), index)
+    v_sig = ema(_volume_signal(vol, vol_ma, cls, opn, p['delta_mode']), p['smooth_len'])
+    m_sig = ema(_momentum_signal(cls, p['momentum_lookback'], p['delta_mode']), p['smooth_len'])
+    # atr is only used for plot colours (volAdj/getColor) in MTF.txt, so it does not affect signals.
+    return v_sig, m_sig
+
+def _timeframe_signal(v_sig, m_sig):
+    with np.errstate(invalid='ignore'):
+        return np.where((v_sig > 0.7) & (m_sig > 0.7), 1, np.where((v_sig < -0.7) & (m_sig < -0.7), -1, 0))
+
+def compute_signals(bars, htf_bars=None, params=None, realtime=False):
+    # bars: chart-timeframe OHLCV (dict of arrays incl. 'open_time' in ms, sorted, chart timeframe at or
+    # below 60 minutes). htf_bars: optional {timeframe: bars} with longer higher-timeframe history;
+    # missing timeframes are resampled from the chart bars. Returns a dict of per-bar arrays, among them
+    # the boolean 'final_long' / 'final_short' series that the TradingView alerts fire on.
+    # By default every bar sees the final higher-timeframe values, like TradingView's history. With
+    # realtime=True each bar sees the developing values an alert saw when that bar closed live.
+    p = dict(DEFAULT_PARAMS, **(params or {}))
+    htf_bars = htf_bars or {}
+    chart_open_times = np.asarray(bars['open_time'], dtype=np.int64)
+    close = np.asarray(bars['close'], dtype=float)
+
+    macd_value, macd_signal, _ = macd(close, p['fast_length'], p['slow_length'], p['signal_length'])
+    rsi_value = rsi(close, p['rsi_length'])
+
+    htf = {tf: htf_bars.get(tf) or resample(bars, tf) for tf in TIMEFRAMES}
+    long_count = np.zeros(len(close), dtype=int)
+    short_count = np.zeros(len(close), dtype=int)
+    for tf in TIMEFRAMES:
+        index = security_index(chart_open_times, htf[tf]['open_time'])
+        tf_close = close if realtime else security(htf[tf]['close'], index)
+        tf_open = security(htf[tf]['open'], index)
+        long_count += crossover(tf_close, tf_open)
+        short_count += crossunder(tf_close, tf_open)
+
+    combined_long = (long_count >= p['min_confirmations']) & (short_count == 0)
+    combined_short = (short_count >= p['min_confirmations']) & (long_count == 0)
+
+    with np.errstate(invalid='ignore'):
+        long_filter = ((not p['use_rsi']) | (rsi_value > 50)) & ((not p['use_macd']) | (macd_value > macd_signal))
+        short_filter = ((not p['use_rsi']) | (rsi_value < 50)) & ((not p['use_macd']) | (macd_value < macd_signal))
+
+    h4_v_sig, h4_m_sig = _security_signals(bars, htf['240'], '240', p, realtime)
+    h1_v_sig, h1_m_sig = _security_signals(bars, htf['60'], '60', p, realtime)
+    h2_v_sig, h2_m_sig = _security_signals(bars, htf['120'], '120', p, realtime)
+
+    with np.errstate(invalid='ignore'):
+        h4_bullish = (h4_m_sig > 0) & (h4_v_sig > 0)
+        h4_bearish = (h4_m_sig < 0) & (h4_v_sig < 0)
+
+    # "Güçlü" (strong) signals: fire when the 1H+2H+4H verdict changes to buy/sell.
+    overall = _timeframe_signal(h1_v_sig, h1_m_sig) + _timeframe_signal(h2_v_sig, h2_m_sig) + _timeframe_signal(h4_v_sig, h4_m_sig)
+    current = np.where(overall >= 2, 1, np.where(overall <= -2, -1, 0))
+    previous = np.concatenate(([0], current[:-1]))
+
+    return {
+        'final_long': combined_long & long_filter & h4_bullish,
+        'final_short': combined_short & short_filter & h4_bearish,
+        'long_count': long_count,
+        'short_count': short_count,
+        'h4_volume_signal': h4_v_sig,
+        'h4_momentum_signal': h4_m_sig,
+        'rsi': rsi_value,
+        'macd': macd_value,
+        'macd_signal': macd_signal,
+        'signal_ma': moving_average(close, p['ma_length'], p['ma_type']),
+        'strong_buy': (current != previous) & (current == 1),
+        'strong_sell': (current != previous) & (current == -1),
+    }
+
+def latest_signal(signals):
+    # 'long', 'short' or None for the most recent bar.
+    if len(signals['final_long']) == 0:
+        return None
+    if signals['final_long'][-1]:
+        return 'long'
+    if signals['final_short'][-1]:
+        return 'short'
+    return None
+
+def evaluate_and_dispatch(symbol, bars, dispatch, interval, htf_bars=None, params=None, realtime=True):
+    # Runs the indicator on closed bars and, if the last bar fires, hands a webhook-shaped payload to
+    # `dispatch` (e.g. main.dispatch_internal_signal) without going through HTTP. Returns the signal.
+    # realtime=True (as in backtester.py) evaluates the higher timeframes as they stood when each bar
+    # closed, which is what a live alert sees; False uses the final (repainted) higher-timeframe bars.
+    signal_type = latest_signal(compute_signals(bars, htf_bars, params, realtime=realtime))
+    if signal_type:
+        data = {
+            'signal_type': signal_type,
+            'ticker': symbol,
+            'close_price': float(bars['close'][-1]),
+            'exchange': "BINANCE",
+            'interval': str(interval),
+            'source': "mtf_indicator",
+        }
+        logger.info(f"MTF indicator fired {signal_type} for {symbol} at {data['close_price']}.")
+        dispatch(data)
+    return signal_type
@@ -0,0 +1,208 @@
+# order_tracker.py
+import collections
+import logging
+import queue
+import threading
+from binance.enums import * # For SIDE_SELL, SIDE_BUY, FUTURE_ORDER_TYPE_STOP_MARKET
+from binance.exceptions import BinanceAPIException
+from trailing_stop_manager import cancel_stale_stops
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATUSES = ('FILLED', 'CANCELED', 'EXPIRED', 'REJECTED')
+MAX_UNTRACKED_UPDATES = 1000 # Updates for orders not (yet) tracked, kept in case track_entry() follows
+
+# Fill state of one order, learned from ORDER_TRADE_UPDATE events (or the REST order response).
+class OrderState:
+    __slots__ = ('order_id', 'symbol', 'status', 'orig_qty', 'filled_qty', 'avg_price')
+
+    def __init__(self, order_id, symbol, status='NEW', orig_qty=0.0, filled_qty=0.0, avg_price=0.0):
+        self.order_id = order_id
+        self.symbol = symbol
+        self.status = status
+        self.orig_qty = orig_qty
+        self.filled_qty = filled_qty
+        self.avg_price = avg_price
+
+    @classmethod
+    def from_event(cls, order):
+        # ORDER_TRADE_UPDATE "o" payload: z = cumulative filled qty, ap = average price, q = original qty.
+        return cls(order['i'], order.get('s'), order.get('X', 'NEW'), float(order.get('q', 0)),
+                   float(order.get('z', 0)), float(order.get('ap', 0)))
+
+    @classmethod
+    def from_response(cls, order):
+        return cls(order['orderId'], order.get('symbol'), order.get('status', 'NEW'), float(order.get('origQty', 0)),
+                   float(order.get('executedQty', 0)), float(order.get('avgPrice', 0)))
+
+    @property
+    def is_final(self):
+        return self.status in FINAL_STATUSES
+
+# Follows entry orders through their lifecycle using the user-data stream instead of polling
+# futures_get_order. As fills arrive, the trade's entry_price becomes the real average fill price,
+# its quantity the filled quantity, and the protective stop is placed or resized to match.
+# Stop orders are placed from a worker thread so the websocket thread is never blocked by REST calls.
+class OrderTracker:
+    def __init__(self, futures_client, telegram_notifier, active_bot_trades, active_trades_lock=None, journal=None):
+        self.futures_client = futures_client
+        self.telegram_notifier = telegram_notifier
+        self.active_bot_trades = active_bot_trades
+        self.active_trades_lock = active_trades_lock
+        self.journal = journal
+        self.orders = {} # entry order id -> OrderState
+        self._untracked = collections.OrderedDict() # order id -> latest OrderState for orders not tracked yet
+        self._lock = threading.Lock()
+        self._pending = set() # Symbols queued for the worker; repeated fills of one symbol collapse into one job
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._worker, name="order-tracker", daemon=True)
+        self._thread.start()
+        logger.info("Order tracker started.")
+
+    def track_entry(self, symbol, order):
+        # Registers an entry order (the REST response). Fills that arrived on the stream before the
+        # response came back are applied right away.
+        state = OrderState.from_response(order)
+        state.symbol = symbol
+        with self._lock:
+            early = self._untracked.pop(state.order_id, None)
+            if early and early.filled_qty >= state.filled_qty:
+                state = early
+            self.orders[state.order_id] = state
+        self._schedule(symbol)
+
+    def on_order_update(self, order):
+        # Called from the user-data stream thread for every ORDER_TRADE_UPDATE.
+        state = OrderState.from_event(order)
+        with self._lock:
+            if state.order_id not in self.orders:
+                self._untracked[state.order_id] = state
+                while len(self._untracked) > MAX_UNTRACKED_UPDATES:
+                    self._untracked.popitem(last=False)
+                return
+            self.orders[state.order_id] = state
+        self._schedule(state.symbol)
+
+    def _schedule(self, symbol):
+        with self._lock:
+            if symbol in self._pending:
+                return
+            self._pending.add(symbol)
+        self._queue.put(symbol)
+
+    def _worker(self):
+        while True:
+            symbol = self._queue.get()
+            with self._lock:
+                self._pending.discard(symbol)
+            try:
+                self._sync_trade(symbol)
+            except Exception as e:
+                logger.error(f"Order tracker error for {symbol}: {e}", exc_info=True)
+
+    def _sync_trade(self, symbol):
+        trade_details = self.active_bot_trades.get(symbol)
+        if not trade_details:
+            return
+        with self._lock:
+            state = self.orders.get(trade_details.get('entry_order_id'))
+        if not state:
+            return
+
+        changes = {}
+        if state.filled_qty > 0 and state.avg_price > 0 and state.avg_price != trade_details['entry_price']:
+            logger.info(f"{symbol} entry {state.order_id}: average fill price {state.avg_price} (was {trade_details['entry_price']}), filled {state.filled_qty}/{state.orig_qty}.")
+            changes['entry_price'] = state.avg_price
+            if trade_details.get('signal_type') == 'long' and not trade_details.get('trailing_active'):
+                changes['highest_price_since_trailing_activation'] = state.avg_price
+            elif trade_details.get('signal_type') == 'short' and not trade_details.get('trailing_active'):
+                changes['lowest_price_since_trailing_activation'] = state.avg_price
+
+        if state.is_final:
+            with self._lock:
+                self.orders.pop(state.order_id, None)
+            if state.filled_qty == 0:
+                self._drop_unfilled_entry(symbol, trade_details, state)
+                return
+
+        pending = trade_details.get('status') == "pending_entry"
+        # Deferred trades protect every fill as it arrives; otherwise the stop (placed for the full
+        # order quantity) is only shrunk once the entry is final and turned out partially filled.
+        if state.filled_qty > 0 and (pending or state.is_final) and abs(state.filled_qty - trade_details['quantity']) > 1e-12:
+            protect_price = changes.get('entry_price', trade_details['entry_price'])
+            stop_changes = self._resize_stop(symbol, trade_details, state.filled_qty, protect_price)
+            if not stop_changes:
+                self._record(symbol, trade_details, changes)
+                return
+            changes.update(stop_changes)
+            changes['quantity'] = state.filled_qty
+
+        if pending and state.is_final:
+            changes['status'] = "open" # Entry finished: hand the trade over to the TSL manager
+            self.telegram_notifier.send_message(f"✅ Entry for {symbol} filled: {state.filled_qty} @ {state.avg_price}. Stop-loss at {changes.get('current_sl_price', trade_details['current_sl_price']):.4f}.")
+        self._record(symbol, trade_details, changes)
+
+    def _record(self, symbol, trade_details, changes):
+        if not changes:
+            return
+        if self.active_trades_lock:
+            with self.active_trades_lock:
+                trade_details.update(changes)
+        else:
+            trade_details.update(changes)
+        if self.journal:
+            self.journal.record_update(symbol, changes)
+
+    def _resize_stop(self, symbol, trade_details, quantity, entry_price):
+        # Places a stop for the filled quantity (computed from the real fill price when there is no stop
+        # yet), then cancels the previous one. Returns the changed trade fields, or None on failure.
+        old_sl_order_id = trade_details.get('sl_order_id')
+        if not old_sl_order_id:
+            new_sl_order = self.futures_client.create_stop_loss_order(symbol, trade_details['signal_type'], entry_price, quantity)
+            stop_price = float(new_sl_order.get('stopPrice', 0.0)) if new_sl_order else 0.0
+        else:
+            stop_price = trade_details['current_sl_price']
+            sl_side = SIDE_SELL if trade_details['signal_type'] == 'long' else SIDE_BUY
+            new_sl_order = self.futures_client.place_futures_order(symbol, sl_side, quantity, stop_price=stop_price,
+                                                                   order_type=FUTURE_ORDER_TYPE_STOP_MARKET, reduce_only=True)
+        if not new_sl_order or 'orderId' not in new_sl_order:
+            logger.error(f"Failed to place stop-loss for {quantity} {symbol} filled so far.")
+            self.telegram_notifier.notify_error(f"CRITICAL: SL Order Failed: {symbol}", f"Entry filled {quantity} but the stop-loss for it could not be placed. MANUAL INTERVENTION REQUIRED.")
+            return None
+
+        changes = {'sl_order_id': new_sl_order['orderId'], 'current_sl_price': stop_price}
+        if old_sl_order_id:
+            try:
+                self.futures_client.cancel_stop_order(symbol, old_sl_order_id)
+            except BinanceAPIException as e:
+                logger.error(f"Failed to cancel previous SL {old_sl_order_id} for {symbol} after resizing: {e}")
+                if e.code != -2011: # The TSL manager retries stale stops every cycle
+                    changes['stale_sl_order_ids'] = trade_details.get('stale_sl_order_ids', []) + [old_sl_order_id]
+            self.futures_client.position_book.invalidate(positions=False)
+
+        logger.info(f"Stop-loss for {symbol} now covers {quantity} at {stop_price} (order {new_sl_order['orderId']}).")
+        return changes
+
+    def _drop_unfilled_entry(self, symbol, trade_details, state):
+        # The entry ended without any fill: nothing to protect, so stop managing the trade.
+        logger.info(f"Entry {state.order_id} for {symbol} ended {state.status} without fills. Removing trade.")
+        sl_order_id = trade_details.get('sl_order_id')
+        if sl_order_id:
+            try:
+                self.futures_client.cancel_stop_order(symbol, sl_order_id)
+            except BinanceAPIException as e:
+                logger.warning(f"Could not cancel SL {sl_order_id} of unfilled {symbol} entry: {e}")
+            self.futures_client.position_book.invalidate(positions=False)
+        if trade_details.get('stale_sl_order_ids'):
+            cancel_stale_stops(self.futures_client, symbol, trade_details)
+        if self.active_trades_lock:
+            with self.active_trades_lock:
+                removed = self.active_bot_trades.pop(symbol, None)
+        else:
+            removed = self.active_bot_trades.pop(symbol, None)
+        if removed and self.journal:
+            self.journal.record_close(symbol)
+        self.telegram_notifier.send_message(f"ℹ️ Entry order for {symbol} {state.status.lower()} without fills. Trade removed.")
@@ -0,0 +1,185 @@
+# param_sweep.py
+# Grid or random search of stop/trailing settings and MTF signal inputs with backtester.run_backtest,
+# spread over a process pool. Workers memory-map the kline store themselves, so price arrays are
+# shared through the OS page cache instead of being pickled to every process. Results are appended to
+# a CSV as they arrive; an interrupted sweep skips the combinations already in it when restarted.
+import argparse
+import concurrent.futures
+import csv
+import itertools
+import logging
+import os
+import random
+import time
+from backtester import DEFAULT_PARAMS, run_backtest, symbol_signals, params_from_config, fetch_specs
+from mtf_indicator import DEFAULT_PARAMS as MTF_DEFAULT_PARAMS
+
+logger = logging.getLogger(__name__)
+
+# Values searched for each parameter unless config.SWEEP_SPACE overrides them. Keys are backtester
+# parameters or MTF.txt inputs (mtf_indicator.DEFAULT_PARAMS).
+DEFAULT_SPACE = {
+    'stop_loss': [0.01, 0.015, 0.02, 0.03, 0.05],
+    'trailing_stop_positive_offset': [0.005, 0.01, 0.02, 0.03],
+    'trailing_stop_positive': [0.0025, 0.005, 0.01, 0.02],
+    'leverage': [5, 10, 20],
+    'min_confirmations': [1, 2, 3],
+    'use_rsi': [False, True],
+    'use_macd': [False, True],
+}
+
+RESULT_FIELDS = ['num_trades', 'total_pnl', 'return_pct', 'max_drawdown_pct', 'win_rate', 'profit_factor']
+MAX_CACHED_SIGNAL_SETS = 4 # Per worker; combinations are ordered so consecutive ones share signals
+IN_FLIGHT_PER_WORKER = 4
+
+def grid(space):
+    names = sorted(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+def random_combinations(space, count, seed=None):
+    # `count` distinct combinations drawn uniformly from the grid, without materialising it.
+    names = sorted(space)
+    sizes = [len(space[name]) for name in names]
+    total = 1
+    for size in sizes:
+        total *= size
+    picks = random.Random(seed).sample(range(total), min(count, total))
+    combinations = []
+    for pick in picks:
+        combination = {}
+        for name, size in zip(reversed(names), reversed(sizes)):
+            pick, position = divmod(pick, size)
+            combination[name] = space[name][position]
+        combinations.append(dict(sorted(combination.items())))
+    return combinations
+
+def combination_key(combination):
+    return "|".join(f"{name}={combination[name]}" for name in sorted(combination))
+
+def _signal_key(combination):
+    return tuple(sorted((name, value) for name, value in combination.items() if name in MTF_DEFAULT_PARAMS))
+
+def _split(combination, base_params):
+    # Backtester params for one combination; MTF inputs are merged into params['mtf_params'].
+    params = dict(base_params)
+    mtf_params = dict(base_params.get('mtf_params') or {})
+    for name, value in combination.items():
+        if name in MTF_DEFAULT_PARAMS:
+            mtf_params[name] = value
+        else:
+            params[name] = value
+    params['mtf_params'] = mtf_params
+    return params
+
+# --- Worker process state ---
+
+_worker = {}
+
+def _init_worker(store_root, interval, symbols, start, end, base_params, specs):
+    from kline_store import KlineStore
+    store = KlineStore(store_root)
+    _worker['data'] = {symbol: store.read(symbol, interval, start, end) for symbol in symbols} # memmap views
+    _worker['base_params'] = base_params
+    _worker['specs'] = specs
+    _worker['signals'] = {} # signal key -> {symbol: events}
+
+def _signals_for(combination, params):
+    key = _signal_key(combination)
+    cache = _worker['signals']
+    if key not in cache:
+        if len(cache) >= MAX_CACHED_SIGNAL_SETS:
+            cache.pop(next(iter(cache)))
+        merged = dict(DEFAULT_PARAMS, **params)
+        cache[key] = {symbol: symbol_signals(bars, merged) for symbol, bars in _worker['data'].items() if len(bars['open_time'])}
+    return cache[key]
+
+def _run_combination(combination):
+    params = _split(combination, _worker['base_params'])
+    result = run_backtest(_worker['data'], params, _worker['specs'], signals=_signals_for(combination, params))
+    return combination, {field: result[field] for field in RESULT_FIELDS}
+
+# --- Driver ---
+
+def completed_keys(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, newline='') as f:
+        return {row['key'] for row in csv.DictReader(f)}
+
+def run_sweep(combinations, store_root, interval, symbols, out_path, start=None, end=None, base_params=None,
+              specs=None, max_workers=None):
+    # Runs every combination not yet in out_path and appends one CSV row per finished combination.
+    # Returns the number of combinations run.
+    base_params = base_params or {}
+    done = completed_keys(out_path)
+    todo = [c for c in combinations if combination_key(c) not in done]
+    todo.sort(key=_signal_key) # Neighbouring tasks reuse the worker's cached signals
+    if not todo:
+        logger.info(f"All {len(combinations)} combinations are already in {out_path}.")
+        return 0
+    logger.info(f"Sweeping {len(todo)} combinations ({len(done)} already done) over {len(symbols)} symbols.")
+
+    names = sorted(set().union(*(c.keys() for c in combinations)))
+    new_file = not os.path.exists(out_path) or os.path.getsize(out_path) == 0
+    max_workers = max_workers or os.cpu_count()
+    started_at = time.monotonic()
+    finished = 0
+    next_report = 100
+    with open(out_path, 'a', newline='') as f, concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_worker,
+            initargs=(store_root, interval, symbols, start, end, base_params, specs or {})) as executor:
+        writer = csv.DictWriter(f, fieldnames=['key'] + names + RESULT_FIELDS)
+        if new_file:
+            writer.writeheader()
+        pending = set()
+        tasks = iter(todo)
+        while True:
+            # Keep a bounded number of tasks in flight so results stream out while the sweep runs.
+            for combination in itertools.islice(tasks, max_workers * IN_FLIGHT_PER_WORKER - len(pending)):
+                pending.add(executor.submit(_run_combination, combination))
+            if not pending:
+                break
+            done_futures, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done_futures:
+                try:
+                    combination, row = future.result()
+                except Exception as e:
+                    logger.error(f"Sweep task failed: {e}")
+                    continue
+                writer.writerow({'key': combination_key(combination), **combination, **row})
+                finished += 1
+            f.flush()
+            if finished >= next_report:
+                next_report += 100
+                elapsed = time.monotonic() - started_at
+                logger.info(f"{finished}/{len(todo)} combinations in {elapsed:.0f}s ({finished / elapsed:.1f}/s).")
+    return finished
+
+def best(out_path, metric='return_pct', top=10):
+    # Rows of out_path with the highest `metric`.
+    with open(out_path, newline='') as f:
+        rows = [row for row in csv.DictReader(f) if row[metric] not in ('', 'None')]
+    return sorted(rows, key=lambda row: float(row[metric]), reverse=True)[:top]
+
+if __name__ == "__main__":
+    import config
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Grid or random search of stop/trailing settings over stored klines.")
+    parser.add_argument('--interval', default='1m', help="Base kline interval in the store")
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--symbols', nargs='*', default=None, help="Defaults to config.TRADING_PAIRS")
+    parser.add_argument('--random', type=int, default=0, help="Sample this many combinations instead of the full grid")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--out', default='sweep_results.csv')
+    args = parser.parse_args()
+
+    space = getattr(config, 'SWEEP_SPACE', DEFAULT_SPACE)
+    combinations = random_combinations(space, args.random, args.seed) if args.random else grid(space)
+    start = int(time.time() * 1000) - args.days * 86_400_000
+    symbols = args.symbols or config.TRADING_PAIRS
+    specs = fetch_specs(getattr(config, 'KLINE_BASE_URL', 'https://fapi.binance.com'), symbols)
+    run_sweep(combinations, getattr(config, 'KLINE_STORE_DIR', 'klines'), args.interval, symbols, args.out, start=start,
+              base_params=params_from_config(config), specs=specs, max_workers=args.workers)
+    for row in best(args.out):
+        print(row)
@@ -0,0 +1,57 @@
+# price_feed.py
+import logging
+import time
+from binance import ThreadedWebsocketManager
+
+logger = logging.getLogger(__name__)
+
+MAX_STREAMS_PER_CONNECTION = 200 # Binance limit for one combined-stream connection
+
+# Keeps the latest mark price of every traded symbol in memory, fed by <symbol>@markPrice@1s streams
+# multiplexed over combined websocket connections. Readers never take a lock: the websocket thread
+# replaces whole (price, received_at) tuples in a dict, which is atomic under the GIL.
+class MarkPriceFeed:
+    def __init__(self, symbols, max_age_seconds=5):
+        self.symbols = [s.upper() for s in symbols]
+        self.max_age_seconds = max_age_seconds
+        self.prices = {} # symbol -> (mark_price, local receive time from time.monotonic())
+        self.twm = None
+        self.socket_names = []
+
+    def start(self):
+        self.twm = ThreadedWebsocketManager()
+        self.twm.daemon = True
+        self.twm.start()
+        for i in range(0, len(self.symbols), MAX_STREAMS_PER_CONNECTION):
+            streams = [f"{s.lower()}@markPrice@1s" for s in self.symbols[i:i + MAX_STREAMS_PER_CONNECTION]]
+            self.socket_names.append(self.twm.start_futures_multiplex_socket(callback=self._handle_message, streams=streams))
+        logger.info(f"Mark price feed started for {len(self.symbols)} symbols over {len(self.socket_names)} connection(s).")
+
+    def stop(self):
+        if self.twm:
+            self.twm.stop()
+            self.twm.join(10) # Listeners notice the stop within their 3s recv timeout; a new feed reuses the event loop
+            self.twm = None
+            self.socket_names = []
+            logger.info("Mark price feed stopped.")
+
+    def _handle_message(self, msg):
+        data = msg.get('data', msg)
+        event_type = data.get('e')
+        if event_type == 'markPriceUpdate':
+            try:
+                self.prices[data['s']] = (float(data['p']), time.monotonic())
+            except (KeyError, ValueError) as e:
+                logger.warning(f"Malformed markPriceUpdate event: {e} - {data}")
+        elif event_type == 'error':
+            logger.error(f"Mark price feed error: {data.get('type')} - {data.get('m')}")
+
+    def get(self, symbol, default=None):
+        # Latest mark price, or default if none was received yet or it is older than max_age_seconds.
+        entry = self.prices.get(symbol)
+        if entry is None:
+            return default
+        price, received_at = entry
+        if self.max_age_seconds and time.monotonic() - received_at > self.max_age_seconds:
+            return default
+        return price
@@ -0,0 +1,188 @@
+# rate_limiter.py
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Priorities: orders and stop updates first, then other account changes, then informational reads.
+HIGH, NORMAL, LOW = 0, 1, 2
+PRIORITY_NAMES = ('high', 'normal', 'low')
+
+# (method, path) -> (IP weight, 10s order count, 1m order count, priority) for the USD-M futures
+# endpoints the bot calls. IP weights that depend on the parameters are callables of the params.
+ENDPOINTS = {
+    ('POST', 'order'): (0, 1, 1, HIGH),
+    ('DELETE', 'order'): (1, 0, 0, HIGH),
+    ('POST', 'batchOrders'): (5, 5, 1, HIGH),
+    ('DELETE', 'batchOrders'): (1, 0, 0, HIGH),
+    ('DELETE', 'allOpenOrders'): (1, 0, 0, HIGH),
+    ('POST', 'algoOrder'): (0, 1, 1, HIGH), # Conditional orders (STOP_MARKET)
+    ('DELETE', 'algoOrder'): (1, 0, 0, HIGH),
+    ('GET', 'order'): (1, 0, 0, NORMAL),
+    ('GET', 'algoOrder'): (1, 0, 0, NORMAL),
+    ('POST', 'leverage'): (1, 0, 0, NORMAL),
+    ('POST', 'marginType'): (1, 0, 0, NORMAL),
+    ('POST', 'listenKey'): (1, 0, 0, NORMAL),
+    ('PUT', 'listenKey'): (1, 0, 0, NORMAL),
+    ('DELETE', 'listenKey'): (1, 0, 0, NORMAL),
+    ('GET', 'time'): (1, 0, 0, NORMAL),
+    ('GET', 'openOrders'): (lambda params: 1 if params.get('symbol') else 40, 0, 0, LOW),
+    ('GET', 'openAlgoOrders'): (lambda params: 1 if params.get('symbol') else 40, 0, 0, LOW),
+    ('GET', 'premiumIndex'): (lambda params: 1 if params.get('symbol') else 10, 0, 0, LOW),
+    ('GET', 'positionRisk'): (5, 0, 0, LOW),
+    ('GET', 'balance'): (5, 0, 0, LOW),
+    ('GET', 'account'): (5, 0, 0, LOW),
+    ('GET', 'symbolConfig'): (5, 0, 0, LOW),
+    ('GET', 'exchangeInfo'): (1, 0, 0, LOW),
+}
+DEFAULT_ENDPOINT = (1, 0, 0, NORMAL)
+
+# One exchange rate limit, counted in the same fixed clock-aligned windows Binance uses. Usage reported
+# in response headers (which includes other processes on the same IP/account) replaces the local count
+# when it is higher.
+class _LimitWindow:
+    __slots__ = ('name', 'limit', 'seconds', 'used', 'window_start')
+
+    def __init__(self, name, limit, seconds):
+        self.name = name
+        self.limit = limit
+        self.seconds = seconds
+        self.used = 0
+        self.window_start = 0.0
+
+    def _roll(self, now):
+        start = now - now % self.seconds
+        if start != self.window_start:
+            self.window_start = start
+            self.used = 0
+
+    def delay(self, now, cost, share):
+        # Seconds until `cost` fits below `share` of the limit (0 if it fits now).
+        self._roll(now)
+        if not cost or self.used + cost <= self.limit * share:
+            return 0.0
+        return self.window_start + self.seconds - now
+
+    def take(self, now, cost):
+        self._roll(now)
+        self.used += cost
+
+    def observe(self, now, used):
+        self._roll(now)
+        self.used = max(self.used, used)
+
+# Shared request governor for every REST call of one python-binance Client. Callers from all threads
+# (webhook workers, TSL loop, order tracker, user-data stream) pass through acquire(), which delays a
+# call until its weight fits in the current window. Low-priority calls may only use part of each
+# limit, so the remainder stays free for orders and stop updates, and they also yield to any waiting
+# higher-priority call.
+class RateLimiter:
+    def __init__(self, weight_per_minute=2400, orders_per_10s=300, orders_per_minute=1200, reserve_ratio=0.2):
+        self.weight = _LimitWindow('REQUEST_WEIGHT 1m', weight_per_minute, 60)
+        self.orders_10s = _LimitWindow('ORDERS 10s', orders_per_10s, 10)
+        self.orders_1m = _LimitWindow('ORDERS 1m', orders_per_minute, 60)
+        # Share of each limit a priority may fill: high 100%, normal half the reserve below, low the full reserve below.
+        self.shares = (1.0, 1.0 - reserve_ratio / 2, 1.0 - reserve_ratio)
+        self.paused_until = 0.0 # Set by 429/418 responses
+        self._waiting = [0, 0, 0]
+        self._cond = threading.Condition()
+        self._stats = {'throttled': [0, 0, 0], 'throttled_seconds': [0.0, 0.0, 0.0], 'rate_limited_responses': 0}
+
+    def configure(self, exchange_info):
+        # Takes the limits from exchangeInfo's rateLimits instead of the defaults.
+        for rate_limit in exchange_info.get('rateLimits', []):
+            seconds = rate_limit.get('intervalNum', 1) * {'SECOND': 1, 'MINUTE': 60}.get(rate_limit.get('interval'), 0)
+            if rate_limit.get('rateLimitType') == 'REQUEST_WEIGHT' and seconds == 60:
+                self.weight.limit = rate_limit['limit']
+            elif rate_limit.get('rateLimitType') == 'ORDERS' and seconds == 10:
+                self.orders_10s.limit = rate_limit['limit']
+            elif rate_limit.get('rateLimitType') == 'ORDERS' and seconds == 60:
+                self.orders_1m.limit = rate_limit['limit']
+        logger.info(f"Rate limits: {self.weight.limit} weight/1m, {self.orders_10s.limit} orders/10s, {self.orders_1m.limit} orders/1m.")
+
+    @staticmethod
+    def classify(method, path, params=None):
+        # (IP weight, 10s order count, 1m order count, priority) of one request.
+        weight, orders_10s, orders_1m, priority = ENDPOINTS.get((method.upper(), path), DEFAULT_ENDPOINT)
+        if callable(weight):
+            weight = weight(params or {})
+        return weight, orders_10s, orders_1m, priority
+
+    def _delay(self, now, weight, orders_10s, orders_1m, priority):
+        share = self.shares[priority]
+        return max(self.paused_until - now,
+                   self.weight.delay(now, weight, share),
+                   self.orders_10s.delay(now, orders_10s, share),
+                   self.orders_1m.delay(now, orders_1m, share))
+
+    def acquire(self, method, path, params=None):
+        # Blocks until the request may be sent and books its cost. Returns the seconds waited.
+        weight, orders_10s, orders_1m, priority = self.classify(method, path, params)
+        started_at = time.monotonic()
+        with self._cond:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    now = time.time()
+                    delay = self._delay(now, weight, orders_10s, orders_1m, priority)
+                    if delay <= 0 and not any(self._waiting[:priority]):
+                        break
+                    # Woken early by any admission or response, since either can change the picture.
+                    self._cond.wait(timeout=delay if delay > 0 else None)
+                self.weight.take(now, weight)
+                self.orders_10s.take(now, orders_10s)
+                self.orders_1m.take(now, orders_1m)
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+        waited = time.monotonic() - started_at
+        if waited > 0.001:
+            self._stats['throttled'][priority] += 1
+            self._stats['throttled_seconds'][priority] += waited
+            logger.debug(f"Rate limiter held {method.upper()} {path} ({PRIORITY_NAMES[priority]}) for {waited:.3f}s.")
+        return waited
+
+    def on_response(self, response, *args, **kwargs):
+        # requests response hook: syncs the windows with the usage Binance reports for this IP/account.
+        if '/fapi/' not in response.url:
+            return # Spot endpoints (e.g. the client's initial ping) have their own limits
+        now = time.time()
+        headers = response.headers
+        with self._cond:
+            for header, window in (('X-MBX-USED-WEIGHT-1M', self.weight), ('X-MBX-ORDER-COUNT-10S', self.orders_10s),
+                                   ('X-MBX-ORDER-COUNT-1M', self.orders_1m)):
+                value = headers.get(header)
+                if value:
+                    window.observe(now, int(value))
+            if response.status_code in (418, 429):
+                retry_after = float(headers.get('Retry-After', 60))
+                self.paused_until = max(self.paused_until, now + retry_after)
+                self._stats['rate_limited_responses'] += 1
+                logger.warning(f"Binance answered {response.status_code} for {response.url.split('?')[0]}. Pausing all requests for {retry_after}s.")
+            self._cond.notify_all()
+
+    def install(self, client):
+        # Routes every futures REST call of a python-binance Client through acquire() and reads the
+        # usage headers of every response.
+        request_futures_api = client._request_futures_api
+        def governed(method, path, signed=False, version=1, **kwargs):
+            self.acquire(method, path, kwargs.get('data'))
+            return request_futures_api(method, path, signed, version, **kwargs)
+        client._request_futures_api = governed
+        client.session.hooks['response'].append(self.on_response)
+        return client
+
+    def stats(self):
+        with self._cond:
+            now = time.time()
+            for window in (self.weight, self.orders_10s, self.orders_1m):
+                window._roll(now)
+            return {
+                'used_weight_1m': self.weight.used, 'weight_limit_1m': self.weight.limit,
+                'orders_10s': self.orders_10s.used, 'orders_1m': self.orders_1m.used,
+                'paused_for_seconds': max(self.paused_until - now, 0.0),
+                'throttled': dict(zip(PRIORITY_NAMES, self._stats['throttled'])),
+                'throttled_seconds': dict(zip(PRIORITY_NAMES, (round(s, 3) for s in self._stats['throttled_seconds']))),
+                'rate_limited_responses': self._stats['rate_limited_responses'],
+            }
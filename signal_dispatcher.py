@@ -0,0 +1,94 @@
+# signal_dispatcher.py
+import logging
+import queue
+import threading
+import time
+import zlib
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Runs validated webhook signals on a pool of worker threads. Every symbol is pinned to one worker
+# (by a stable hash), so signals for the same symbol are handled strictly in arrival order while
+# different symbols proceed in parallel. Queues are bounded: when a worker's queue is full the
+# signal is rejected so the webhook can answer 503 instead of piling up work.
+class SignalDispatcher:
+    def __init__(self, handler, num_workers=4, queue_size=50, error_callback=None):
+        self.handler = handler
+        self.error_callback = error_callback
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(num_workers)]
+        self.threads = []
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'enqueued': 0,
+            'rejected': 0,
+            'processed': 0,
+            'failed': 0,
+            'max_queue_depth': 0,
+            'max_queue_wait_ms': 0.0,
+            'max_handle_ms': 0.0,
+        }
+
+    def start(self):
+        for i, q in enumerate(self.queues):
+            t = threading.Thread(target=self._worker, args=(q,), name=f"signal-worker-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+        logger.info(f"Signal dispatcher started with {len(self.queues)} workers (queue size {self.queues[0].maxsize}).")
+
+    def _queue_for(self, symbol):
+        return self.queues[zlib.crc32(symbol.encode()) % len(self.queues)]
+
+    def submit(self, data):
+        # Returns False if the symbol's queue is full (backpressure).
+        q = self._queue_for(data['ticker'])
+        context, trace = tracing.hand_off() # The worker continues the submitter's trace
+        try:
+            q.put_nowait((time.monotonic(), data, context, trace))
+        except queue.Full:
+            if trace:
+                trace.release()
+            with self._stats_lock:
+                self._stats['rejected'] += 1
+            logger.warning(f"Signal queue full, rejecting {data['signal_type']} signal for {data['ticker']}.")
+            return False
+        depth = q.qsize()
+        with self._stats_lock:
+            self._stats['enqueued'] += 1
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], depth)
+        return True
+
+    def _worker(self, q):
+        while True:
+            enqueued_at, data, context, trace = q.get()
+            started_at = time.monotonic()
+            failed = False
+            try:
+                context.run(self._handle, data, started_at - enqueued_at)
+            except Exception as e:
+                failed = True
+                logger.error(f"Error handling signal for {data.get('ticker')}: {e}", exc_info=True)
+                if self.error_callback:
+                    self.error_callback(data, e)
+            finally:
+                finished_at = time.monotonic()
+                with self._stats_lock:
+                    self._stats['failed' if failed else 'processed'] += 1
+                    self._stats['max_queue_wait_ms'] = max(self._stats['max_queue_wait_ms'], (started_at - enqueued_at) * 1000)
+                    self._stats['max_handle_ms'] = max(self._stats['max_handle_ms'], (finished_at - started_at) * 1000)
+                if trace:
+                    trace.release()
+                q.task_done()
+
+    def _handle(self, data, queue_wait):
+        tracing.record_span('queue_wait', queue_wait)
+        self.handler(data)
+
+    def queue_depths(self):
+        return [q.qsize() for q in self.queues]
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queue_depths'] = self.queue_depths()
+        return stats
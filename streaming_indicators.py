@@ -0,0 +1,271 @@
+# streaming_indicators.py
+# Incremental versions of the ta.* functions used in MTF.txt. Each object consumes one closed bar per
+# update() call in O(1) and returns the same value the batch functions in mtf_indicator.py return for
+# that bar (na is float('nan')). State is a fixed-size array('d') ring buffer plus a few floats, and
+# snapshot()/restore() turn it into plain JSON-serialisable dicts, e.g. to persist across restarts.
+from array import array
+
+NAN = float('nan')
+
+def _isnan(x):
+    return x != x
+
+# Fixed-length window with running sum and na count, shared by SMA and WMA.
+class _Window:
+    __slots__ = ('length', 'values', 'pos', 'filled', 'total', 'nan_count')
+
+    def __init__(self, length):
+        self.length = length
+        self.values = array('d', [0.0] * length)
+        self.pos = 0
+        self.filled = 0
+        self.total = 0.0 # Sum of the non-na values in the window
+        self.nan_count = 0
+
+    def push(self, x):
+        # Adds x and returns the value that dropped out (None while the window is still filling).
+        dropped = None
+        if self.filled == self.length:
+            dropped = self.values[self.pos]
+            if _isnan(dropped):
+                self.nan_count -= 1
+            else:
+                self.total -= dropped
+        else:
+            self.filled += 1
+        self.values[self.pos] = x
+        self.pos = (self.pos + 1) % self.length
+        if _isnan(x):
+            self.nan_count += 1
+        else:
+            self.total += x
+        if self.pos == 0:
+            # Once per lap, re-add the buffer so rounding error of the running sum cannot accumulate
+            # (amortised O(1) per update).
+            self.total = sum(v for v in self.values[:self.filled] if not _isnan(v))
+        return dropped
+
+    @property
+    def ready(self):
+        return self.filled == self.length and self.nan_count == 0
+
+    def ordered(self):
+        # Oldest to newest.
+        return self.values[self.pos:] + self.values[:self.pos] if self.filled == self.length else self.values[:self.filled]
+
+    def snapshot(self):
+        return {'length': self.length, 'values': self.values.tolist(), 'pos': self.pos, 'filled': self.filled,
+                'total': self.total, 'nan_count': self.nan_count}
+
+    @classmethod
+    def from_snapshot(cls, state):
+        window = cls(state['length'])
+        window.values = array('d', state['values'])
+        window.pos, window.filled = state['pos'], state['filled']
+        window.total, window.nan_count = state['total'], state['nan_count']
+        return window
+
+class SMA:
+    def __init__(self, length):
+        self.length = length
+        self.window = _Window(length)
+        self.value = NAN
+
+    def update(self, x):
+        self.window.push(x)
+        self.value = self.window.total / self.length if self.window.ready else NAN
+        return self.value
+
+    def snapshot(self):
+        return {'type': 'SMA', 'length': self.length, 'window': self.window.snapshot(), 'value': self.value}
+
+    def _restore(self, state):
+        self.window = _Window.from_snapshot(state['window'])
+        self.value = state['value']
+
+class _SeededAverage:
+    # out = alpha * x + (1 - alpha) * out[1], re-seeded from the SMA whenever out[1] is na (Pine's ta.ema/ta.rma).
+    type_name = None
+
+    def __init__(self, length):
+        self.length = length
+        self.alpha = self._alpha(length)
+        self.seed = SMA(length)
+        self.value = NAN
+
+    def update(self, x):
+        seed = self.seed.update(x) # Always advanced, so a re-seed after na sees the right window
+        if _isnan(self.value):
+            self.value = seed
+        else:
+            self.value = self.alpha * x + (1 - self.alpha) * self.value
+        return self.value
+
+    def snapshot(self):
+        return {'type': self.type_name, 'length': self.length, 'seed': self.seed.snapshot(), 'value': self.value}
+
+    def _restore(self, state):
+        self.seed = restore(state['seed'])
+        self.value = state['value']
+
+class EMA(_SeededAverage):
+    type_name = 'EMA'
+
+    @staticmethod
+    def _alpha(length):
+        return 2.0 / (length + 1)
+
+class RMA(_SeededAverage):
+    type_name = 'RMA'
+
+    @staticmethod
+    def _alpha(length):
+        return 1.0 / length
+
+class WMA:
+    # Keeps the weighted sum incrementally: adding x shifts every weight down by one, which subtracts the
+    # plain window sum. After na leaves the window the weighted sum is rebuilt once from the buffer.
+    def __init__(self, length):
+        self.length = length
+        self.window = _Window(length)
+        self.weighted = 0.0
+        self.dirty = False
+        self.value = NAN
+        self._divisor = length * (length + 1) / 2
+
+    def update(self, x):
+        previous_total = self.window.total
+        dropped = self.window.push(x)
+        if self.window.nan_count or _isnan(x) or (dropped is not None and _isnan(dropped)):
+            self.dirty = True
+        if self.dirty and self.window.ready:
+            self.weighted = sum((i + 1) * v for i, v in enumerate(self.window.ordered()))
+            self.dirty = False
+        elif not self.dirty:
+            # Old weights 1..n become 0..n-1 (the dropped value had weight 1); x gets weight n.
+            self.weighted += self.length * x - previous_total if dropped is not None else self.window.filled * x
+        self.value = self.weighted / self._divisor if self.window.ready else NAN
+        return self.value
+
+    def snapshot(self):
+        return {'type': 'WMA', 'length': self.length, 'window': self.window.snapshot(), 'weighted': self.weighted,
+                'dirty': self.dirty, 'value': self.value}
+
+    def _restore(self, state):
+        self.window = _Window.from_snapshot(state['window'])
+        self.weighted, self.dirty, self.value = state['weighted'], state['dirty'], state['value']
+
+class RSI:
+    def __init__(self, length):
+        self.length = length
+        self.up = RMA(length)
+        self.down = RMA(length)
+        self.prev = NAN
+        self.value = NAN
+
+    def update(self, x):
+        if _isnan(self.prev) or _isnan(x):
+            up, down = self.up.update(NAN), self.down.update(NAN)
+        else:
+            up, down = self.up.update(max(x - self.prev, 0.0)), self.down.update(max(self.prev - x, 0.0))
+        self.prev = x
+        if _isnan(up) or _isnan(down):
+            self.value = NAN
+        elif down == 0:
+            self.value = 100.0
+        elif up == 0:
+            self.value = 0.0
+        else:
+            self.value = 100 - 100 / (1 + up / down)
+        return self.value
+
+    def snapshot(self):
+        return {'type': 'RSI', 'length': self.length, 'up': self.up.snapshot(), 'down': self.down.snapshot(),
+                'prev': self.prev, 'value': self.value}
+
+    def _restore(self, state):
+        self.up, self.down = restore(state['up']), restore(state['down'])
+        self.prev, self.value = state['prev'], state['value']
+
+class MACD:
+    def __init__(self, fast_length, slow_length, signal_length):
+        self.lengths = (fast_length, slow_length, signal_length)
+        self.fast = EMA(fast_length)
+        self.slow = EMA(slow_length)
+        self.signal = EMA(signal_length)
+        self.value = (NAN, NAN, NAN)
+
+    def update(self, x):
+        # Returns (macd, signal, histogram).
+        macd_line = self.fast.update(x) - self.slow.update(x)
+        signal_line = self.signal.update(macd_line)
+        self.value = (macd_line, signal_line, macd_line - signal_line)
+        return self.value
+
+    def snapshot(self):
+        return {'type': 'MACD', 'lengths': list(self.lengths), 'fast': self.fast.snapshot(), 'slow': self.slow.snapshot(),
+                'signal': self.signal.snapshot(), 'value': list(self.value)}
+
+    def _restore(self, state):
+        self.fast, self.slow, self.signal = restore(state['fast']), restore(state['slow']), restore(state['signal'])
+        self.value = tuple(state['value'])
+
+class ATR:
+    def __init__(self, length):
+        self.length = length
+        self.rma = RMA(length)
+        self.prev_close = NAN
+        self.value = NAN
+
+    def update(self, high, low, close):
+        true_range = high - low
+        if not _isnan(self.prev_close):
+            true_range = max(true_range, abs(high - self.prev_close), abs(low - self.prev_close))
+        self.prev_close = close
+        self.value = self.rma.update(true_range)
+        return self.value
+
+    def snapshot(self):
+        return {'type': 'ATR', 'length': self.length, 'rma': self.rma.snapshot(), 'prev_close': self.prev_close, 'value': self.value}
+
+    def _restore(self, state):
+        self.rma = restore(state['rma'])
+        self.prev_close, self.value = state['prev_close'], state['value']
+
+class Cross:
+    # ta.crossover / ta.crossunder of two series.
+    def __init__(self):
+        self.prev_a = NAN
+        self.prev_b = NAN
+        self.value = (False, False)
+
+    def update(self, a, b):
+        # Returns (crossover, crossunder); comparisons with na are False, as in Pine.
+        self.value = (a > b and self.prev_a <= self.prev_b, a < b and self.prev_a >= self.prev_b)
+        self.prev_a, self.prev_b = a, b
+        return self.value
+
+    def snapshot(self):
+        return {'type': 'Cross', 'prev_a': self.prev_a, 'prev_b': self.prev_b, 'value': list(self.value)}
+
+    def _restore(self, state):
+        self.prev_a, self.prev_b = state['prev_a'], state['prev_b']
+        self.value = tuple(state['value'])
+
+_TYPES = {'SMA': SMA, 'EMA': EMA, 'RMA': RMA, 'WMA': WMA, 'RSI': RSI, 'MACD': MACD, 'ATR': ATR, 'Cross': Cross}
+
+def restore(state):
+    # Rebuilds an indicator from its snapshot().
+    cls = _TYPES[state['type']]
+    if cls is MACD:
+        indicator = MACD(*state['lengths'])
+    elif cls is Cross:
+        indicator = Cross()
+    else:
+        indicator = cls(state['length'])
+    indicator._restore(state)
+    return indicator
+
+def moving_average(length, ma_type):
+    # Streaming f_ma() from MTF.txt.
+    return {'SMA': SMA, 'EMA': EMA, 'RMA': RMA, 'WMA': WMA}[ma_type](length)
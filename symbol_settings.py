@@ -0,0 +1,85 @@
+# symbol_settings.py
+import concurrent.futures
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Startup pre-warm of leverage and margin type for every trading pair, so the first signal for a symbol
+# does not pay the two signed calls on its critical path. One symbolConfig request shows what Binance
+# has for all symbols; only the symbols that differ from LEVERAGE / MARGIN_TYPE are changed, on a few
+# threads (the rate governor keeps them inside the weight budget, behind orders). What the bot has
+# configured is kept per account in a JSON file; on later boots it is checked against the same bulk
+# snapshot, so settings changed outside the bot (e.g. in the Binance UI) are reported and put back.
+
+def load(path):
+    # {account name: {symbol: [leverage, margin type]}}; empty if the file is missing or unreadable.
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read symbol settings from {path}, ignoring it: {e}")
+        return {}
+
+def save(path, settings):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(settings, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def _configure(futures_client, symbol, wanted, current):
+    # Applies whichever of leverage / margin type differs from `current` (None = unknown, set both).
+    leverage, margin_type = wanted
+    if current is None or current[0] != leverage:
+        if not futures_client.set_leverage(symbol, leverage):
+            return False
+    if current is None or current[1] != margin_type:
+        if not futures_client.set_margin_type(symbol, margin_type):
+            return False
+    return True
+
+def prewarm(account, symbols, path=None, max_workers=8):
+    # Marks every symbol whose leverage and margin type are in place in account.initialized_symbols_settings
+    # and returns a summary. Symbols that could not be configured are left to the signal path.
+    started_at = time.monotonic()
+    futures_client = account.futures_client
+    wanted = (int(futures_client.setting('LEVERAGE')), futures_client.setting('MARGIN_TYPE').upper())
+    saved = {symbol: tuple(value) for symbol, value in load(path).get(account.name, {}).items()}
+    try:
+        current = futures_client.get_symbol_configs()
+    except Exception as e:
+        logger.warning(f"[{account.name}] Could not fetch symbol configuration, setting leverage and margin type on all {len(symbols)} symbols: {e}")
+        current = {}
+
+    ready = [symbol for symbol in symbols if current.get(symbol) == wanted]
+    pending = [symbol for symbol in symbols if current.get(symbol) != wanted]
+    changed = [symbol for symbol in pending if saved.get(symbol) == wanted and symbol in current]
+    if changed:
+        logger.warning(f"[{account.name}] Leverage/margin type changed outside the bot since last start, restoring: {', '.join(changed)}")
+
+    failed = []
+    if pending:
+        logger.info(f"[{account.name}] Setting leverage {wanted[0]}x and margin type {wanted[1]} on {len(pending)} symbol(s)...")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending))),
+                                                   thread_name_prefix="symbol-settings") as executor:
+            results = executor.map(lambda symbol: _configure(futures_client, symbol, wanted, current.get(symbol)), pending)
+            for symbol, ok in zip(pending, results):
+                (ready if ok else failed).append(symbol)
+    account.initialized_symbols_settings.update(ready)
+
+    if path:
+        settings = load(path)
+        settings[account.name] = {symbol: list(wanted) for symbol in ready}
+        try:
+            save(path, settings)
+        except OSError as e:
+            logger.error(f"Could not save symbol settings to {path}: {e}")
+
+    summary = {'verified': len(ready) - (len(pending) - len(failed)), 'configured': len(pending) - len(failed),
+               'changed_outside_bot': changed, 'failed': failed, 'seconds': round(time.monotonic() - started_at, 3)}
+    logger.info(f"[{account.name}] Symbol settings ready for {len(ready)}/{len(symbols)} symbols: {summary}")
+    return summary
@@ -0,0 +1,130 @@
+# symbol_specs.py
+import logging
+import math
+import threading
+from decimal import Decimal, ROUND_FLOOR
+
+logger = logging.getLogger(__name__)
+
+# Below this many units (value * 10**decimals) a double holds the product to well under 5e-7, so rounding
+# it to 6 decimals removes all binary noise. Larger products (e.g. 76969.1607 at tick 0.00001) are
+# floored with Decimal instead.
+FAST_ROUNDING_LIMIT = 1e9
+
+def _decimals_of(value_str):
+    # Number of decimal places needed to represent a filter value such as "0.0100" (-> 2).
+    exponent = Decimal(value_str).normalize().as_tuple().exponent
+    return max(0, -exponent)
+
+# Pre-parsed PRICE_FILTER / LOT_SIZE / MIN_NOTIONAL values for one symbol. Rounding works on integers
+# scaled by 10**decimals, so the order path never builds Decimals or scans the filters list.
+class SymbolSpec:
+    __slots__ = ('symbol', 'tick_size', 'step_size', 'min_notional',
+                 'price_decimals', 'quantity_decimals',
+                 '_price_scale', '_tick_units', '_quantity_scale', '_step_units')
+
+    def __init__(self, symbol, tick_size=None, step_size=None, min_notional=None):
+        self.symbol = symbol
+        self.tick_size = float(tick_size) if tick_size else None
+        self.step_size = float(step_size) if step_size else None
+        self.min_notional = float(min_notional) if min_notional else None
+
+        self.price_decimals = _decimals_of(tick_size) if tick_size else None
+        self._price_scale = 10 ** self.price_decimals if tick_size else None
+        self._tick_units = int(Decimal(tick_size) * self._price_scale) if tick_size else None
+
+        self.quantity_decimals = _decimals_of(step_size) if step_size else None
+        self._quantity_scale = 10 ** self.quantity_decimals if step_size else None
+        self._step_units = int(Decimal(step_size) * self._quantity_scale) if step_size else None
+
+    @classmethod
+    def from_symbol_info(cls, symbol_info):
+        filters = {f['filterType']: f for f in symbol_info.get('filters', [])}
+        return cls(symbol_info['symbol'],
+                   tick_size=filters.get('PRICE_FILTER', {}).get('tickSize'),
+                   step_size=filters.get('LOT_SIZE', {}).get('stepSize'),
+                   min_notional=filters.get('MIN_NOTIONAL', {}).get('notional'))
+
+    def key(self):
+        return (self.tick_size, self.step_size, self.min_notional)
+
+    @staticmethod
+    def _floor_units(value, scale, unit):
+        # round() absorbs binary noise such as 4.35 * 100 == 434.99999999999994 before flooring.
+        scaled = value * scale
+        if abs(scaled) < FAST_ROUNDING_LIMIT:
+            units = math.floor(round(scaled, 6))
+        else:
+            units = int((Decimal(repr(float(value))) * scale).to_integral_value(rounding=ROUND_FLOOR))
+        return units - units % unit
+
+    def floor_price(self, price):
+        # Same result as quantizing Decimal(str(price)) to tickSize with ROUND_DOWN, as a float.
+        if self._tick_units is None:
+            return price
+        return self._floor_units(price, self._price_scale, self._tick_units) / self._price_scale
+
+    def floor_quantity(self, quantity):
+        if self._step_units is None:
+            return quantity
+        return self._floor_units(quantity, self._quantity_scale, self._step_units) / self._quantity_scale
+
+    def format_price(self, price):
+        # Wire format with exactly price_decimals digits (never scientific notation).
+        if self.price_decimals is None:
+            return str(price)
+        return f"{self.floor_price(price):.{self.price_decimals}f}"
+
+    def format_quantity(self, quantity):
+        if self.quantity_decimals is None:
+            return str(quantity)
+        return f"{self.floor_quantity(quantity):.{self.quantity_decimals}f}"
+
+# Hash index of SymbolSpecs and raw symbol info built from futures_exchange_info. A rebuild swaps
+# both tables in one assignment, so readers always see a consistent pair without locking.
+class SymbolSpecIndex:
+    def __init__(self, exchange_info=None):
+        self._tables = ({}, {}) # (symbol -> SymbolSpec, symbol -> raw symbol info)
+        self._refresh_thread = None
+        self._stop_event = threading.Event()
+        if exchange_info:
+            self.rebuild(exchange_info)
+
+    def rebuild(self, exchange_info):
+        # Returns the symbols whose filters changed (all of them on the first build).
+        old_specs = self._tables[0]
+        specs, infos = {}, {}
+        for s_info in exchange_info.get('symbols', []):
+            infos[s_info['symbol']] = s_info
+            specs[s_info['symbol']] = SymbolSpec.from_symbol_info(s_info)
+        changed = [s for s, spec in specs.items() if s not in old_specs or old_specs[s].key() != spec.key()]
+        self._tables = (specs, infos)
+        return changed
+
+    def get(self, symbol):
+        return self._tables[0].get(symbol)
+
+    def get_symbol_info(self, symbol):
+        return self._tables[1].get(symbol)
+
+    def __len__(self):
+        return len(self._tables[0])
+
+    def start_background_refresh(self, fetch_exchange_info, interval_seconds):
+        # Periodically refetches exchange info and swaps in new specs when any filter changed.
+        if self._refresh_thread:
+            return
+        def refresh_loop():
+            while not self._stop_event.wait(interval_seconds):
+                try:
+                    changed = self.rebuild(fetch_exchange_info())
+                    if changed:
+                        logger.info(f"Exchange filters changed for {len(changed)} symbol(s): {changed[:20]}")
+                except Exception as e:
+                    logger.error(f"Error refreshing exchange info: {e}")
+        self._refresh_thread = threading.Thread(target=refresh_loop, daemon=True)
+        self._refresh_thread.start()
+        logger.info(f"Exchange info background refresh started (every {interval_seconds}s).")
+
+    def stop_background_refresh(self):
+        self._stop_event.set()
@@ -1,47 +1,24 @@
 # telegram_bot.py
 import config
 import logging
+import queue
+import threading
+import time
 import httpx # Using httpx for simple synchronous POST requests
+import metrics
+import tracing
 
 logger = logging.getLogger(__name__)
 
-class TelegramNotifier:
-    def __init__(self, bot_token, chat_id):
-        self.bot_token = bot_token
-        self.chat_id = chat_id
-        self.base_url = f"https://api.telegram.org/bot{self.bot_token}/"
-        if not bot_token or bot_token == "YOUR_TELEGRAM_BOT_TOKEN":
-            logger.warning("Telegram bot token is not configured. Notifications will be disabled.")
-            self.enabled = False
-        else:
-            self.enabled = True
-            logger.info(f"Telegram Notifier initialized for chat ID: {self.chat_id}")
-
-    def send_message(self, text, parse_mode="Markdown"):
-        if not self.enabled:
-            logger.info(f"Telegram disabled. Message not sent: {text}")
-            return None
+SEND_LATENCY = metrics.histogram('telegram_send_duration_seconds', "Telegram sendMessage round trip by HTTP status.", ('status',))
+QUEUE_WAIT = metrics.histogram('telegram_queue_wait_seconds', "Time from queueing a message until its (possibly coalesced) send started.")
+QUEUE_DEPTH = metrics.gauge('telegram_queue_depth', "Messages waiting for the Telegram dispatcher.")
+DROPPED = metrics.counter('telegram_dropped_messages_total', "Messages dropped because the Telegram queue was full.")
 
-        url = self.base_url + "sendMessage"
-        payload = {
-            'chat_id': self.chat_id,
-            'text': text,
-            'parse_mode': parse_mode  # Options: "Markdown" or "HTML"
-        }
-        try:
-            with httpx.Client() as client:
-                response = client.post(url, json=payload, timeout=10) # telegram API expects JSON payload
-            response.raise_for_status()  # Raises an exception for 4XX/5XX responses
-            logger.info(f"Telegram message sent successfully. Response: {response.json()}")
-            return response.json()
-        except httpx.RequestError as e:
-            logger.error(f"Error sending Telegram message (RequestError): {e.request.url} - {e}")
-        except httpx.HTTPStatusError as e:
-            logger.error(f"Error sending Telegram message (HTTPStatusError): {e.response.status_code} - {e.response.text}")
-        except Exception as e:
-            logger.error(f"An unexpected error occurred when sending Telegram message: {e}")
-        return None
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
 
+# Notification texts, sent through the subclass's send_message.
+class NotificationMessages:
     def notify_trade_entry(self, symbol, direction, entry_price, quantity, stop_loss_price, notes=""):
         direction_emoji = "🟢" if direction.lower() == "long" else "🔴"
         message = (
@@ -92,6 +69,197 @@ class TelegramNotifier:
             message += f"\n**Notes:** {notes}"
         return self.send_message(message)
 
+class TelegramNotifier(NotificationMessages):
+    def __init__(self, bot_token, chat_id):
+        self.bot_token = bot_token
+        self.chat_id = chat_id
+        self.base_url = f"https://api.telegram.org/bot{self.bot_token}/"
+        if not bot_token or bot_token == "YOUR_TELEGRAM_BOT_TOKEN":
+            logger.warning("Telegram bot token is not configured. Notifications will be disabled.")
+            self.enabled = False
+        else:
+            self.enabled = True
+            logger.info(f"Telegram Notifier initialized for chat ID: {self.chat_id}")
+
+        # One pooled keep-alive client for all messages instead of a new TCP+TLS handshake per message.
+        self.http_client = httpx.Client(timeout=10, limits=httpx.Limits(max_connections=2, max_keepalive_connections=2))
+        # Messages are sent by a background thread so trading threads never wait on Telegram.
+        self.min_send_interval = getattr(config, 'TELEGRAM_MIN_SEND_INTERVAL_SECONDS', 1.0) # Telegram allows ~1 msg/s per chat
+        self.coalesce_window = getattr(config, 'TELEGRAM_COALESCE_WINDOW_SECONDS', 2.0)
+        self.queue = queue.Queue(maxsize=1000)
+        QUEUE_DEPTH.set_function(self.queue.qsize)
+        self._dispatch_thread = None
+        self._dispatch_lock = threading.Lock()
+        self._last_send_time = 0.0
+
+    @tracing.traced('telegram_enqueue')
+    def send_message(self, text, parse_mode="Markdown", coalesce_key=None):
+        # Queues the message and returns immediately. Queued messages sharing a coalesce_key
+        # (e.g. many "Trailing SL Updated" messages in one burst) are sent as a single digest.
+        if not self.enabled:
+            logger.info(f"Telegram disabled. Message not sent: {text}")
+            return None
+        self._ensure_dispatch_thread()
+        try:
+            self.queue.put_nowait((text, parse_mode, coalesce_key, time.monotonic()))
+        except queue.Full:
+            logger.error(f"Telegram queue full. Dropping message: {text}")
+            DROPPED.inc()
+        return None
+
+    def send_message_sync(self, text, parse_mode="Markdown"):
+        # Blocking send, for scripts and shutdown paths. Returns the API response or None.
+        if not self.enabled:
+            logger.info(f"Telegram disabled. Message not sent: {text}")
+            return None
+        return self._post_with_retries(text, parse_mode)
+
+    def flush(self, timeout=30):
+        # Waits until every queued message has been sent (or timeout seconds passed).
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def close(self):
+        self.flush()
+        self.http_client.close()
+
+    def _ensure_dispatch_thread(self):
+        if self._dispatch_thread:
+            return
+        with self._dispatch_lock:
+            if not self._dispatch_thread:
+                self._dispatch_thread = threading.Thread(target=self._dispatch_loop, name="telegram-dispatch", daemon=True)
+                self._dispatch_thread.start()
+
+    def _dispatch_loop(self):
+        # Messages without a coalesce_key are sent as soon as they are taken off the queue. Coalescable ones
+        # are held aside until coalesce_window after the first of them was queued and then sent as digests,
+        # so a burst of routine updates never holds back an error alert queued behind it.
+        held = []
+        while True:
+            timeout = max(0.0, held[0][3] + self.coalesce_window - time.monotonic()) if held else None
+            batch = []
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+                while True:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            ready = []
+            for message in batch:
+                (held if message[2] and self.coalesce_window > 0 else ready).append(message)
+            if held and time.monotonic() >= held[0][3] + self.coalesce_window:
+                ready, held = ready + held, []
+            if ready:
+                self._send_batch(ready)
+
+    def _send_batch(self, batch):
+        started_at = time.monotonic()
+        for _, _, _, queued_at in batch:
+            QUEUE_WAIT.observe(started_at - queued_at)
+        try:
+            for text, parse_mode in self._coalesce(batch):
+                self._post_with_retries(text, parse_mode)
+        except Exception as e:
+            logger.error(f"An unexpected error occurred in the Telegram dispatcher: {e}")
+        finally:
+            for _ in batch:
+                self.queue.task_done()
+
+    def _coalesce(self, batch):
+        # Keeps arrival order; messages with the same coalesce_key are merged at the first one's position.
+        messages = []
+        groups = {}
+        for text, parse_mode, coalesce_key, _ in batch:
+            group = groups.get((coalesce_key, parse_mode)) if coalesce_key else None
+            # Leave room for the digest header; Telegram rejects messages over 4096 characters.
+            if group and len(group[0]) + len(text) + 32 <= TELEGRAM_MAX_MESSAGE_LENGTH:
+                group[0] += "\n\n" + text
+                group[2] += 1
+                continue
+            group = [text, parse_mode, 1]
+            if coalesce_key:
+                groups[(coalesce_key, parse_mode)] = group
+            messages.append(group)
+        return [(f"🗂 {count} updates\n\n{text}" if count > 1 else text, parse_mode) for text, parse_mode, count in messages]
+
+    def _post_with_retries(self, text, parse_mode, max_attempts=3):
+        url = self.base_url + "sendMessage"
+        payload = {
+            'chat_id': self.chat_id,
+            'text': text,
+            'parse_mode': parse_mode  # Options: "Markdown" or "HTML"
+        }
+        for attempt in range(max_attempts):
+            # Per-chat pacing
+            wait = self._last_send_time + self.min_send_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._last_send_time = time.monotonic()
+            try:
+                response = self.http_client.post(url, json=payload) # telegram API expects JSON payload
+                SEND_LATENCY.observe(time.monotonic() - self._last_send_time, str(response.status_code))
+                if response.status_code == 429 or response.status_code >= 500:
+                    retry_after = self._retry_after(response)
+                    reason = "rate limit hit" if response.status_code == 429 else f"server error {response.status_code}"
+                    logger.warning(f"Telegram {reason}. Retrying after {retry_after}s (attempt {attempt + 1}/{max_attempts}).")
+                    if attempt + 1 < max_attempts:
+                        time.sleep(retry_after)
+                    continue
+                response.raise_for_status()  # Raises an exception for 4XX/5XX responses
+                logger.info(f"Telegram message sent successfully. Response: {response.json()}")
+                return response.json()
+            except httpx.RequestError as e:
+                SEND_LATENCY.observe(time.monotonic() - self._last_send_time, 'network_error')
+                logger.error(f"Error sending Telegram message (RequestError): {e.request.url} - {e}")
+            except httpx.HTTPStatusError as e:
+                logger.error(f"Error sending Telegram message (HTTPStatusError): {e.response.status_code} - {e.response.text}")
+                return None # 4xx other than 429: not retryable (bad request, forbidden, ...)
+            except Exception as e:
+                logger.error(f"An unexpected error occurred when sending Telegram message: {e}")
+                return None
+        return None
+
+    @staticmethod
+    def _retry_after(response):
+        # Seconds to wait before retrying a 429/5xx: Telegram's parameters.retry_after, else the Retry-After
+        # header, else 1. Error bodies are not always JSON (e.g. from a proxy in front of the API).
+        try:
+            retry_after = response.json().get('parameters', {}).get('retry_after')
+        except Exception:
+            retry_after = None
+        if retry_after is None:
+            retry_after = response.headers.get('Retry-After')
+        try:
+            return max(0.0, float(retry_after))
+        except (TypeError, ValueError):
+            return 1.0
+
+# Shares one TelegramNotifier (and its sender thread) between accounts, prefixing every message with
+# the account name so fan-out notifications can be told apart. A wrapper, not a TelegramNotifier: the
+# queue, HTTP client and dispatcher all stay with the wrapped notifier.
+class LabelledNotifier(NotificationMessages):
+    def __init__(self, notifier, label):
+        self.notifier = notifier
+        self.label = label
+
+    @property
+    def enabled(self):
+        return self.notifier.enabled
+
+    def send_message(self, text, parse_mode="Markdown", coalesce_key=None):
+        return self.notifier.send_message(f"[{self.label}] {text}", parse_mode, coalesce_key)
+
+    def send_message_sync(self, text, parse_mode="Markdown"):
+        return self.notifier.send_message_sync(f"[{self.label}] {text}", parse_mode)
+
+    def flush(self, timeout=30):
+        return self.notifier.flush(timeout)
+
+    def close(self):
+        pass # The shared notifier is closed by its owner
+
 # Example usage (for testing this module directly)
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
@@ -117,4 +285,6 @@ if __name__ == '__main__':
         logger.info("Sending a simple message...")
         notifier.send_message("Hello from the bot! This is a *Markdown* test. And this is `code`.")
 
+        notifier.close() # Wait for the background dispatcher before exiting
+
     logger.info("TelegramNotifier testing finished.")
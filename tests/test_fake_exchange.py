@@ -0,0 +1,63 @@
+# test_fake_exchange.py
+# The fake exchange through the real python-binance Client: conditional orders must behave like Binance's
+# algo order service (algoId, openAlgoOrders, DELETE /algoOrder), so the bot's stop handling is exercised
+# against the same answers it gets in production.
+import pytest
+from binance.client import Client
+from binance.exceptions import BinanceAPIException
+from fake_exchange import FakeExchange
+
+@pytest.fixture
+def exchange():
+    exchange = FakeExchange(symbols=['BTCUSDT'])
+    url = exchange.start()
+    client = Client('key', 'secret', ping=False)
+    client.FUTURES_URL = url + '/fapi'
+    yield exchange, client
+    exchange.stop()
+
+def _stop(client, side='SELL', stop_price='60000', reduce_only=False):
+    return client.futures_create_order(symbol='BTCUSDT', side=side, type='STOP_MARKET', quantity='0.010',
+                                       stopPrice=stop_price, reduceOnly=reduce_only)
+
+def test_stop_is_an_algo_order(exchange):
+    _, client = exchange
+    stop = _stop(client)
+    assert 'orderId' not in stop
+    assert stop['algoType'] == 'CONDITIONAL' and stop['orderType'] == 'STOP_MARKET' and stop['algoStatus'] == 'NEW'
+    assert stop['triggerPrice'] == '60000'
+    assert client.futures_get_open_orders() == []
+    assert [o['algoId'] for o in client.futures_get_open_orders(conditional=True)] == [stop['algoId']]
+
+def test_stop_is_cancelled_by_algo_id_only(exchange):
+    _, client = exchange
+    stop = _stop(client)
+    with pytest.raises(BinanceAPIException) as e:
+        client.futures_cancel_order(symbol='BTCUSDT', orderId=stop['algoId'])
+    assert e.value.code == -2011
+    cancelled = client.futures_cancel_order(symbol='BTCUSDT', algoId=stop['algoId'])
+    assert cancelled['algoId'] == stop['algoId']
+    assert client.futures_get_open_orders(conditional=True) == []
+    with pytest.raises(BinanceAPIException) as e:
+        client.futures_cancel_order(symbol='BTCUSDT', algoId=stop['algoId'])
+    assert e.value.code == -2011
+
+def test_order_endpoints_reject_conditional_types(exchange):
+    _, client = exchange
+    results = client.futures_place_batch_order(batchOrders=[
+        {'symbol': 'BTCUSDT', 'side': 'BUY', 'type': 'MARKET', 'quantity': '0.010'},
+        {'symbol': 'BTCUSDT', 'side': 'SELL', 'type': 'STOP_MARKET', 'quantity': '0.010', 'stopPrice': '60000'},
+    ])
+    assert 'orderId' in results[0]
+    assert results[1]['code'] == -4120
+
+def test_triggered_stop_closes_the_position(exchange):
+    fake, client = exchange
+    client.futures_create_order(symbol='BTCUSDT', side='BUY', type='MARKET', quantity='0.010')
+    _stop(client, stop_price='64000', reduce_only=True)
+    fake.set_price('BTCUSDT', 64100.0)
+    assert len(client.futures_get_open_orders(conditional=True)) == 1
+    fake.set_price('BTCUSDT', 63900.0)
+    assert client.futures_get_open_orders(conditional=True) == []
+    assert client.futures_get_open_orders() == []
+    assert 'BTCUSDT' not in fake.positions
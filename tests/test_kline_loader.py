@@ -0,0 +1,62 @@
+# test_kline_loader.py
+import pytest
+from fake_exchange import FakeExchange
+from kline_loader import KlineLoader, INTERVAL_MS
+from kline_store import KlineStore
+
+STEP = INTERVAL_MS['1m']
+
+@pytest.fixture
+def exchange():
+    exchange = FakeExchange(symbols=['BTCUSDT'])
+    url = exchange.start()
+    yield exchange, url
+    exchange.stop()
+
+@pytest.fixture
+def loader(exchange, tmp_path):
+    _, url = exchange
+    loader = KlineLoader(KlineStore(str(tmp_path)), base_url=url, weight_per_minute=100_000, max_workers=4, page_limit=500)
+    yield loader
+    loader.close()
+
+def _window(loader, bars):
+    end = loader.last_closed_open_time('1m') - 10 * STEP
+    return end - (bars - 1) * STEP, end
+
+def test_load_is_contiguous_and_resumes(loader):
+    start, end = _window(loader, 1200)
+    assert loader.load('BTCUSDT', '1m', start, end) == 1200
+    requests = loader.stats['requests']
+    assert loader.load('BTCUSDT', '1m', start, end) == 0
+    assert loader.stats['requests'] == requests # Nothing after the stored tail, no gaps: no requests
+    open_times = loader.store.read('BTCUSDT', '1m')['open_time']
+    assert open_times[0] == start and open_times[-1] == end and len(open_times) == 1200
+
+def test_gap_is_refetched(loader):
+    start, end = _window(loader, 1000)
+    loader.load('BTCUSDT', '1m', start, end)
+    bars = {name: column.copy() for name, column in loader.store.read('BTCUSDT', '1m').items()}
+    keep = (bars['open_time'] < start + 100 * STEP) | (bars['open_time'] >= start + 150 * STEP)
+    loader.store.rewrite('BTCUSDT', '1m', {name: column[keep] for name, column in bars.items()})
+    assert loader.find_gaps('BTCUSDT', '1m') == [(start + 100 * STEP, start + 149 * STEP)]
+
+    assert loader.fill_gaps('BTCUSDT', '1m') == 50
+    assert loader.find_gaps('BTCUSDT', '1m') == []
+    assert loader.store.empty_ranges('BTCUSDT', '1m') == []
+
+def test_permanent_gap_is_recorded_and_not_refetched(exchange, loader):
+    fake, _ = exchange
+    start, end = _window(loader, 1000)
+    halt = (start + 300 * STEP, start + 359 * STEP)
+    fake.kline_halts.append(halt)
+
+    assert loader.load('BTCUSDT', '1m', start, end) == 940
+    assert loader.find_gaps('BTCUSDT', '1m') == [halt]
+    assert loader.store.empty_ranges('BTCUSDT', '1m') == [halt]
+    assert loader.stats['gap_refetches'] == 1
+
+    requests = loader.stats['requests']
+    assert loader.load('BTCUSDT', '1m', start, end) == 0
+    assert loader.stats['requests'] == requests
+    assert loader.stats['gap_refetches'] == 1
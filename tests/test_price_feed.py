@@ -0,0 +1,130 @@
+# test_price_feed.py
+# MarkPriceFeed against a local websocket server standing in for fstream.binance.com: combined-stream
+# multiplexing, reconnects, and max-age handling of the cached prices.
+import asyncio
+import json
+import threading
+import time
+import pytest
+import websockets
+from websockets.asyncio.server import serve
+from binance.async_client import AsyncClient
+from binance.ws.streams import BinanceSocketManager
+import price_feed
+from price_feed import MarkPriceFeed, MAX_STREAMS_PER_CONNECTION
+
+def _wait(predicate, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+# Answers every combined-stream connection with a markPriceUpdate per requested stream every 100ms.
+class LocalStreamServer:
+    def __init__(self):
+        self.paths = []
+        self.connections = []
+        self.price = "100.5"
+        self.loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self.loop.run_until_complete, args=(self._serve(),), daemon=True)
+
+    async def _serve(self):
+        self._server = await serve(self._handle, '127.0.0.1', 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        await self._server.serve_forever()
+
+    async def _handle(self, ws):
+        self.paths.append(ws.request.path)
+        self.connections.append(ws)
+        streams = ws.request.path.split('streams=', 1)[1].split('/')
+        try:
+            while True:
+                for stream in streams:
+                    data = {'e': 'markPriceUpdate', 'E': int(time.time() * 1000), 's': stream.split('@')[0].upper(), 'p': self.price}
+                    await ws.send(json.dumps({'stream': stream, 'data': data}))
+                await asyncio.sleep(0.1)
+        except websockets.ConnectionClosed:
+            pass
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait()
+        return f"ws://127.0.0.1:{self.port}/"
+
+    def drop(self, index):
+        asyncio.run_coroutine_threadsafe(self.connections[index].close(), self.loop).result(5)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self._server.close)
+
+@pytest.fixture
+def stream_server(monkeypatch):
+    server = LocalStreamServer()
+    monkeypatch.setattr(BinanceSocketManager, 'FSTREAM_URL', server.start())
+    # The socket manager's client pings the spot REST API and reads its time on creation; keep it offline.
+    async def ping(self):
+        return {}
+    async def get_server_time(self):
+        return {'serverTime': int(time.time() * 1000)}
+    monkeypatch.setattr(AsyncClient, 'ping', ping)
+    monkeypatch.setattr(AsyncClient, 'get_server_time', get_server_time)
+    yield server
+    server.stop()
+
+def test_streams_are_multiplexed_per_connection(stream_server):
+    symbols = [f"T{i:03d}USDT" for i in range(MAX_STREAMS_PER_CONNECTION + 50)]
+    feed = MarkPriceFeed(symbols)
+    feed.start()
+    try:
+        assert _wait(lambda: all(feed.get(s) for s in symbols))
+        assert feed.get('T000USDT') == 100.5
+        assert len(stream_server.paths) == 2 == len(feed.socket_names)
+        counts = sorted(path.count('@markPrice@1s') for path in stream_server.paths)
+        assert counts == [50, MAX_STREAMS_PER_CONNECTION]
+    finally:
+        feed.stop()
+
+def test_reconnects_after_the_connection_drops(stream_server):
+    feed = MarkPriceFeed(['BTCUSDT', 'ETHUSDT'])
+    feed.start()
+    try:
+        assert _wait(lambda: feed.get('BTCUSDT') == 100.5)
+        stream_server.price = "101.25"
+        stream_server.drop(0)
+        assert _wait(lambda: len(stream_server.paths) == 2)
+        assert _wait(lambda: feed.get('BTCUSDT') == 101.25)
+    finally:
+        feed.stop()
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+def test_prices_expire_after_max_age(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(price_feed, 'time', clock)
+    feed = MarkPriceFeed(['BTCUSDT'], max_age_seconds=5)
+    feed._handle_message({'stream': 'btcusdt@markPrice@1s', 'data': {'e': 'markPriceUpdate', 's': 'BTCUSDT', 'p': '65000.1'}})
+    assert feed.get('BTCUSDT') == 65000.1
+    clock.now += 5
+    assert feed.get('BTCUSDT') == 65000.1
+    clock.now += 0.1
+    assert feed.get('BTCUSDT') is None
+    assert feed.get('BTCUSDT', default=1.0) == 1.0
+    assert feed.get('ETHUSDT') is None
+
+def test_malformed_and_error_messages_are_ignored():
+    feed = MarkPriceFeed(['BTCUSDT'])
+    feed._handle_message({'data': {'e': 'markPriceUpdate', 's': 'BTCUSDT', 'p': 'not-a-number'}})
+    feed._handle_message({'data': {'e': 'markPriceUpdate', 'p': '1.0'}})
+    feed._handle_message({'e': 'error', 'type': 'BinanceWebsocketClosed', 'm': 'Connection closed. Reconnecting...'})
+    assert feed.prices == {}
+    feed._handle_message({'e': 'markPriceUpdate', 's': 'BTCUSDT', 'p': '2.5'}) # Raw (non-combined) payloads work too
+    assert feed.get('BTCUSDT') == 2.5
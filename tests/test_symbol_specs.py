@@ -0,0 +1,34 @@
+# test_symbol_specs.py
+import random
+from decimal import Decimal, ROUND_DOWN
+import numpy as np
+import pytest
+from backtester import price_floor
+from symbol_specs import SymbolSpec
+
+def _decimal_floor(value, step):
+    # The Decimal rounding SymbolSpec replaced: whole steps of the filter value, rounded down.
+    step = Decimal(step)
+    return float((Decimal(str(value)) / step).to_integral_value(rounding=ROUND_DOWN) * step)
+
+@pytest.mark.parametrize('price, expected', [(76969.1607, 76969.1607), (99999.99999, 99999.99999), (4.35, 4.35), (0.000019, 0.00001)])
+def test_floor_price_matches_decimal_at_large_scaled_values(price, expected):
+    spec = SymbolSpec('TESTUSDT', tick_size='0.00001', step_size='1')
+    assert spec.floor_price(price) == expected
+    assert spec.format_price(price) == f"{expected:.5f}"
+    assert price_floor(spec)(np.array([price]))[0] == expected
+
+@pytest.mark.parametrize('tick_size', ['0.00001', '0.0001', '0.10', '0.0100'])
+def test_floor_price_matches_decimal_round_down(tick_size):
+    spec = SymbolSpec('TESTUSDT', tick_size=tick_size, step_size='0.001')
+    rng = random.Random(tick_size)
+    prices = [round(rng.uniform(0.01, 200000), rng.randint(0, 8)) for _ in range(5000)]
+    expected = [_decimal_floor(price, tick_size) for price in prices]
+    assert [spec.floor_price(price) for price in prices] == expected
+    assert price_floor(spec)(np.array(prices)).tolist() == expected
+
+def test_floor_quantity_matches_decimal_round_down():
+    spec = SymbolSpec('TESTUSDT', tick_size='0.01', step_size='0.001')
+    rng = random.Random(1)
+    quantities = [round(rng.uniform(0, 5_000_000), rng.randint(0, 6)) for _ in range(5000)]
+    assert [spec.floor_quantity(q) for q in quantities] == [_decimal_floor(q, '0.001') for q in quantities]
@@ -0,0 +1,35 @@
+# test_telegram_bot.py
+# The dispatcher with _post_with_retries replaced by a recorder, so nothing is sent to Telegram.
+import time
+import pytest
+from telegram_bot import TelegramNotifier, LabelledNotifier
+
+@pytest.fixture
+def notifier(monkeypatch):
+    notifier = TelegramNotifier('123:test-token', 'chat')
+    notifier.min_send_interval = 0
+    notifier.coalesce_window = 0.5
+    sent = []
+    monkeypatch.setattr(notifier, '_post_with_retries', lambda text, parse_mode: sent.append((time.monotonic(), text)))
+    notifier.sent = sent
+    yield notifier
+    notifier.http_client.close()
+
+def test_alerts_are_not_held_back_by_coalescable_updates(notifier):
+    queued_at = time.monotonic()
+    notifier.send_message("Trailing SL Updated for BTCUSDT", coalesce_key="tsl_update")
+    notifier.send_message("Trailing SL Updated for ETHUSDT", coalesce_key="tsl_update")
+    notifier.notify_error("CRITICAL TSL Error: SOLUSDT", "POS UNPROTECTED")
+    notifier.flush(timeout=5)
+    (alert_at, alert), (digest_at, digest) = notifier.sent
+    assert "POS UNPROTECTED" in alert and alert_at - queued_at < 0.25
+    assert digest.startswith("🗂 2 updates") and "ETHUSDT" in digest
+    assert digest_at - queued_at >= notifier.coalesce_window
+
+def test_labelled_notifier_wraps_without_its_own_transport(notifier):
+    labelled = LabelledNotifier(notifier, 'sub')
+    labelled.notify_error("Order failed", "details")
+    labelled.flush(timeout=5)
+    labelled.close()
+    assert notifier.sent[0][1].startswith("[sub] ⚠️ **Bot Error**")
+    assert labelled.enabled and not hasattr(labelled, 'queue')
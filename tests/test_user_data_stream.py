@@ -0,0 +1,69 @@
+# test_user_data_stream.py
+# Stop-loss fills seen through the user-data stream: the events fake_exchange.FakeExchange records for a
+# triggered algo stop (ALGO_UPDATE, then the fill of the MARKET order it is sent on as) are fed to the handler.
+import pytest
+from binance.client import Client
+from fake_exchange import FakeExchange
+from user_data_stream import UserDataStream
+
+class RecordingNotifier:
+    def __init__(self):
+        self.closes = []
+
+    def notify_trade_close(self, symbol, signal_type, exit_price, entry_price, quantity, pnl, notes=""):
+        self.closes.append({'symbol': symbol, 'exit_price': exit_price, 'pnl': pnl, 'notes': notes})
+
+@pytest.fixture
+def exchange():
+    exchange = FakeExchange(symbols=['BTCUSDT'])
+    url = exchange.start()
+    client = Client('key', 'secret', ping=False)
+    client.FUTURES_URL = url + '/fapi'
+    yield exchange, client
+    exchange.stop()
+
+def _open_long_with_stop(exchange, stop_price):
+    fake, client = exchange
+    client.futures_create_order(symbol='BTCUSDT', side='BUY', type='MARKET', quantity='0.010')
+    stop = client.futures_create_order(symbol='BTCUSDT', side='SELL', type='STOP_MARKET', quantity='0.010', stopPrice=stop_price)
+    trades = {'BTCUSDT': {'signal_type': 'long', 'entry_price': 65000.0, 'quantity': 0.01, 'status': "open",
+                          'sl_order_id': stop['algoId'], 'current_sl_price': float(stop_price)}}
+    return stop, trades
+
+def test_triggered_stop_closes_the_trade_with_its_fill(exchange):
+    fake, _ = exchange
+    stop, trades = _open_long_with_stop(exchange, '64000')
+    notifier = RecordingNotifier()
+    stream = UserDataStream(None, notifier, trades)
+    fake.user_events.clear()
+    fake.set_price('BTCUSDT', 63900.0)
+    assert [e['e'] for e in fake.user_events][0] == 'ALGO_UPDATE'
+    for event in fake.user_events:
+        stream._handle_message(event)
+    assert trades == {}
+    assert notifier.closes == [{'symbol': 'BTCUSDT', 'exit_price': 63900.0, 'pnl': pytest.approx(-11.0),
+                                'notes': f"Stop-loss order {stop['algoId']} filled (user-data stream)."}]
+
+def test_cancelled_replaced_stop_does_not_close_the_trade(exchange):
+    fake, client = exchange
+    old_stop, trades = _open_long_with_stop(exchange, '64000')
+    new_stop = client.futures_create_order(symbol='BTCUSDT', side='SELL', type='STOP_MARKET', quantity='0.010', stopPrice='64500', reduceOnly=True)
+    trades['BTCUSDT']['sl_order_id'] = new_stop['algoId']
+    stream = UserDataStream(None, RecordingNotifier(), trades)
+    fake.user_events.clear()
+    client.futures_cancel_order(symbol='BTCUSDT', algoId=old_stop['algoId'])
+    for event in fake.user_events:
+        stream._handle_message(event)
+    assert 'BTCUSDT' in trades and stream.triggered_stops == {}
+
+def test_flat_position_without_a_triggered_stop_is_a_plain_close(exchange):
+    fake, client = exchange
+    _, trades = _open_long_with_stop(exchange, '64000')
+    notifier = RecordingNotifier()
+    stream = UserDataStream(None, notifier, trades)
+    fake.user_events.clear()
+    client.futures_create_order(symbol='BTCUSDT', side='SELL', type='MARKET', quantity='0.010', reduceOnly=True)
+    for event in fake.user_events:
+        stream._handle_message(event)
+    assert trades == {}
+    assert notifier.closes[0]['notes'] == "Position closed on Binance (user-data stream)."
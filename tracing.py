@@ -0,0 +1,205 @@
+# tracing.py
+# Lightweight per-signal tracing. Every webhook (or internal signal) gets a Trace with an ID; stages of
+# the order path and every REST call record a span (name, start offset, duration, thread, parent).
+# The current trace and span live in context variables, so they follow a signal into the dispatcher
+# worker and the account fan-out threads (which run their tasks in a copy of the submitter's context).
+# Without a current trace, span() returns a shared no-op and costs one ContextVar lookup.
+#
+# Finished traces go to a ring buffer served at GET /debug/traces; traces slower than
+# config.TRACE_SLOW_MS are also appended to config.TRACE_LOG_PATH (JSONL) for offline analysis.
+import collections
+import contextvars
+import functools
+import itertools
+import json
+import logging
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+_recent = collections.deque(maxlen=200)
+_recent_lock = threading.Lock()
+_slow_ms = 500.0
+_log_path = "slow_traces.jsonl"
+_log_lock = threading.Lock()
+
+def configure(buffer_size=200, slow_ms=500.0, log_path="slow_traces.jsonl"):
+    global _recent, _slow_ms, _log_path
+    with _recent_lock:
+        _recent = collections.deque(_recent, maxlen=buffer_size)
+    _slow_ms = slow_ms
+    _log_path = log_path
+
+class Trace:
+    def __init__(self, name, attrs=None):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = dict(attrs or {})
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.duration_ms = None
+        self.spans = []
+        self._span_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._holds = 0
+        self._finished = False
+
+    def add_span(self, span_id, parent_id, name, start, end, attrs):
+        record = {'id': span_id, 'parent': parent_id, 'name': name, 'start_ms': round((start - self.started) * 1000, 3),
+                  'duration_ms': round((end - start) * 1000, 3), 'thread': threading.current_thread().name}
+        if attrs:
+            record['attrs'] = attrs
+        with self._lock:
+            self.spans.append(record)
+
+    def hold(self):
+        # Keeps the trace open while another thread still works on it (see hand_off()).
+        with self._lock:
+            self._holds += 1
+
+    def release(self):
+        with self._lock:
+            self._holds -= 1
+            done = self._holds <= 0 and not self._finished
+            if done:
+                self._finished = True
+                self.duration_ms = round((time.perf_counter() - self.started) * 1000, 3)
+        if done:
+            _record(self)
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s['start_ms'])
+        return {'trace_id': self.trace_id, 'name': self.name, 'attrs': self.attrs, 'started_at': self.started_at,
+                'duration_ms': self.duration_ms, 'spans': spans}
+
+class _Span:
+    __slots__ = ('trace', 'name', 'attrs', 'span_id', 'parent_id', 'start', 'token')
+
+    def __init__(self, trace, name, attrs):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.span_id = next(self.trace._span_ids)
+        self.parent_id = _current_span.get()
+        self.token = _current_span.set(self.span_id)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        _current_span.reset(self.token)
+        if exc_type is not None:
+            self.attrs = dict(self.attrs or {}, error=exc_type.__name__)
+        self.trace.add_span(self.span_id, self.parent_id, self.name, self.start, end, self.attrs)
+        return False
+
+class _NoSpan:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+class _TraceScope:
+    # Makes `trace` the current trace of this context for the duration of a with block.
+    def __init__(self, trace):
+        self.trace = trace
+
+    def __enter__(self):
+        self.trace.hold()
+        self.trace_token = _current_trace.set(self.trace)
+        self.span_token = _current_span.set(None)
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self.span_token)
+        _current_trace.reset(self.trace_token)
+        self.trace.release()
+        return False
+
+def new_trace(name, **attrs):
+    # with new_trace("webhook") as trace: ... The trace is finished when the block and every hand-off end.
+    return _TraceScope(Trace(name, attrs))
+
+def current_trace():
+    return _current_trace.get()
+
+def annotate(**attrs):
+    # Adds attributes (e.g. ticker, signal type) to the current trace, if any.
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attrs.update(attrs)
+
+def span(name, **attrs):
+    trace = _current_trace.get()
+    if trace is None:
+        return _NO_SPAN
+    return _Span(trace, name, attrs or None)
+
+def record_span(name, seconds, **attrs):
+    # Records a span that ends now and lasted `seconds`, for waits measured elsewhere (e.g. queueing).
+    trace = _current_trace.get()
+    if trace is not None:
+        end = time.perf_counter()
+        trace.add_span(next(trace._span_ids), _current_span.get(), name, end - seconds, end, attrs or None)
+
+def traced(name=None):
+    # Decorator: runs the function in a span named after it whenever a trace is current.
+    def decorate(function):
+        span_name = name or function.__name__
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            trace = _current_trace.get()
+            if trace is None:
+                return function(*args, **kwargs)
+            with _Span(trace, span_name, None):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def hand_off():
+    # Called by the thread that queues work for the current trace: returns (context, trace), where
+    # running the work with context.run() makes the trace current there, and trace (if any) must be
+    # release()d when the work is done.
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.hold()
+    return contextvars.copy_context(), trace
+
+def _record(trace):
+    with _recent_lock:
+        _recent.append(trace)
+    if trace.duration_ms >= _slow_ms:
+        logger.warning(f"Slow trace {trace.trace_id} ({trace.name}): {trace.duration_ms:.1f} ms over {len(trace.spans)} spans.")
+        if _log_path:
+            line = json.dumps(trace.to_dict(), default=str)
+            try:
+                with _log_lock, open(_log_path, 'a') as f:
+                    f.write(line + "\n")
+            except OSError as e:
+                logger.error(f"Could not write slow trace to {_log_path}: {e}")
+
+def recent(limit=50, min_duration_ms=0.0):
+    # Most recent finished traces first, as dicts.
+    with _recent_lock:
+        traces = list(_recent)
+    selected = [t for t in reversed(traces) if t.duration_ms >= min_duration_ms][:limit]
+    return [t.to_dict() for t in selected]
+
+def get(trace_id):
+    with _recent_lock:
+        traces = list(_recent)
+    for trace in traces:
+        if trace.trace_id == trace_id:
+            return trace.to_dict()
+    return None
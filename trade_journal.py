@@ -0,0 +1,194 @@
+# trade_journal.py
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+COMPACT_EVERY_RECORDS = 10000 # Rewrite the journal as a snapshot after this many appended records
+
+# Write-ahead journal of active_bot_trades as append-only JSON lines: one "open", "update" or "close"
+# record per trade state transition. Callers only copy the record and put it on a queue; a writer
+# thread appends everything that queued up while the previous fsync ran and then fsyncs once
+# (group commit), so the order path never waits for the disk.
+class TradeJournal:
+    def __init__(self, path):
+        self.path = path
+        self._queue = queue.SimpleQueue()
+        self._state = {} # The writer thread's own replay of the journal, used for compaction
+        self._records_since_compaction = 0
+        self._seq = 0
+        self._file = None
+        self._thread = None
+        self.stats = {'records': 0, 'commits': 0, 'max_batch': 0, 'max_commit_ms': 0.0}
+
+    # --- Recording (any thread, non-blocking) ---
+
+    def record_open(self, symbol, trade_details):
+        self._queue.put({'op': 'open', 'symbol': symbol, 'trade': copy.deepcopy(trade_details)})
+
+    def record_update(self, symbol, fields):
+        self._queue.put({'op': 'update', 'symbol': symbol, 'fields': copy.deepcopy(fields)})
+
+    def record_close(self, symbol):
+        self._queue.put({'op': 'close', 'symbol': symbol})
+
+    # --- Boot ---
+
+    def load(self):
+        # Replays the journal and returns {symbol: trade_details}. A torn last line from a crash
+        # mid-write is ignored. Call before start().
+        trades = {}
+        if not os.path.exists(self.path):
+            return trades
+        started_at = time.monotonic()
+        count = 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Trade journal {self.path}: ignoring unreadable record at line {line_no} and everything after it.")
+                    break
+                self._apply(trades, record)
+                self._seq = max(self._seq, record.get('seq', 0))
+                count += 1
+        logger.info(f"Trade journal replayed {count} records into {len(trades)} open trade(s) in {(time.monotonic() - started_at) * 1000:.1f} ms.")
+        return trades
+
+    def start(self, trades=None):
+        # Compacts the journal down to the given trades (normally the reconciled result of load())
+        # and starts the writer thread.
+        self._state = copy.deepcopy(trades or {})
+        self._compact()
+        self._thread = threading.Thread(target=self._writer, name="trade-journal", daemon=True)
+        self._thread.start()
+        logger.info(f"Trade journal started at {self.path} with {len(self._state)} open trade(s).")
+
+    def close(self):
+        # Writes and fsyncs everything recorded so far, then stops the writer thread.
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    # --- Writer thread ---
+
+    @staticmethod
+    def _apply(trades, record):
+        op, symbol = record.get('op'), record.get('symbol')
+        if op == 'open':
+            trades[symbol] = record['trade']
+        elif op == 'update':
+            if symbol in trades:
+                trades[symbol].update(record['fields'])
+        elif op == 'close':
+            trades.pop(symbol, None)
+
+    def _writer(self):
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            try:
+                while True: # Everything queued while the last fsync ran goes into this commit
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if None in batch:
+                stopping = True
+                batch = [r for r in batch if r is not None]
+            if not batch:
+                continue
+            try:
+                self._commit(batch)
+                if self._records_since_compaction >= COMPACT_EVERY_RECORDS:
+                    self._compact()
+            except Exception as e:
+                logger.error(f"Trade journal write failed ({len(batch)} record(s) lost): {e}", exc_info=True)
+
+    def _commit(self, batch):
+        started_at = time.monotonic()
+        now = time.time()
+        lines = []
+        for record in batch:
+            self._seq += 1
+            record['seq'] = self._seq
+            record['ts'] = now
+            self._apply(self._state, copy.deepcopy(record))
+            lines.append(json.dumps(record, separators=(',', ':')))
+        self._file.write('\n'.join(lines) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._records_since_compaction += len(batch)
+        commit_ms = (time.monotonic() - started_at) * 1000
+        self.stats['records'] += len(batch)
+        self.stats['commits'] += 1
+        self.stats['max_batch'] = max(self.stats['max_batch'], len(batch))
+        self.stats['max_commit_ms'] = max(self.stats['max_commit_ms'], commit_ms)
+
+    def _compact(self):
+        # Atomically replaces the journal with one "open" record per live trade.
+        tmp_path = self.path + '.tmp'
+        now = time.time()
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for symbol, trade_details in self._state.items():
+                self._seq += 1
+                f.write(json.dumps({'op': 'open', 'symbol': symbol, 'trade': trade_details, 'seq': self._seq, 'ts': now}, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        if self._file:
+            self._file.close()
+        os.replace(tmp_path, self.path)
+        dir_fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._records_since_compaction = 0
+
+def reconcile_trades(trades, open_positions, open_orders):
+    # Checks replayed trades against one bulk snapshot of positions ({symbol: position}) and open
+    # orders ({symbol: [order, ...]}). Returns (kept trades, closed symbols, warnings). Trades whose
+    # position is gone are dropped; a recorded SL that is no longer on the book is replaced by the
+    # symbol's open STOP_MARKET order if there is exactly one.
+    kept, closed, warnings = {}, [], []
+    for symbol, trade_details in trades.items():
+        position = open_positions.get(symbol)
+        orders = open_orders.get(symbol, [])
+        if trade_details.get('status') == "pending_entry":
+            # Deferred-SL entry: keep waiting while the entry order rests; the order tracker picks it up again.
+            if any(o.get('orderId') == trade_details.get('entry_order_id') for o in orders):
+                if position:
+                    warnings.append(f"{symbol}: entry {trade_details.get('entry_order_id')} partially filled while the bot was down. Check the stop size.")
+                kept[symbol] = trade_details
+                continue
+            if position:
+                warnings.append(f"{symbol}: entry filled while the bot was down, managing it with the position's entry price {position.get('entryPrice')}.")
+                trade_details['status'] = "open"
+                trade_details['quantity'] = abs(float(position['positionAmt']))
+                trade_details['entry_price'] = float(position.get('entryPrice', trade_details['entry_price']))
+
+        if not position or float(position.get('positionAmt', 0)) == 0:
+            closed.append(symbol)
+            continue
+
+        position_qty = abs(float(position['positionAmt']))
+        if abs(position_qty - float(trade_details.get('quantity', 0))) > 1e-12:
+            warnings.append(f"{symbol}: journal quantity {trade_details.get('quantity')} differs from position size {position_qty}.")
+
+        if not any(o.get('orderId') == trade_details.get('sl_order_id') for o in orders):
+            stops = [o for o in orders if o.get('type') == 'STOP_MARKET']
+            if len(stops) == 1:
+                warnings.append(f"{symbol}: recorded SL {trade_details.get('sl_order_id')} not found, adopting open STOP_MARKET {stops[0]['orderId']} at {stops[0].get('stopPrice')}.")
+                trade_details['sl_order_id'] = stops[0]['orderId']
+                trade_details['current_sl_price'] = float(stops[0].get('stopPrice', trade_details.get('current_sl_price', 0.0)))
+                trade_details['stale_sl_order_ids'] = []
+            else:
+                warnings.append(f"{symbol}: recorded SL {trade_details.get('sl_order_id')} not found on the order book ({len(stops)} STOP_MARKET orders open). Check the stop manually.")
+        kept[symbol] = trade_details
+    return kept, closed, warnings
@@ -6,13 +6,198 @@ import time
 from binance.enums import * # For FUTURE_ORDER_TYPE_STOP_MARKET, SIDE_SELL, SIDE_BUY
 from binance.exceptions import BinanceAPIException
 import copy # For safely iterating over active_bot_trades
+import metrics
 
 logger = logging.getLogger(__name__)
 
-def manage_trailing_stops(futures_client, telegram_notifier, active_bot_trades, active_trades_lock=None):
+SL_UPDATES = metrics.counter('tsl_stop_updates_total', "Trailing stop replacements by strategy and result.", ('strategy', 'result'))
+UNPROTECTED_WINDOW = metrics.histogram('tsl_unprotected_window_seconds', "Time a position had no stop during a trailing stop replacement.", ('strategy',))
+
+def cancel_stale_stops(futures_client, symbol, trade_details):
+    # Retries cancelling replaced stops whose cancel failed earlier, so only one stop stays on the book.
+    # Returns the IDs that are still not cancelled.
+    for stale_id in list(trade_details.get('stale_sl_order_ids', [])):
+        try:
+            futures_client.cancel_stop_order(symbol, stale_id)
+            logger.info(f"Stale SL order {stale_id} for {symbol} cancelled.")
+        except BinanceAPIException as e:
+            if e.code != -2011: # -2011: already gone, nothing left to cancel
+                logger.error(f"Still unable to cancel stale SL order {stale_id} for {symbol}: {e}")
+                continue
+        trade_details['stale_sl_order_ids'].remove(stale_id)
+        futures_client.position_book.invalidate(positions=False)
+    return trade_details.get('stale_sl_order_ids', [])
+
+def _remove_trade(active_bot_trades, symbol, active_trades_lock=None, journal=None, futures_client=None):
+    # Returns the removed trade details, or None if another thread already removed it. With futures_client,
+    # stale stops are cancelled too: no later TSL cycle will retry them, and the oldest one is usually the
+    # initial SL, which is not reduce-only and would open a reverse position if it triggered.
+    if active_trades_lock:
+        with active_trades_lock:
+            trade_details = active_bot_trades.pop(symbol, None)
+    else:
+        trade_details = active_bot_trades.pop(symbol, None)
+    if trade_details and journal:
+        journal.record_close(symbol)
+    if trade_details and futures_client and trade_details.get('stale_sl_order_ids'):
+        remaining = cancel_stale_stops(futures_client, symbol, trade_details)
+        if remaining:
+            logger.error(f"Stale SL order(s) {remaining} for removed trade {symbol} could not be cancelled. Cancel them manually.")
+    return trade_details
+
+def close_managed_trade(telegram_notifier, active_bot_trades, symbol, exit_price, pnl, notes="", active_trades_lock=None, journal=None,
+                        futures_client=None):
+    # Removes a trade whose position is gone and sends the close notification exactly once,
+    # even if the polling TSL manager and the user-data stream detect the close at the same time.
+    trade_details = _remove_trade(active_bot_trades, symbol, active_trades_lock, journal, futures_client)
+    if not trade_details:
+        return False
+    if trade_details.get('stale_sl_order_ids'):
+        notes = f"{notes} Stale SL order(s) {trade_details['stale_sl_order_ids']} are still open, cancel them manually.".strip()
+    telegram_notifier.notify_trade_close(
+        symbol,
+        trade_details['signal_type'],
+        exit_price,
+        trade_details['entry_price'],
+        trade_details['quantity'],
+        pnl,
+        notes=notes
+    )
+    return True
+
+def _poll_position_price(futures_client, telegram_notifier, active_bot_trades, symbol, trade_details, active_trades_lock=None, journal=None):
+    # Polling mode: one position request per trade. Returns the mark price, or None if the position is closed.
+    position_info = futures_client.get_open_position_for_symbol(symbol)
+
+    if not position_info or float(position_info.get('positionAmt', 0)) == 0:
+        logger.info(f"Position for {symbol} (Entry: {trade_details['entry_price']}) appears closed on Binance. Removing from active_bot_trades.")
+
+        # Attempt to get the last known mark price for exit price if available
+        last_mark_price_str = position_info.get('markPrice', str(trade_details['entry_price'])) if position_info else str(trade_details['entry_price'])
+
+        try:
+            exit_price_estimate = float(last_mark_price_str)
+        except ValueError:
+            exit_price_estimate = trade_details['entry_price'] # Fallback to entry if markPrice is invalid
+
+        unrealized_pnl_str = position_info.get('unRealizedProfit', '0') if position_info else '0'
+        try:
+            closed_pnl_estimate = float(unrealized_pnl_str)
+        except ValueError:
+            closed_pnl_estimate = 0.0
+
+        close_managed_trade(telegram_notifier, active_bot_trades, symbol, exit_price_estimate, closed_pnl_estimate,
+                            notes="Position appears closed on Binance (detected by TSL manager).",
+                            active_trades_lock=active_trades_lock, journal=journal, futures_client=futures_client)
+        return None
+
+    current_price = float(position_info.get('markPrice', 0))
+    if current_price == 0:
+        logger.warning(f"Could not get current mark price for {symbol} to manage TSL.")
+        return None
+    return current_price
+
+def _replace_stop_place_first(futures_client, telegram_notifier, active_bot_trades, symbol, trade_details, adjusted_new_sl_price, active_trades_lock=None, journal=None):
+    # Places the new reduce-only stop first and only then cancels the old one by ID,
+    # so the position always has at least one stop on the book.
+    sl_order_id = trade_details['sl_order_id']
+    sl_side = SIDE_SELL if trade_details['signal_type'] == 'long' else SIDE_BUY
+    started_at = time.monotonic()
+    new_sl_order = futures_client.place_futures_order(
+        symbol, sl_side, trade_details['quantity'],
+        stop_price=adjusted_new_sl_price,
+        order_type=FUTURE_ORDER_TYPE_STOP_MARKET,
+        reduce_only=True
+    )
+    if not new_sl_order or 'orderId' not in new_sl_order:
+        logger.error(f"Failed to place new TSL order for {symbol} at {adjusted_new_sl_price}. Old SL {sl_order_id} is still active; will retry next cycle.")
+        SL_UPDATES.inc('place_then_cancel', 'place_failed')
+        return
+    placed_at = time.monotonic()
+    UNPROTECTED_WINDOW.observe(0.0, 'place_then_cancel')
+
+    trade_details['sl_order_id'] = new_sl_order['orderId']
+    trade_details['current_sl_price'] = adjusted_new_sl_price
+
+    try:
+        futures_client.cancel_stop_order(symbol, sl_order_id)
+        cancelled_at = time.monotonic()
+        SL_UPDATES.inc('place_then_cancel', 'ok')
+        logger.info(f"TSL for {symbol} replaced: new SL {new_sl_order['orderId']} at {adjusted_new_sl_price}, old SL {sl_order_id} cancelled. "
+                    f"Unprotected window: 0 ms (place {(placed_at - started_at) * 1000:.1f} ms, cancel {(cancelled_at - placed_at) * 1000:.1f} ms).")
+    except BinanceAPIException as cancel_e:
+        if cancel_e.code == -2011: # Old SL already filled or cancelled
+            futures_client.position_book.invalidate()
+            if not futures_client.get_open_position_for_symbol(symbol):
+                logger.info(f"Old SL {sl_order_id} for {symbol} was already filled and the position is closed. Cancelling new SL and removing from TSL management.")
+                try:
+                    futures_client.cancel_stop_order(symbol, new_sl_order['orderId'])
+                except BinanceAPIException as e:
+                    logger.warning(f"Could not cancel unused TSL order {new_sl_order['orderId']} for {symbol}: {e}")
+                _remove_trade(active_bot_trades, symbol, active_trades_lock, journal, futures_client)
+                SL_UPDATES.inc('place_then_cancel', 'position_closed')
+                return
+            SL_UPDATES.inc('place_then_cancel', 'ok')
+            logger.warning(f"Old SL {sl_order_id} for {symbol} was already gone but the position is open. Continuing with new SL {new_sl_order['orderId']}.")
+        else:
+            # The old (looser) stop stays live next to the new one until a later cycle manages to cancel it.
+            logger.error(f"Failed to cancel old SL order {sl_order_id} for {symbol} after placing new TSL: {cancel_e}")
+            trade_details.setdefault('stale_sl_order_ids', []).append(sl_order_id)
+            SL_UPDATES.inc('place_then_cancel', 'cancel_failed')
+            telegram_notifier.notify_error(f"TSL Warning: {symbol}", f"New SL placed at {adjusted_new_sl_price:.4f} but old SL {sl_order_id} could not be cancelled yet. Retrying next cycle.")
+
+    telegram_notifier.send_message(f"⚙️ Trailing SL Updated for {symbol}\nSymbol: {symbol}\nNew SL Price: {adjusted_new_sl_price:.4f}", coalesce_key="tsl_update")
+
+def _replace_stop_cancel_first(futures_client, telegram_notifier, active_bot_trades, symbol, trade_details, adjusted_new_sl_price, active_trades_lock=None, journal=None):
+    # Original strategy: cancel the old SL, then place the new one. The position has no stop in between.
+    sl_order_id = trade_details['sl_order_id']
+    signal_type = trade_details['signal_type']
+    logger.info(f"Cancelling old SL order ID {sl_order_id} for {symbol} to update TSL.")
+    cancel_sent_at = time.monotonic()
+    try:
+        cancel_success_details = futures_client.cancel_stop_order(symbol, sl_order_id)
+        logger.info(f"Old SL order {sl_order_id} for {symbol} cancelled successfully: {cancel_success_details}")
+
+        sl_side = SIDE_SELL if signal_type == 'long' else SIDE_BUY
+        new_sl_order_direct = futures_client.place_futures_order(
+            symbol, sl_side, trade_details['quantity'],
+            stop_price=adjusted_new_sl_price,
+            order_type=FUTURE_ORDER_TYPE_STOP_MARKET
+        )
+
+        if new_sl_order_direct and 'orderId' in new_sl_order_direct:
+            trade_details['sl_order_id'] = new_sl_order_direct['orderId']
+            trade_details['current_sl_price'] = adjusted_new_sl_price
+            # Upper bound: from sending the cancel until the new stop was acknowledged.
+            unprotected_ms = (time.monotonic() - cancel_sent_at) * 1000
+            SL_UPDATES.inc('cancel_then_place', 'ok')
+            UNPROTECTED_WINDOW.observe(unprotected_ms / 1000, 'cancel_then_place')
+            logger.info(f"New TSL order for {symbol} placed. ID: {new_sl_order_direct['orderId']}, Price: {adjusted_new_sl_price}. Unprotected window: {unprotected_ms:.1f} ms.")
+            telegram_notifier.send_message(f"⚙️ Trailing SL Updated for {symbol}\nSymbol: {symbol}\nNew SL Price: {adjusted_new_sl_price:.4f}", coalesce_key="tsl_update")
+        else:
+            logger.error(f"CRITICAL: Old SL for {symbol} cancelled but FAILED to place new TSL order at {adjusted_new_sl_price}. POSITION IS UNPROTECTED.")
+            SL_UPDATES.inc('cancel_then_place', 'place_failed')
+            telegram_notifier.notify_error(f"CRITICAL TSL Error: {symbol}", f"Old SL cancelled, new TSL FAILED. POS UNPROTECTED. Attempted SL: {adjusted_new_sl_price:.4f}. Manual intervention required!")
+            _remove_trade(active_bot_trades, symbol, active_trades_lock, journal, futures_client) # Remove from active management
+
+    except BinanceAPIException as cancel_e:
+        logger.error(f"Failed to cancel old SL order {sl_order_id} for {symbol} during TSL update: {cancel_e}")
+        SL_UPDATES.inc('cancel_then_place', 'position_closed' if cancel_e.code == -2011 else 'cancel_failed')
+        if cancel_e.code == -2011: # Order already filled or cancelled
+            logger.info(f"Old SL {sl_order_id} for {symbol} was already filled/cancelled. Removing from TSL management.")
+            _remove_trade(active_bot_trades, symbol, active_trades_lock, journal, futures_client)
+        # else, do not place new SL to avoid multiple SLs. Will retry next cycle.
+
+def manage_trailing_stops(futures_client, telegram_notifier, active_bot_trades, active_trades_lock=None, mark_prices=None, journal=None,
+                          symbols=None, checked_prices=None):
     # active_trades_lock is optional, for more complex scenarios.
     # Python dict operations are largely atomic, but for multi-step read-modify-write, a lock is safer.
     # For iterating and simple checks/deletions, copy.deepcopy or list(dict.items()) is often sufficient.
+    # mark_prices ({symbol: price}) is passed in event-driven mode: position closes and SL fills are then
+    # handled by the user-data stream, so no per-symbol position request is made here.
+    # journal (TradeJournal) receives the fields each cycle changed, so TSL state survives restarts.
+    # symbols limits the cycle to those trades (the adaptive TSL scheduler passes the ones due), and
+    # checked_prices ({symbol: price}) receives the price each checked trade was evaluated at.
 
     if not config.TRAILING_STOP or not futures_client:
         logger.debug("Trailing stop is disabled in config or futures_client not available.")
@@ -25,7 +210,7 @@ def manage_trailing_stops(futures_client, telegram_notifier, active_bot_trades,
     # active_trades_copy = copy.deepcopy(active_bot_trades) # Needs import copy; deepcopy might be overkill if objects are simple.
 
     # Iterate over a list of symbol keys to allow modification of the dict
-    for symbol in list(active_bot_trades.keys()):
+    for symbol in list(symbols if symbols is not None else active_bot_trades.keys()):
         if symbol not in active_bot_trades: # Check if trade was removed by another part of the logic or previous iteration
             continue
 
@@ -34,55 +219,28 @@ def manage_trailing_stops(futures_client, telegram_notifier, active_bot_trades,
         if trade_details.get('status') != "open":
             continue
 
+        journaled_details = copy.deepcopy(trade_details) if journal else None
         try:
             logger.debug(f"Managing TSL for {symbol}. Details: {trade_details}")
-            position_info = futures_client.get_open_position_for_symbol(symbol)
-
-            if not position_info or float(position_info.get('positionAmt', 0)) == 0:
-                logger.info(f"Position for {symbol} (Entry: {trade_details['entry_price']}) appears closed on Binance. Removing from active_bot_trades.")
-
-                # Attempt to get the last known mark price for exit price if available
-                last_mark_price_str = position_info.get('markPrice', str(trade_details['entry_price'])) if position_info else str(trade_details['entry_price'])
-
-                try:
-                    exit_price_estimate = float(last_mark_price_str)
-                except ValueError:
-                    exit_price_estimate = trade_details['entry_price'] # Fallback to entry if markPrice is invalid
-
-                unrealized_pnl_str = position_info.get('unRealizedProfit', '0') if position_info else '0'
-                try:
-                    closed_pnl_estimate = float(unrealized_pnl_str)
-                except ValueError:
-                    closed_pnl_estimate = 0.0
-
-
-                telegram_notifier.notify_trade_close(
-                    symbol,
-                    trade_details['signal_type'],
-                    exit_price_estimate,
-                    trade_details['entry_price'],
-                    trade_details['quantity'],
-                    closed_pnl_estimate,
-                    notes="Position appears closed on Binance (detected by TSL manager)."
-                )
-                # Safely delete the key
-                if active_trades_lock:
-                    with active_trades_lock:
-                        if symbol in active_bot_trades: del active_bot_trades[symbol]
-                else:
-                    if symbol in active_bot_trades: del active_bot_trades[symbol]
-                continue
-
-            current_price = float(position_info.get('markPrice', 0))
-            if current_price == 0:
-                logger.warning(f"Could not get current mark price for {symbol} to manage TSL.")
-                continue
+            if mark_prices is not None:
+                current_price = float(mark_prices.get(symbol, 0))
+                if current_price == 0:
+                    logger.warning(f"No mark price available for {symbol} to manage TSL.")
+                    continue
+            else:
+                current_price = _poll_position_price(futures_client, telegram_notifier, active_bot_trades, symbol, trade_details, active_trades_lock, journal)
+                if current_price is None:
+                    continue
+            if checked_prices is not None:
+                checked_prices[symbol] = current_price
 
             entry_price = trade_details['entry_price']
             signal_type = trade_details['signal_type']
             # Ensure these keys exist, provide defaults if not for safety
             current_sl_price = trade_details.get('current_sl_price', 0.0)
             sl_order_id = trade_details.get('sl_order_id')
+            if trade_details.get('stale_sl_order_ids'):
+                cancel_stale_stops(futures_client, symbol, trade_details)
 
             pnl_ratio = 0
             if entry_price > 0: # Avoid division by zero
@@ -133,16 +291,16 @@ def manage_trailing_stops(futures_client, telegram_notifier, active_bot_trades,
                 if new_potential_sl_price is not None and sl_order_id:
                     logger.info(f"Attempting to update SL for {symbol}. Old SL: {current_sl_price}, New Potential SL: {new_potential_sl_price}")
 
-                    symbol_info_sl = futures_client.get_symbol_info(symbol)
-                    tick_size_sl = "1e-8" # Default to very small if not found
-                    if symbol_info_sl:
-                        price_filter = next((f for f in symbol_info_sl['filters'] if f['filterType'] == 'PRICE_FILTER'), None)
-                        if price_filter: tick_size_sl = price_filter['tickSize']
-
-                    adjusted_new_sl_price = float(futures_client._adjust_price_to_tick(new_potential_sl_price, tick_size_sl))
+                    spec_sl = futures_client.get_symbol_spec(symbol)
+                    if spec_sl and spec_sl.tick_size:
+                        tick_size_sl = spec_sl.tick_size
+                        adjusted_new_sl_price = spec_sl.floor_price(new_potential_sl_price)
+                    else:
+                        tick_size_sl = 1e-8 # Default to very small if not found
+                        adjusted_new_sl_price = float(futures_client._adjust_price_to_tick(new_potential_sl_price, "1e-8"))
                     logger.info(f"New SL for {symbol} adjusted to tick size {tick_size_sl}: {adjusted_new_sl_price}")
 
-                    if abs(adjusted_new_sl_price - current_sl_price) < float(tick_size_sl):
+                    if abs(adjusted_new_sl_price - current_sl_price) < tick_size_sl:
                         logger.debug(f"New SL {adjusted_new_sl_price} for {symbol} is not significantly different from current SL {current_sl_price} (tick: {tick_size_sl}). Skipping update.")
                         continue
 
@@ -155,52 +313,21 @@ def manage_trailing_stops(futures_client, telegram_notifier, active_bot_trades,
                         continue
 
 
-                    logger.info(f"Cancelling old SL order ID {sl_order_id} for {symbol} to update TSL.")
-                    try:
-                        cancel_success_details = futures_client.client.futures_cancel_order(symbol=symbol, orderId=sl_order_id, timestamp=futures_client._get_timestamp())
-                        logger.info(f"Old SL order {sl_order_id} for {symbol} cancelled successfully: {cancel_success_details}")
-
-                        sl_side = SIDE_SELL if signal_type == 'long' else SIDE_BUY
-                        new_sl_order_direct = futures_client.place_futures_order(
-                            symbol, sl_side, trade_details['quantity'],
-                            stop_price=adjusted_new_sl_price,
-                            order_type=FUTURE_ORDER_TYPE_STOP_MARKET
-                        )
-
-                        if new_sl_order_direct and 'orderId' in new_sl_order_direct:
-                            trade_details['sl_order_id'] = new_sl_order_direct['orderId']
-                            trade_details['current_sl_price'] = adjusted_new_sl_price
-                            logger.info(f"New TSL order for {symbol} placed. ID: {new_sl_order_direct['orderId']}, Price: {adjusted_new_sl_price}")
-                            telegram_notifier.send_message(f"⚙️ Trailing SL Updated for {symbol}\nSymbol: {symbol}\nNew SL Price: {adjusted_new_sl_price:.4f}")
-                        else:
-                            logger.error(f"CRITICAL: Old SL for {symbol} cancelled but FAILED to place new TSL order at {adjusted_new_sl_price}. POSITION IS UNPROTECTED.")
-                            telegram_notifier.notify_error(f"CRITICAL TSL Error: {symbol}", f"Old SL cancelled, new TSL FAILED. POS UNPROTECTED. Attempted SL: {adjusted_new_sl_price:.4f}. Manual intervention required!")
-                            if symbol in active_bot_trades: # Remove from active management
-                                if active_trades_lock:
-                                    with active_trades_lock: del active_bot_trades[symbol]
-                                else:
-                                    del active_bot_trades[symbol]
-
-                    except BinanceAPIException as cancel_e:
-                        logger.error(f"Failed to cancel old SL order {sl_order_id} for {symbol} during TSL update: {cancel_e}")
-                        if cancel_e.code == -2011: # Order already filled or cancelled
-                             logger.info(f"Old SL {sl_order_id} for {symbol} was already filled/cancelled. Removing from TSL management.")
-                             if symbol in active_bot_trades:
-                                 if active_trades_lock:
-                                     with active_trades_lock: del active_bot_trades[symbol]
-                                 else:
-                                     del active_bot_trades[symbol]
-                        # else, do not place new SL to avoid multiple SLs. Will retry next cycle.
+                    if getattr(config, 'TSL_REPLACE_STRATEGY', 'place_then_cancel') == 'cancel_then_place':
+                        _replace_stop_cancel_first(futures_client, telegram_notifier, active_bot_trades, symbol, trade_details, adjusted_new_sl_price, active_trades_lock, journal)
+                    else:
+                        _replace_stop_place_first(futures_client, telegram_notifier, active_bot_trades, symbol, trade_details, adjusted_new_sl_price, active_trades_lock, journal)
 
         except BinanceAPIException as e:
             logger.error(f"Binance API Error managing TSL for {symbol}: {e}", exc_info=False) # Set exc_info=False for less verbose logs for common API errors
             if e.code == -2011 and trade_details.get('sl_order_id'): # Unknown order sent. (e.g. SL already cancelled / filled)
                 logger.warning(f"SL Order for {symbol} (ID: {trade_details['sl_order_id']}) likely filled or already cancelled. Removing from TSL management.")
-                if symbol in active_bot_trades:
-                    if active_trades_lock:
-                        with active_trades_lock: del active_bot_trades[symbol]
-                    else:
-                        del active_bot_trades[symbol]
+                _remove_trade(active_bot_trades, symbol, active_trades_lock, journal, futures_client)
             # Consider more specific error handling or less frequent notifications for non-critical API errors here
         except Exception as e:
             logger.error(f"Generic Error managing TSL for {symbol}: {e}", exc_info=True)
+        finally:
+            if journal and symbol in active_bot_trades:
+                changed_fields = {k: v for k, v in trade_details.items() if journaled_details.get(k) != v}
+                if changed_fields:
+                    journal.record_update(symbol, changed_fields)
@@ -0,0 +1,128 @@
+# tsl_scheduler.py
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+VOLATILITY_EWMA_ALPHA = 0.1 # Weight of the newest squared return in the per-trade volatility estimate
+
+def boundary_distance(trade_details, price, trailing_stop_positive, trailing_stop_positive_offset, activation=True):
+    # Relative price move (>= 0) after which the next TSL check would do something: reach the stop,
+    # activate trailing, or (when trailing) make a new extreme that moves the stop.
+    entry_price = trade_details['entry_price']
+    sl_price = trade_details.get('current_sl_price', 0.0)
+    is_long = trade_details.get('signal_type') == 'long'
+    distances = []
+    if sl_price > 0:
+        distances.append(abs(price - sl_price) / price)
+    if not trade_details.get('trailing_active', False):
+        if activation and entry_price > 0:
+            pnl_ratio = (price - entry_price) / entry_price if is_long else (entry_price - price) / entry_price
+            distances.append(max(trailing_stop_positive_offset - pnl_ratio, 0.0))
+    elif is_long:
+        # The stop moves once highest * (1 - positive) clears both the current stop and the entry.
+        level = max(sl_price, entry_price) / (1 - trailing_stop_positive)
+        distances.append(max(level - price, 0.0) / price)
+    else:
+        level = min(sl_price, entry_price) / (1 + trailing_stop_positive) if sl_price > 0 else entry_price / (1 + trailing_stop_positive)
+        distances.append(max(price - level, 0.0) / price)
+    return min(distances) if distances else 0.0
+
+# Decides when each open trade gets its next TSL check, instead of checking all of them every cycle.
+# A trade's interval is the time its price would typically need to cover the distance to its nearest
+# decision boundary: (distance / (z_score * volatility))^2 for volatility per sqrt(second), estimated
+# from the prices seen at its own checks. Intervals are clamped to [min_interval, max_interval] and
+# stretched evenly when the trades together would need more than checks_per_minute checks.
+class TSLScheduler:
+    def __init__(self, min_interval=1.0, max_interval=60.0, checks_per_minute=60, z_score=3.0,
+                 trailing_stop_positive=0.01, trailing_stop_positive_offset=0.02, activation=True):
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.checks_per_minute = checks_per_minute
+        self.z_score = z_score
+        self.trailing_stop_positive = trailing_stop_positive
+        self.trailing_stop_positive_offset = trailing_stop_positive_offset
+        self.activation = activation # TRAILING_ONLY_OFFSET_IS_REACHED
+        self._heap = [] # (due monotonic time, sequence, symbol); stale entries are skipped when popped
+        self._due_at = {} # symbol -> due time of its live heap entry
+        self._intervals = {} # symbol -> interval before budget scaling
+        self._volatility = {} # symbol -> (last price, last check time, variance per second or None)
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self.checks = 0
+
+    def _push(self, symbol, due):
+        self._due_at[symbol] = due
+        heapq.heappush(self._heap, (due, next(self._sequence), symbol))
+
+    def sync(self, active_trades, now=None):
+        # Schedules newly opened trades for an immediate check and forgets closed ones.
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            open_symbols = {s for s, t in list(active_trades.items()) if t.get('status') == "open"}
+            for symbol in open_symbols - self._due_at.keys():
+                self._push(symbol, now)
+            for symbol in self._due_at.keys() - open_symbols:
+                del self._due_at[symbol]
+                self._intervals.pop(symbol, None)
+                self._volatility.pop(symbol, None)
+
+    def pop_due(self, now=None):
+        # Symbols whose check is due; they stay unscheduled until reschedule() is called for them.
+        now = time.monotonic() if now is None else now
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due_at, _, symbol = heapq.heappop(self._heap)
+                if self._due_at.get(symbol) == due_at:
+                    self._due_at[symbol] = None
+                    due.append(symbol)
+        self.checks += len(due)
+        return due
+
+    def _budget_scale(self):
+        demand = sum(60.0 / interval for interval in self._intervals.values())
+        return max(1.0, demand / self.checks_per_minute) if self.checks_per_minute else 1.0
+
+    def reschedule(self, symbol, trade_details, price, now=None):
+        # Sets the next check of a just-checked trade from the price it was evaluated at (None if the
+        # check got no price: retried after its previous interval). Returns the interval in seconds.
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if symbol not in self._due_at:
+                return None # Closed since it was popped
+            interval = self._intervals.get(symbol, self.min_interval)
+            if price:
+                last_price, last_time, variance = self._volatility.get(symbol, (None, None, None))
+                if last_price and now > last_time:
+                    sample = math.log(price / last_price) ** 2 / (now - last_time)
+                    variance = sample if variance is None else (1 - VOLATILITY_EWMA_ALPHA) * variance + VOLATILITY_EWMA_ALPHA * sample
+                self._volatility[symbol] = (price, now, variance)
+                distance = boundary_distance(trade_details, price, self.trailing_stop_positive,
+                                             self.trailing_stop_positive_offset, self.activation)
+                if variance is None:
+                    interval = self.min_interval # No estimate yet: sample again soon
+                elif variance == 0:
+                    interval = self.max_interval
+                else:
+                    interval = (distance / (self.z_score * math.sqrt(variance))) ** 2
+                interval = min(max(interval, self.min_interval), self.max_interval)
+            self._intervals[symbol] = interval
+            interval *= self._budget_scale()
+            self._push(symbol, now + interval)
+            return interval
+
+    def seconds_until_next(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            live = [due for due in self._due_at.values() if due is not None]
+        return max(min(live) - now, 0.0) if live else None
+
+    def stats(self):
+        with self._lock:
+            return {'scheduled': len(self._due_at), 'checks': self.checks, 'budget_scale': round(self._budget_scale(), 3),
+                    'intervals': {symbol: round(interval, 2) for symbol, interval in self._intervals.items()}}
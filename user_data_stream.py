@@ -0,0 +1,155 @@
+# user_data_stream.py
+import logging
+import threading
+from binance import ThreadedWebsocketManager
+from trailing_stop_manager import close_managed_trade
+
+logger = logging.getLogger(__name__)
+
+# Listens to the Binance Futures user-data stream (listen key) and reacts to pushed
+# ACCOUNT_UPDATE / ORDER_TRADE_UPDATE / ALGO_UPDATE events, so closed positions and filled stop-losses
+# are removed from active_bot_trades immediately instead of being discovered by REST polling.
+# Stop-losses are algo orders (sl_order_id is the algoId): a triggered stop is reported by ALGO_UPDATE
+# with the orderId ('ai') of the MARKET order it was sent on as, and that order's fill closes the trade.
+class UserDataStream:
+    def __init__(self, futures_client, telegram_notifier, active_bot_trades, active_trades_lock=None, journal=None, order_tracker=None):
+        self.futures_client = futures_client
+        self.telegram_notifier = telegram_notifier
+        self.active_bot_trades = active_bot_trades
+        self.active_trades_lock = active_trades_lock
+        self.journal = journal
+        self.order_tracker = order_tracker
+        self.twm = None
+        self.socket_name = None
+        self.last_fills = {} # symbol -> {'price': float, 'realized_pnl': float} from the latest TRADE executions
+        self.triggered_stops = {} # symbol -> (algoId, orderId it was sent on as or None) of triggered stop-losses
+        self.needs_reconcile = threading.Event()
+
+    def start(self):
+        api_key = self.futures_client.client.API_KEY
+        api_secret = self.futures_client.client.API_SECRET
+        self.twm = ThreadedWebsocketManager(api_key=api_key, api_secret=api_secret)
+        self.twm.daemon = True
+        self.twm.start()
+        # The websocket manager creates and keeps the listen key alive by itself.
+        self.socket_name = self.twm.start_futures_user_socket(callback=self._handle_message)
+        logger.info(f"User-data stream started ({self.socket_name}).")
+        # Anything that happened before the stream was connected is picked up by one bulk snapshot.
+        self.needs_reconcile.set()
+
+    def stop(self):
+        if self.twm:
+            self.twm.stop()
+            self.twm = None
+            logger.info("User-data stream stopped.")
+
+    def reconcile_if_needed(self):
+        if self.needs_reconcile.is_set():
+            self.needs_reconcile.clear()
+            self.reconcile()
+
+    def reconcile(self):
+        # One bulk positions call for all symbols, used after (re)connects where events may have been missed.
+        try:
+            self.futures_client.position_book.invalidate()
+            open_symbols = self.futures_client.position_book.open_positions()
+        except Exception as e:
+            logger.error(f"User-data stream reconcile failed: {e}")
+            self.needs_reconcile.set() # Retry on the next cycle
+            return
+
+        for symbol in list(self.active_bot_trades.keys()):
+            trade_details = self.active_bot_trades.get(symbol)
+            if not trade_details or trade_details.get('status') != "open" or symbol in open_symbols:
+                continue
+            logger.info(f"Reconcile: position for {symbol} is no longer open on Binance.")
+            self._close_trade(symbol, trade_details, notes="Position closed while the user-data stream was disconnected (detected on reconcile).")
+
+    def _handle_message(self, msg):
+        event_type = msg.get('e')
+        try:
+            if event_type == 'ACCOUNT_UPDATE':
+                self._on_account_update(msg)
+            elif event_type == 'ORDER_TRADE_UPDATE':
+                self._on_order_update(msg)
+            elif event_type == 'ALGO_UPDATE':
+                self._on_algo_update(msg)
+            elif event_type == 'listenKeyExpired':
+                logger.warning("User-data stream listen key expired. Scheduling reconcile.")
+                self.needs_reconcile.set()
+            elif event_type == 'error':
+                logger.error(f"User-data stream error: {msg.get('type')} - {msg.get('m')}. Scheduling reconcile.")
+                self.needs_reconcile.set()
+        except Exception as e:
+            logger.error(f"Error handling user-data event {event_type}: {e} - Event: {msg}", exc_info=True)
+
+    def _on_account_update(self, msg):
+        for position in msg.get('a', {}).get('P', []):
+            symbol = position.get('s')
+            trade_details = self.active_bot_trades.get(symbol)
+            if not trade_details or trade_details.get('status') != "open":
+                continue
+            if position.get('ps', 'BOTH') != 'BOTH':
+                continue # Bot trades in one-way mode only
+            if float(position.get('pa', 0)) == 0:
+                triggered, stop_fill_order_id = self._triggered_stop(symbol, trade_details)
+                if stop_fill_order_id:
+                    continue # The stop's own fill event follows with the exit price and closes the trade
+                logger.info(f"ACCOUNT_UPDATE: position for {symbol} is now flat. Removing from active_bot_trades.")
+                notes = self._stop_loss_notes(trade_details) if triggered else "Position closed on Binance (user-data stream)."
+                self._close_trade(symbol, trade_details, notes=notes)
+
+    def _on_order_update(self, msg):
+        order = msg.get('o', {})
+        symbol = order.get('s')
+        if self.order_tracker:
+            self.order_tracker.on_order_update(order)
+        trade_details = self.active_bot_trades.get(symbol)
+        if not trade_details:
+            return
+
+        if order.get('x') == 'TRADE':
+            fill = self.last_fills.setdefault(symbol, {'price': 0.0, 'realized_pnl': 0.0})
+            fill['price'] = float(order.get('L', 0))
+            fill['realized_pnl'] += float(order.get('rp', 0))
+
+        stop_order_ids = (trade_details.get('sl_order_id'), self._triggered_stop(symbol, trade_details)[1])
+        if order.get('i') in stop_order_ids and order.get('i') is not None and order.get('X') == 'FILLED':
+            exit_price = float(order.get('ap', 0)) or trade_details['entry_price']
+            logger.info(f"ORDER_TRADE_UPDATE: stop-loss {trade_details.get('sl_order_id')} for {symbol} FILLED at {exit_price} (order {order.get('i')}).")
+            self._close_trade(symbol, trade_details, notes=self._stop_loss_notes(trade_details))
+
+    def _on_algo_update(self, msg):
+        algo_order = msg.get('o', {})
+        symbol = algo_order.get('s')
+        trade_details = self.active_bot_trades.get(symbol)
+        if not trade_details or algo_order.get('aid') != trade_details.get('sl_order_id'):
+            return # Not the current stop of a managed trade (e.g. a replaced stop being cancelled)
+        if algo_order.get('X') in ('TRIGGERING', 'TRIGGERED', 'FINISHED'):
+            triggered, stop_fill_order_id = self._triggered_stop(symbol, trade_details)
+            if not triggered:
+                logger.info(f"ALGO_UPDATE: stop-loss {algo_order.get('aid')} for {symbol} triggered at {algo_order.get('tp')}.")
+            actual_order_id = int(algo_order['ai']) if algo_order.get('ai') else stop_fill_order_id
+            self.triggered_stops[symbol] = (algo_order.get('aid'), actual_order_id)
+
+    def _triggered_stop(self, symbol, trade_details):
+        # (whether the trade's current stop has triggered, orderId of the order it was sent on as or None).
+        algo_id, order_id = self.triggered_stops.get(symbol, (None, None))
+        if algo_id is None or algo_id != trade_details.get('sl_order_id'):
+            return False, None
+        return True, order_id
+
+    @staticmethod
+    def _stop_loss_notes(trade_details):
+        return f"Stop-loss order {trade_details.get('sl_order_id')} filled (user-data stream)."
+
+    def _close_trade(self, symbol, trade_details, notes):
+        self.triggered_stops.pop(symbol, None)
+        fill = self.last_fills.pop(symbol, None)
+        if fill and fill['price'] > 0:
+            exit_price, pnl = fill['price'], fill['realized_pnl']
+        else:
+            exit_price, pnl = trade_details['entry_price'], 0.0 # Same fallback the polling TSL manager uses
+        close_managed_trade(self.telegram_notifier, self.active_bot_trades, symbol, exit_price, pnl,
+                            notes=notes, active_trades_lock=self.active_trades_lock, journal=self.journal,
+                            futures_client=self.futures_client)
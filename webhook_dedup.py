@@ -0,0 +1,90 @@
+# webhook_dedup.py
+import collections
+import hashlib
+import json
+import threading
+import time
+import metrics
+
+# Idempotency cache in front of /webhook. TradingView re-sends an alert when our answer is slow, and
+# several alert rules can fire for the same bar; without this each copy runs the signal's REST calls
+# before the active trade check rejects it. A signal is identified by (ticker, signal_type, interval,
+# bar time, payload hash): the bar time is taken from the alert's `time` / `bar_time` field
+# (TradingView's {{time}}) or, when the alert has none, from the wall clock rounded down to the
+# interval. Entries live for ttl_seconds in an LRU bounded to max_entries.
+BAR_TIME_FIELDS = ('bar_time', 'time')
+INTERVAL_UNITS = {'S': 1, 'D': 86400, 'W': 7 * 86400, 'M': 30 * 86400}
+
+LOOKUPS = metrics.counter('webhook_dedup_lookups_total', "Validated webhook alerts checked against the dedup cache, by result (hit = duplicate).", ('result',))
+
+def interval_seconds(interval):
+    # TradingView interval strings: "15" (minutes), "240", "30S", "D", "1D", "W", "M". None if unknown.
+    interval = str(interval).strip().upper()
+    if interval.isdigit():
+        return int(interval) * 60
+    unit = INTERVAL_UNITS.get(interval[-1:])
+    count = interval[:-1] or '1'
+    if unit is None or not count.isdigit():
+        return None
+    return int(count) * unit
+
+class WebhookDedup:
+    def __init__(self, ttl_seconds=600, max_entries=10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict() # key -> (expires_at, first trace ID); oldest first
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evicted': 0, 'expired': 0}
+
+    def key(self, data):
+        bar_time = next((data[field] for field in BAR_TIME_FIELDS if data.get(field)), None)
+        if bar_time is None:
+            period = interval_seconds(data.get('interval'))
+            bar_time = int(time.time() // period * period) if period else None
+        payload = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+        payload_hash = hashlib.blake2b(payload.encode(), digest_size=8).hexdigest()
+        return (data.get('ticker'), data.get('signal_type'), str(data.get('interval')), str(bar_time), payload_hash)
+
+    def claim(self, key, trace_id=None):
+        # Records the signal and returns None the first time a key is seen, or the trace ID of the first
+        # copy for a duplicate (a string, possibly empty).
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    LOOKUPS.inc('hit')
+                    return entry[1] or ""
+                del self._entries[key]
+                self._stats['expired'] += 1
+            self._stats['misses'] += 1
+            LOOKUPS.inc('miss')
+            self._entries[key] = (now + self.ttl_seconds, trace_id)
+            self._evict(now)
+        return None
+
+    def forget(self, key):
+        # For a claimed signal that was not accepted after all (e.g. queue full), so a retry can run.
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _evict(self, now):
+        # Called with the lock held. Expired entries at the old end first, then the least recently used.
+        while self._entries:
+            oldest_key, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at <= now:
+                self._stats['expired'] += 1
+            elif len(self._entries) > self.max_entries:
+                self._stats['evicted'] += 1
+            else:
+                break
+            del self._entries[oldest_key]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, size=len(self._entries))
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats